@@ -51,6 +51,8 @@ app.on('ready', () => {
             pythonProcess.stdin.write(JSON.stringify(data));
             pythonProcess.stdin.end();
 
+            // The schedule is UTF-8 with non-ASCII kept as is; decode across chunk boundaries
+            pythonProcess.stdout.setEncoding('utf8');
             pythonProcess.stdout.on('data', (chunk) => {
                 outputData += chunk.toString();
             });
@@ -1,12 +1,18 @@
 
+import sys
 import json
 import uuid
 import random
+import argparse
+
+# Seeded so the same --seed yields the same ids
+rng = random.Random(0)
 
 def create_id():
-    return str(uuid.uuid4())
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
 
-def generate_data():
+def generate_data(seed=0):
+    rng.seed(seed)
     subjects = []
     teachers = []
     batches = []
@@ -155,17 +161,22 @@ def generate_data():
         "schedule": [] # Start empty
     }
     
-    with open('data.json', 'w') as f:
-        json.dump(final_data, f, indent=2)
-    
-    print(f"Generated {len(subjects)} Subjects")
-    print(f"Generated {len(teachers)} Teachers")
-    print(f"Generated {len(batches)} Batches")
-    print(f"Generated {len(classrooms)} Classrooms")
+    sys.stderr.write(f"Generated {len(subjects)} Subjects\n")
+    sys.stderr.write(f"Generated {len(teachers)} Teachers\n")
+    sys.stderr.write(f"Generated {len(batches)} Batches\n")
+    sys.stderr.write(f"Generated {len(classrooms)} Classrooms\n")
+    return final_data
 
 if __name__ == "__main__":
-    try:
-        generate_data()
-        print("Data generation complete.")
-    except Exception as e:
-        print(f"Error: {e}")
+    parser = argparse.ArgumentParser(description="Generate the BCA sample dataset.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', '-o', default='-', help="File to write; default stdout.")
+    args = parser.parse_args()
+
+    data = generate_data(args.seed)
+    if args.output == '-':
+        json.dump(data, sys.stdout, indent=2)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=2)
+    sys.stderr.write("Data generation complete.\n")
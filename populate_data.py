@@ -1,13 +1,19 @@
 
-import json
+import os
+import sys
 import uuid
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from data_store import open_store
+
 def create_id():
     return str(uuid.uuid4())
 
 try:
-    with open('data.json', 'r') as f:
-        data = json.load(f)
+    # Whichever store the app reads: data.db, or data.json without node:sqlite
+    store = open_store()
+    data = store.load()
+    added_subjects = []
 
     # 1. Ensure Subjects Exist
     # We'll use: BCA-4001, BCA-4004, BCA-5005, OLT5000P
@@ -26,6 +32,7 @@ try:
             ns['id'] = create_id()
             ns['requiredBatches'] = []
             data['subjects'].append(ns)
+            added_subjects.append(ns)
             existing_codes[ns['code']] = ns
 
     # 2. Update Batches
@@ -69,9 +76,10 @@ try:
     data['teachers'].append(super_teacher)
     print("Added 'Demo Super Teacher' qualified for all subjects.")
 
-    with open('data.json', 'w') as f:
-        json.dump(data, f, indent=2)
-        
+    # Only the rows touched above are written, in one transaction
+    store.upsert_all({'subjects': added_subjects, 'batches': [batch], 'teachers': [super_teacher]})
+    store.close()
+
     print("Data populated successfully.")
 
 except Exception as e:
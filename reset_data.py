@@ -1,7 +1,11 @@
 
-import json
+import os
+import sys
 import uuid
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from data_store import open_store
+
 def create_id():
     return str(uuid.uuid4())
 
@@ -57,8 +61,9 @@ data = {
 }
 
 try:
-    with open('data.json', 'w') as f:
-        json.dump(data, f, indent=2)
+    # seed=None: an empty store must not import data.json before being reset
+    with open_store(seed=None) as store:
+        store.import_data(data)
     print("Data reset successfully.")
 except Exception as e:
     print(e)
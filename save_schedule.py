@@ -1,6 +1,11 @@
 
+import os
+import sys
 import json
-import re
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from data_store import open_store
+from serialization import read_schedule
 
 try:
     # Read the debug output, trying utf-16 then utf-8
@@ -12,34 +17,34 @@ try:
         with open('schedule_debug_output.txt', 'r', encoding='utf-8') as f:
             content = f.read()
 
-    # Look for the JSON list. It should start with [ and end with ]
-    # The debug logs might be before or after.
-    # We'll try to find the last valid JSON array in the output.
-    
-    # Simple heuristic: find the index of '[' and matching ']'
-    start_idx = content.find('[')
-    end_idx = content.rfind(']')
-    
-    if start_idx != -1 and end_idx != -1:
-        json_str = content[start_idx:end_idx+1]
+    # The scheduler's stdout is JSON lines (one array, one entry per line, or
+    # --stream messages); the debug log lines around them are not JSON
+    json_lines = []
+    for line in content.splitlines():
+        line = line.strip()
+        if not line.startswith(('[', '{')):
+            continue
         try:
-            schedule = json.loads(json_str)
-            print(f"Found schedule with {len(schedule)} entries.")
-            
-            # Load data.json
-            with open('data.json', 'r') as f:
-                data = json.load(f)
-            
-            data['schedule'] = schedule
-            
-            with open('data.json', 'w') as f:
-                json.dump(data, f, indent=2)
-                
-            print("Successfully saved schedule to data.json")
+            json.loads(line)
         except json.JSONDecodeError:
-            print("Failed to parse JSON from output.")
+            continue
+        json_lines.append(line)
+
+    if json_lines:
+        schedule = read_schedule('\n'.join(json_lines))
+        print(f"Found schedule with {len(schedule)} entries.")
+
+        # Only the entries that changed are written, as a new journal revision
+        # (data.json has no journal: it is rewritten when the app uses it)
+        with open_store() as store:
+            diff = store.save_schedule(schedule)
+            revision = store.schedule_revision()
+
+        saved = f"to {store.path}" if revision is None else f"revision {revision} to {store.path}"
+        print(f"Saved schedule {saved}: {len(diff.inserted)} inserted, "
+              f"{len(diff.removed)} removed, {len(diff.moved)} moved.")
     else:
-        print("No JSON array found in output.")
+        print("No JSON schedule found in output.")
 
 except Exception as e:
     print(f"Error: {e}")
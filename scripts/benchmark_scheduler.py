@@ -0,0 +1,1275 @@
+import os
+import sys
+import csv
+import json
+import hashlib
+import time
+import random
+import argparse
+import copy
+import resource
+import itertools
+import tempfile
+import multiprocessing
+import concurrent.futures
+from ortools.sat.python import cp_model
+
+from scheduler import (
+    DEFAULT_CONFIG, DEFAULT_PENALTY_WEIGHTS, DEFAULT_SOLVER_PROFILE, ENGINES, GREEDY_ENGINE, SOFT_LOCAL_SEARCH,
+    LocalSearch, fill_vacant_slots, InfeasibleInput, generate_requests, greedy_schedule, match_previous_schedule, previous_teachers, run_solver,
+    sharing_components, solve_schedule,
+)
+import generate_sample_data
+import serialization
+from data_store import DataStore
+from schedule_diff import diff_schedules
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Frozen outputs the regression checks compare against (see benchmark_requests)
+REQUESTS_FIXTURE = os.path.join(REPO_ROOT, 'scripts', 'fixtures', 'expected_requests.json')
+DEFAULT_DATASETS = [
+    os.path.join(REPO_ROOT, 'data.json'),
+    os.path.join(REPO_ROOT, 'scripts', 'sample_input.json'),
+]
+
+
+def load_dataset(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def generated_dataset(seed=0):
+    """The robust sample dataset from generate_sample_data.py, made reproducible."""
+    random.seed(seed)
+    return generate_sample_data.generate_robust_data()
+
+
+def scale_dataset(data, factor, rooms=False, departments=False):
+    """Replicate batches and teachers (and with rooms=True, classrooms) `factor` times.
+
+    By default rooms and the slot grid stay fixed, so model size grows
+    linearly with `factor` and the build cost of each constraint family
+    shows up clearly. With departments=True every copy also gets its own
+    department and subjects, so copies share no teacher: the shape of an
+    institution made of independent departments.
+    """
+    if factor == 1:
+        return data
+
+    def copy_id(entity_id, k):
+        return entity_id if k == 0 else f"{entity_id}~{k}"
+
+    scaled = dict(data)
+    if departments:
+        def own(k, entity, *fields):
+            copied = dict(entity, id=copy_id(entity['id'], k))
+            if entity.get('department'):
+                copied['department'] = copy_id(entity['department'], k)
+            for field in fields:
+                copied[field] = [copy_id(s_id, k) for s_id in entity.get(field) or []]
+            return copied
+
+        # A batch without requiredSubjects takes every subject: only its own copy's
+        all_subjects = [s['id'] for s in data.get('subjects', [])]
+        scaled['batches'] = [dict(own(k, dict(b, requiredSubjects=b.get('requiredSubjects') or all_subjects),
+                                      'requiredSubjects'), name=f"{b['name']} #{k}")
+                             for k in range(factor) for b in data.get('batches', [])]
+        scaled['teachers'] = [own(k, t, 'qualifiedSubjects') for k in range(factor) for t in data.get('teachers', [])]
+        scaled['subjects'] = [
+            dict(s, id=copy_id(s['id'], k),
+                 **({'requiredBatches': [copy_id(b_id, k) for b_id in s['requiredBatches']]}
+                    if s.get('requiredBatches') else {}))
+            for k in range(factor) for s in data.get('subjects', [])
+        ]
+        if rooms:
+            scaled['classrooms'] = [dict(r, id=copy_id(r['id'], k))
+                                    for k in range(factor) for r in data.get('classrooms', [])]
+        return scaled
+
+    scaled['batches'] = [
+        dict(b, id=copy_id(b['id'], k), name=f"{b['name']} #{k}")
+        for k in range(factor) for b in data.get('batches', [])
+    ]
+    scaled['teachers'] = [
+        dict(t, id=copy_id(t['id'], k))
+        for k in range(factor) for t in data.get('teachers', [])
+    ]
+    if rooms:
+        scaled['classrooms'] = [
+            dict(r, id=copy_id(r['id'], k))
+            for k in range(factor) for r in data.get('classrooms', [])
+        ]
+    scaled['subjects'] = [
+        dict(s, requiredBatches=[copy_id(b_id, k) for k in range(factor) for b_id in s['requiredBatches']])
+        if s.get('requiredBatches') else s
+        for s in data.get('subjects', [])
+    ]
+    return scaled
+
+
+def build_engine(data, engine):
+    """Generate requests and build (but do not solve) one engine's model."""
+    config = data.get('config', DEFAULT_CONFIG)
+    batch_map = {b['id']: b for b in data.get('batches', [])}
+    requests, _ = generate_requests(data.get('teachers', []), data.get('subjects', []), data.get('batches', []))
+
+    start = time.perf_counter()
+    model, extract = ENGINES[engine](requests, batch_map, data.get('classrooms', []), config)
+    build_time = time.perf_counter() - start
+
+    return requests, model, extract, build_time
+
+
+def run_engine(data, engine, time_limit):
+    """Build and solve one dataset with one engine, timing each stage."""
+    requests, model, _, build_time = build_engine(data, engine)
+    proto = model.Proto()
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time_limit
+    start = time.perf_counter()
+    status = solver.Solve(model)
+    solve_time = time.perf_counter() - start
+
+    return {
+        'engine': engine,
+        'requests': len(requests),
+        'variables': len(proto.variables),
+        'constraints': len(proto.constraints),
+        'build_s': round(build_time, 3),
+        'solve_s': round(solve_time, 3),
+        'status': solver.StatusName(status),
+    }
+
+
+def compare_engines(datasets, engines, time_limit):
+    results = []
+    for path in datasets:
+        data = load_dataset(path)
+        for engine in engines:
+            row = run_engine(data, engine, time_limit)
+            row['dataset'] = os.path.relpath(path, REPO_ROOT)
+            results.append(row)
+    return results
+
+
+def benchmark_build(engines, scales):
+    """Model-build micro-benchmark over the repo datasets at several scales."""
+    sources = [
+        ('data.json', load_dataset(DEFAULT_DATASETS[0])),
+        ('generate_sample_data', generated_dataset()),
+    ]
+    results = []
+    for name, data in sources:
+        for factor in scales:
+            scaled = scale_dataset(data, factor)
+            for engine in engines:
+                requests, model, _, build_time = build_engine(scaled, engine)
+                proto = model.Proto()
+                results.append({
+                    'dataset': name,
+                    'scale': factor,
+                    'engine': engine,
+                    'requests': len(requests),
+                    'variables': len(proto.variables),
+                    'constraints': len(proto.constraints),
+                    'build_s': round(build_time, 3),
+                })
+    return results
+
+
+def legacy_fill_vacant_slots(final_schedule, batches, classrooms, teachers, days, slots_per_day):
+    """The original set-based fill pass, kept as the baseline for the fill benchmark."""
+    occupied_rooms = set()
+    occupied_teachers = set()
+    batch_occupied_slots = set()
+
+    for entry in final_schedule:
+        d = entry['day']
+        p = entry['period']
+        occupied_rooms.add((d, p, entry['classroomId']))
+        occupied_teachers.add((d, p, entry['teacherId']))
+        for b_id in entry['batchIds']:
+            batch_occupied_slots.add((d, p, b_id))
+
+    for batch in batches:
+        b_id = batch['id']
+        for day in days:
+            for p_idx in range(slots_per_day):
+                period = p_idx + 1
+                if (day, period, b_id) in batch_occupied_slots:
+                    continue
+
+                assigned_room = None
+                for r in classrooms:
+                    if (day, period, r['id']) not in occupied_rooms:
+                        assigned_room = r
+                        break
+                if not assigned_room:
+                    continue
+
+                assigned_teacher_id = "SELF-STUDY-SUPERVISOR"
+                for t in teachers:
+                    if (day, period, t['id']) not in occupied_teachers:
+                        assigned_teacher_id = t['id']
+                        occupied_teachers.add((day, period, t['id']))
+                        break
+
+                final_schedule.append({
+                    'id': f"auto_fill_{b_id}_{day}_{period}",
+                    'subjectId': "SELF-STUDY",
+                    'teacherId': assigned_teacher_id,
+                    'classroomId': assigned_room['id'],
+                    'batchIds': [b_id],
+                    'day': day,
+                    'period': period
+                })
+                occupied_rooms.add((day, period, assigned_room['id']))
+                batch_occupied_slots.add((day, period, b_id))
+
+    return final_schedule
+
+
+def greedy_partial_schedule(data, seed=0):
+    """Conflict-free partial timetable built without CP-SAT, as input for the fill pass."""
+    rng = random.Random(seed)
+    config = data.get('config', DEFAULT_CONFIG)
+    days = config['daysPerWeek']
+    slots_per_day = config['slotsPerDay']
+    slots = [(day, p_idx + 1) for day in days for p_idx in range(slots_per_day)]
+    classrooms = data.get('classrooms', [])
+    requests, _ = generate_requests(data.get('teachers', []), data.get('subjects', []), data.get('batches', []))
+
+    busy = set()
+    schedule = []
+    for req in requests:
+        day, period = rng.choice(slots)
+        if (day, period, req['batch_id']) in busy or (day, period, req['teacher_id']) in busy:
+            continue
+        free_rooms = [r['id'] for r in classrooms if (day, period, r['id']) not in busy]
+        if not free_rooms:
+            continue
+        room_id = rng.choice(free_rooms)
+        busy.update({(day, period, req['batch_id']), (day, period, req['teacher_id']), (day, period, room_id)})
+        schedule.append({
+            'id': f"sched_{req['id']}",
+            'subjectId': req['subject_id'],
+            'teacherId': req['teacher_id'],
+            'classroomId': room_id,
+            'batchIds': [req['batch_id']],
+            'day': day,
+            'period': period,
+        })
+    return schedule
+
+
+def benchmark_fill(scales, repeat):
+    """Vectorized fill pass vs. the original loops, on the same partial schedules."""
+    results = []
+    base = generated_dataset()
+    for factor in scales:
+        data = scale_dataset(base, factor, rooms=True)
+        config = data['config']
+        partial = greedy_partial_schedule(data)
+        args = (data['batches'], data['classrooms'], data['teachers'], config['daysPerWeek'], config['slotsPerDay'])
+
+        timings = {}
+        outputs = {}
+        for name, fill in (('legacy', legacy_fill_vacant_slots), ('vectorized', fill_vacant_slots)):
+            best = None
+            for _ in range(repeat):
+                schedule = copy.deepcopy(partial)
+                start = time.perf_counter()
+                outputs[name] = fill(schedule, *args)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+
+        results.append({
+            'scale': factor,
+            'batches': len(data['batches']),
+            'rooms': len(data['classrooms']),
+            'teachers': len(data['teachers']),
+            'filled': len(outputs['vectorized']) - len(partial),
+            'legacy_s': round(timings['legacy'], 4),
+            'vectorized_s': round(timings['vectorized'], 4),
+            'speedup': round(timings['legacy'] / max(timings['vectorized'], 1e-9), 1),
+            'identical': outputs['legacy'] == outputs['vectorized'],
+        })
+    return results
+
+
+def serialization_backends():
+    """(name, loads, dumps) for the standard library and each installed fast path."""
+    backends = [('json', json.loads, json.dumps)]
+    if serialization.orjson is not None:
+        orjson = serialization.orjson
+        backends.append(('orjson', orjson.loads, lambda obj: orjson.dumps(obj).decode('utf-8')))
+    if serialization.msgspec is not None:
+        msgspec = serialization.msgspec
+        backends.append(('msgspec', msgspec.json.decode, lambda obj: msgspec.json.encode(obj).decode('utf-8')))
+    return backends
+
+
+def benchmark_io(scales, repeat):
+    """Parse time of the scheduler's input and emit time of its output, per JSON backend.
+
+    The input is data.json (schedule included) scaled up, the output its
+    schedule repeated `factor` times. msgpack_ms, where msgspec or msgpack
+    is installed, is the time to decode the same input from msgpack.
+    """
+    base = load_dataset(DEFAULT_DATASETS[0])
+    results = []
+    for factor in scales:
+        data = dict(scale_dataset(base, factor), schedule=(base.get('schedule') or []) * factor)
+        payload = json.dumps(data).encode('utf-8')
+        packed = None
+        if serialization.msgspec is not None:
+            packed = serialization.msgspec.msgpack.encode(data)
+        elif serialization.msgpack is not None:
+            packed = serialization.msgpack.packb(data)
+
+        def best_of(call, arg):
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                call(arg)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            return best
+
+        for name, loads, dumps in serialization_backends():
+            results.append({
+                'scale': factor,
+                'input_mb': round(len(payload) / 2**20, 2),
+                'entries': len(data['schedule']),
+                'backend': name,
+                'parse_ms': round(best_of(loads, payload) * 1000, 1),
+                'emit_ms': round(best_of(dumps, data['schedule']) * 1000, 1),
+                'msgpack_ms': round(best_of(serialization.unpack, packed) * 1000, 1) if packed else None,
+            })
+    return results
+
+
+def benchmark_store(scales, saves, seed=0):
+    """Schedule save time: full rewrite (import) vs. DataStore.save_schedule's diff, over a series of re-plans.
+
+    Each re-plan moves ~5% of data.json's schedule (repeated `factor` times,
+    one batch copy each). With renumber, it is also shuffled and numbered
+    afresh, as a re-solve whose requests come in another order would; the
+    unchanged entries then have to be rewritten with their new ids.
+    identical checks that the stored schedule equals the saved one, ids
+    included, with no duplicate ids.
+    """
+    base = load_dataset(DEFAULT_DATASETS[0])
+    days = (base.get('config') or DEFAULT_CONFIG)['daysPerWeek']
+    slots = (base.get('config') or DEFAULT_CONFIG)['slotsPerDay']
+    rng = random.Random(seed)
+
+    def canonical(schedule):
+        return sorted(json.dumps(entry, sort_keys=True) for entry in schedule)
+
+    results = []
+    for factor, renumber in itertools.product(scales, (False, True)):
+        schedule = [dict(entry, batchIds=[f"{b_id}~{k}" for b_id in entry.get('batchIds') or []])
+                    for k in range(factor) for entry in base.get('schedule') or []]
+        for i, entry in enumerate(schedule):
+            entry['id'] = f"sched_{i}"
+        with tempfile.TemporaryDirectory() as directory:
+            with DataStore(os.path.join(directory, 'bench.db'), seed=None) as store:
+                store.import_data({'schedule': schedule})
+                full = delta = 0.0
+                changed = rewritten = 0
+                identical = True
+                for _ in range(saves):
+                    schedule = [dict(entry) for entry in schedule]
+                    for entry in rng.sample(schedule, max(1, len(schedule) // 20)):
+                        entry['day'], entry['period'] = rng.choice(days), rng.randint(1, slots)
+                    if renumber:
+                        rng.shuffle(schedule)
+                        for i, entry in enumerate(schedule):
+                            entry['id'] = f"sched_{i}"
+
+                    start = time.perf_counter()
+                    diff = store.save_schedule(schedule)
+                    delta += time.perf_counter() - start
+                    changed += len(diff.inserted) + len(diff.removed) + len(diff.moved)
+                    rewritten += len(diff.rewritten)
+                    stored = store.schedule()
+                    ids = [entry.get('id') for entry in stored]
+                    identical &= canonical(stored) == canonical(schedule) and len(set(ids)) == len(ids)
+
+                    # The old way: every entry rewritten on every save
+                    start = time.perf_counter()
+                    with store.transaction():
+                        store.db.execute('DELETE FROM schedule_entries')
+                        store._insert_entries(schedule, 0)
+                    full += time.perf_counter() - start
+        results.append({
+            'scale': factor,
+            'entries': len(schedule),
+            'renumber': renumber,
+            'saves': saves,
+            'full_ms': round(full / saves * 1000, 1),
+            'delta_ms': round(delta / saves * 1000, 1),
+            'changed': changed // saves,
+            'rewritten': rewritten // saves,
+            'identical': identical,
+        })
+    return results
+
+
+def legacy_generate_requests(teachers, subjects, batches, preferred_teachers=None):
+    """The original scan-and-sort teacher assignment: the timing baseline of benchmark_requests.
+
+    Correctness is checked against REQUESTS_FIXTURE, not against this copy.
+    """
+    requests = []
+    req_id_counter = 0
+    teacher_assigned_load = {}
+    teachers = [t for t in teachers if not t.get('isAbsent')]
+
+    for batch in batches:
+        for subject in subjects:
+            if batch.get('requiredSubjects') and subject['id'] not in batch['requiredSubjects']:
+                continue
+            if subject.get('requiredBatches') and batch['id'] not in subject['requiredBatches']:
+                continue
+
+            qualified_teachers = [t for t in teachers if subject['id'] in t.get('qualifiedSubjects', [])]
+            if not qualified_teachers:
+                qualified_teachers = [t for t in teachers if t.get('department') == batch.get('department')]
+            if not qualified_teachers:
+                if teachers:
+                    qualified_teachers = [teachers[0]]
+                else:
+                    continue
+
+            credits = subject.get('credits', 1)
+            qualified_teachers.sort(key=lambda t: (teacher_assigned_load.get(t['id'], 0), t['id']))
+            within_cap = [
+                t for t in qualified_teachers
+                if not t.get('maxLoadPerWeek') or teacher_assigned_load.get(t['id'], 0) + credits <= t['maxLoadPerWeek']
+            ]
+            assigned_teacher = (within_cap or qualified_teachers)[0]
+
+            if preferred_teachers:
+                preferred_id = preferred_teachers.get((batch['id'], subject['id']))
+                for t in qualified_teachers:
+                    if t['id'] == preferred_id and not t.get('isAbsent'):
+                        assigned_teacher = t
+                        break
+
+            teacher_assigned_load[assigned_teacher['id']] = teacher_assigned_load.get(assigned_teacher['id'], 0) + credits
+            for _ in range(credits):
+                requests.append({
+                    'id': req_id_counter,
+                    'batch_id': batch['id'],
+                    'subject_id': subject['id'],
+                    'teacher_id': assigned_teacher['id'],
+                    'type': subject.get('type', 'Theory'),
+                    'duration': 1
+                })
+                req_id_counter += 1
+
+    return requests, teacher_assigned_load
+
+
+def request_assignment(output):
+    """Requests and loads without candidate_teachers, which the baseline does not produce."""
+    requests, load = output
+    return [{k: v for k, v in req.items() if k != 'candidate_teachers'} for req in requests], load
+
+
+def assignment_digest(output):
+    payload = json.dumps(request_assignment(output), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def load_requests_fixture():
+    try:
+        with open(REQUESTS_FIXTURE, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def benchmark_requests(scales, repeat, update_fixture=False):
+    """Indexed request generation timed against the original, with a regression check.
+
+    identical compares the output (requests and teacher loads, plain and
+    with a random previous-teacher map for the incremental path) with the
+    frozen expectation in REQUESTS_FIXTURE: the full output at scale 1, a
+    sha256 of it at larger scales. None where the fixture has no entry.
+    update_fixture rewrites the fixture from the current output, for a
+    deliberate change of assignment rules.
+    """
+    fixture = load_requests_fixture()
+    results = []
+    sources = [
+        ('data.json', load_dataset(DEFAULT_DATASETS[0])),
+        ('generate_sample_data', generated_dataset()),
+    ]
+    for name, base in sources:
+        for factor in scales:
+            data = scale_dataset(base, factor)
+            args = (data['teachers'], data['subjects'], data['batches'])
+            rng = random.Random(factor)
+            preferred = {
+                (b['id'], s['id']): rng.choice(data['teachers'])['id']
+                for b in data['batches'] for s in data['subjects']
+            }
+
+            timings = {}
+            outputs = {}
+            for label, generate in (('legacy', legacy_generate_requests), ('indexed', generate_requests)):
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    outputs[label] = generate(*args)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                timings[label] = best
+            outputs['preferred'] = generate_requests(*args, preferred_teachers=preferred)
+
+            key = f"{name}@{factor}"
+            actual = {variant: assignment_digest(outputs[label])
+                      for variant, label in (('plain', 'indexed'), ('preferred', 'preferred'))}
+            if factor == 1:
+                actual['output'] = {'plain': request_assignment(outputs['indexed']),
+                                    'preferred': request_assignment(outputs['preferred'])}
+            # As it reads back from JSON (tuples become lists)
+            actual = json.loads(json.dumps(actual))
+            if update_fixture:
+                fixture[key] = actual
+            identical = None if key not in fixture else fixture[key] == actual
+
+            results.append({
+                'dataset': name,
+                'scale': factor,
+                'requests': len(outputs['indexed'][0]),
+                'legacy_s': round(timings['legacy'], 4),
+                'indexed_s': round(timings['indexed'], 4),
+                'speedup': round(timings['legacy'] / max(timings['indexed'], 1e-9), 1),
+                'identical': identical,
+            })
+
+    if update_fixture:
+        os.makedirs(os.path.dirname(REQUESTS_FIXTURE), exist_ok=True)
+        with open(REQUESTS_FIXTURE, 'w') as f:
+            json.dump(fixture, f, indent=1, sort_keys=True)
+            f.write('\n')
+    return results
+
+
+def load_violations(placements, teachers):
+    """Teacher-days over maxLoadPerDay plus teachers over maxLoadPerWeek."""
+    caps = {t['id']: t for t in teachers}
+    per_day = {}
+    per_week = {}
+    for _, d_idx, _, _, t_id in placements:
+        per_day[(t_id, d_idx)] = per_day.get((t_id, d_idx), 0) + 1
+        per_week[t_id] = per_week.get(t_id, 0) + 1
+    over_day = sum(1 for (t_id, _), n in per_day.items() if caps[t_id].get('maxLoadPerDay') and n > caps[t_id]['maxLoadPerDay'])
+    over_week = sum(1 for t_id, n in per_week.items() if caps[t_id].get('maxLoadPerWeek') and n > caps[t_id]['maxLoadPerWeek'])
+    return over_day + over_week
+
+
+def tighten_loads(data, load_factor):
+    """Scale every teacher's maxLoadPerDay / maxLoadPerWeek by load_factor."""
+    if load_factor == 1:
+        return data
+    teachers = []
+    for t in data.get('teachers', []):
+        t = dict(t)
+        for field in ('maxLoadPerDay', 'maxLoadPerWeek'):
+            if t.get(field):
+                t[field] = max(1, int(t[field] * load_factor))
+        teachers.append(t)
+    return dict(data, teachers=teachers)
+
+
+def benchmark_teachers(seeds, scales, load_factor, time_limit):
+    """Greedy teacher pre-assignment ('decomposed') vs. solver-chosen teachers ('joint').
+
+    A run counts as feasible only if CP-SAT found a timetable and no
+    teacher exceeds maxLoadPerDay / maxLoadPerWeek in it.
+    """
+    runs = [('data.json', load_dataset(DEFAULT_DATASETS[0]))]
+    runs += [(f'generate_sample_data#{seed}', generated_dataset(seed)) for seed in seeds]
+
+    results = []
+    for factor in scales:
+        for engine in ('decomposed', 'joint'):
+            feasible = 0
+            times = []
+            for name, base in runs:
+                data = tighten_loads(scale_dataset(base, factor, rooms=True), load_factor)
+                _, model, extract, build_time = build_engine(data, engine)
+                profile = dict(DEFAULT_SOLVER_PROFILE, timeLimit=time_limit)
+                solver, status = run_solver(model, profile)
+                ok = status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+                if ok:
+                    ok = load_violations(list(extract(solver)), data['teachers']) == 0
+                feasible += ok
+                times.append(build_time + solver.WallTime())
+            results.append({
+                'scale': factor,
+                'engine': engine,
+                'runs': len(runs),
+                'feasible': feasible,
+                'feasible_rate': round(feasible / len(runs), 2),
+                'mean_time_s': round(sum(times) / len(times), 3),
+                'max_time_s': round(max(times), 3),
+            })
+    return results
+
+
+def overload_teacher(data):
+    """Copy of data made infeasible: the busiest teacher's maxLoadPerDay no longer covers their week.
+
+    None when even a cap of 1 would fit (a cap of 0 means "no cap").
+    """
+    config = data.get('config', DEFAULT_CONFIG)
+    _, load = generate_requests(data.get('teachers', []), data.get('subjects', []), data.get('batches', []))
+    if not load:
+        return None
+    busiest = max(load, key=load.get)
+    per_day = -(-load[busiest] // len(config['daysPerWeek'])) - 1
+    if per_day < 1:
+        return None
+    teachers = [dict(t, maxLoadPerDay=per_day) if t['id'] == busiest else t for t in data.get('teachers', [])]
+    return dict(data, teachers=teachers)
+
+
+def benchmark_symmetry(datasets, engines, time_limit):
+    """Solve each dataset, and an infeasible copy of it, with and without symmetry breaking."""
+    results = []
+    for name, base in datasets:
+        for variant, data in (('feasible', base), ('infeasible', overload_teacher(base))):
+            if data is None:
+                continue
+            for engine in engines:
+                for symmetry in (False, True):
+                    config = dict(data.get('config', DEFAULT_CONFIG), symmetryBreaking=symmetry)
+                    _, model, _, build_time = build_engine(dict(data, config=config), engine)
+                    timer = FirstSolutionTimer()
+                    solver, status = run_solver(model, dict(DEFAULT_SOLVER_PROFILE, timeLimit=time_limit), timer)
+                    results.append({
+                        'dataset': name,
+                        'variant': variant,
+                        'engine': engine,
+                        'symmetry': symmetry,
+                        'variables': len(model.Proto().variables),
+                        'build_s': round(build_time, 3),
+                        'first_feasible_s': None if timer.first is None else round(timer.first, 3),
+                        'solve_s': round(solver.WallTime(), 3),
+                        'status': solver.StatusName(status),
+                    })
+    return results
+
+
+def benchmark_decompose(datasets, engines, scales, processes, time_limit):
+    """Whole solves, as one model and split into departments, on copies that share no teacher."""
+    results = []
+    for name, data in datasets:
+        for factor in scales:
+            scaled = scale_dataset(data, factor, rooms=True, departments=True)
+            requests, _ = generate_requests(scaled.get('teachers', []), scaled.get('subjects', []),
+                                            scaled.get('batches', []))
+            components = sharing_components(requests)
+            for engine in engines:
+                for decompose in (False, True):
+                    profile = {'timeLimit': time_limit, 'processes': processes}
+                    start = time.perf_counter()
+                    schedule = solve_schedule(scaled, engine=engine, decompose=decompose, solver_profile=profile)
+                    results.append({
+                        'dataset': name,
+                        'scale': factor,
+                        'engine': engine,
+                        'decompose': decompose,
+                        'requests': len(requests),
+                        'components': len(components),
+                        'largest': len(components[0]) if components else 0,
+                        'total_s': round(time.perf_counter() - start, 3),
+                        'entries': len(schedule),
+                    })
+    return results
+
+
+def benchmark_warm_start(datasets, engines, scales, time_limit):
+    """The greedy heuristic alone, then each engine solved cold and hinted with its timetable."""
+    results = []
+    for name, data in datasets:
+        for factor in scales:
+            scaled = scale_dataset(data, factor, rooms=True)
+            config = scaled.get('config', DEFAULT_CONFIG)
+            batch_map = {b['id']: b for b in scaled.get('batches', [])}
+            classrooms = scaled.get('classrooms', [])
+            requests, _ = generate_requests(scaled.get('teachers', []), scaled.get('subjects', []),
+                                            scaled.get('batches', []))
+            start = time.perf_counter()
+            placements, unplaced = greedy_schedule(requests, batch_map, classrooms, config)
+            greedy_time = time.perf_counter() - start
+
+            for engine in engines:
+                for warm in (False, True):
+                    model, _ = ENGINES[engine](requests, batch_map, classrooms, config, placements if warm else None)
+                    timer = FirstSolutionTimer()
+                    solver, status = run_solver(model, dict(DEFAULT_SOLVER_PROFILE, timeLimit=time_limit), timer,
+                                                complete_hint=warm)
+                    results.append({
+                        'dataset': name,
+                        'scale': factor,
+                        'requests': len(requests),
+                        'greedy_s': round(greedy_time, 3),
+                        'unplaced': len(unplaced),
+                        'engine': engine,
+                        'warm_start': warm,
+                        'first_feasible_s': None if timer.first is None else round(timer.first, 3),
+                        'solve_s': round(solver.WallTime(), 3),
+                        'status': solver.StatusName(status),
+                    })
+    return results
+
+
+def benchmark_incremental(datasets, engine, absences, time_limit):
+    """Incremental re-plans with freezeUnchanged after one teacher is marked absent.
+
+    For each dataset, the `absences` busiest teachers of a fresh timetable
+    are made absent one at a time. pinned_pct is the share of requests that
+    match_previous_schedule pins at 'slot' scope (resource_pct: at the
+    'resource' fallback scope); moved counts the classes the re-plan moved.
+    """
+    profile = dict(DEFAULT_SOLVER_PROFILE, timeLimit=time_limit)
+    results = []
+    for name, data in datasets:
+        schedule = solve_schedule(data, engine=engine, solver_profile=profile)
+        load = {}
+        for entry in schedule:
+            if entry['subjectId'] != "SELF-STUDY":
+                load[entry['teacherId']] = load.get(entry['teacherId'], 0) + 1
+        config = data.get('config', DEFAULT_CONFIG)
+        for t_id in sorted(load, key=load.get, reverse=True)[:absences]:
+            teachers = [dict(t, isAbsent=True) if t['id'] == t_id else t for t in data.get('teachers', [])]
+            variant = dict(data, teachers=teachers, schedule=schedule)
+            requests, _ = generate_requests(teachers, data.get('subjects', []), data.get('batches', []),
+                                            preferred_teachers=previous_teachers(schedule))
+            batch_map = {b['id']: b for b in data.get('batches', [])}
+            pins = {}
+            for scope in ('slot', 'resource'):
+                matched = match_previous_schedule(requests, schedule, teachers, data.get('classrooms', []), batch_map,
+                                                  config['daysPerWeek'], config['slotsPerDay'], True, scope)
+                pins[scope] = sum(1 for placement in matched.values() if placement.fixed)
+
+            stats = {}
+            start = time.perf_counter()
+            replanned = solve_schedule(variant, engine=engine, incremental=True, freeze=True,
+                                       solver_profile=profile, stats=stats)
+            elapsed = time.perf_counter() - start
+            diff = diff_schedules([e for e in schedule if e['subjectId'] != "SELF-STUDY"],
+                                  [e for e in replanned if e['subjectId'] != "SELF-STUDY"])
+            results.append({
+                'dataset': name,
+                'absent': t_id,
+                'classes': load[t_id],
+                'requests': len(requests),
+                'pinned_pct': round(100 * pins['slot'] / len(requests), 1),
+                'resource_pct': round(100 * pins['resource'] / len(requests), 1),
+                'status': stats.get('status'),
+                'moved': len(diff.moved) + len(diff.inserted),
+                'total_s': round(elapsed, 3),
+            })
+    return results
+
+
+def proto_bytes(model):
+    """Serialized size of the model proto (this CP-SAT's proto wrapper has no ByteSize())."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.pb')
+        model.ExportToFile(path)
+        return os.path.getsize(path)
+
+
+def benchmark_lean(engines, scales):
+    """Build time and proto size with named and with unnamed (leanModel) variables.
+
+    names_match checks the lean model's side table against the named model:
+    variable_names.name(i) must give every variable the same name.
+    """
+    sources = [
+        ('data.json', load_dataset(DEFAULT_DATASETS[0])),
+        ('generate_sample_data', generated_dataset()),
+    ]
+    results = []
+    for name, data in sources:
+        for factor in scales:
+            scaled = scale_dataset(data, factor)
+            for engine in engines:
+                names = None
+                for lean in (False, True):
+                    variant = dict(scaled, config=dict(scaled.get('config', DEFAULT_CONFIG), leanModel=lean))
+                    requests, model, _, build_time = build_engine(variant, engine)
+                    proto = model.Proto()
+                    row = {
+                        'dataset': name,
+                        'scale': factor,
+                        'engine': engine,
+                        'lean': lean,
+                        'variables': len(proto.variables),
+                        'build_s': round(build_time, 3),
+                        'proto_mb': round(proto_bytes(model) / 2**20, 2),
+                    }
+                    if not lean:
+                        names = [var.name for var in proto.variables]
+                        row['names_match'] = None
+                    else:
+                        table = model.variable_names
+                        row['names_match'] = all(var.name or table.name(i) == names[i]
+                                                 for i, var in enumerate(proto.variables))
+                    results.append(row)
+                    del model, proto
+    return results
+
+
+def benchmark_soft_constraints(datasets, engines, time_limit, seconds):
+    """Model size and final penalty of each engine, hinted with the greedy timetable, with and without the objective.
+
+    Each solve gets a second row with its penalty after `seconds` of local
+    search, the default polish of a soft-constraint solve.
+    """
+    results = []
+    for name, data in datasets:
+        batch_map = {b['id']: b for b in data.get('batches', [])}
+        classrooms = data.get('classrooms', [])
+        requests, _ = generate_requests(data.get('teachers', []), data.get('subjects', []), data.get('batches', []))
+        greedy, _ = greedy_schedule(requests, batch_map, classrooms, data.get('config', DEFAULT_CONFIG))
+
+        for engine in engines:
+            for soft in (False, True):
+                config = dict(data.get('config', DEFAULT_CONFIG), softConstraints=soft)
+                start = time.perf_counter()
+                model, extract = ENGINES[engine](requests, batch_map, classrooms, config, greedy)
+                build_time = time.perf_counter() - start
+                proto = model.Proto()
+                solver, status = run_solver(model, dict(DEFAULT_SOLVER_PROFILE, timeLimit=time_limit),
+                                            complete_hint=True)
+                search = None
+                if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+                    search = LocalSearch(requests, list(extract(solver)), batch_map, classrooms, config)
+                row = {
+                    'dataset': name,
+                    'engine': engine,
+                    'soft': soft,
+                    'local_search': 0,
+                    'variables': len(proto.variables),
+                    'constraints': len(proto.constraints),
+                    'build_s': round(build_time, 3),
+                    'solve_s': round(solver.WallTime(), 3),
+                    'status': solver.StatusName(status),
+                    'penalty': search.total if search else None,
+                }
+                results.append(row)
+                if search and seconds:
+                    search.run(seconds)
+                    results.append(dict(row, local_search=seconds, penalty=search.total))
+    return results
+
+
+# Penalty terms an engine's objective leaves out or only partly counts (see add_penalty_terms)
+UNMODELED_TERMS = {
+    'joint': {'dailyLoad'}, # no teacher dailyLoad: a teacher's sessions depend on the choice
+    'compact': set(DEFAULT_PENALTY_WEIGHTS) - {'preferredSlots'},
+}
+
+
+def benchmark_objective(datasets, engines, terms, time_limit):
+    """The soft objective of each engine with one penalty term at a time, against LocalSearch's count.
+
+    exact is whether the two agree when CP-SAT proves the solution optimal
+    (None when it doesn't, or the engine leaves the term out), so a penalty
+    variable the solver could set freely shows up as False.
+    """
+    results = []
+    for name, data in datasets:
+        batch_map = {b['id']: b for b in data.get('batches', [])}
+        classrooms = data.get('classrooms', [])
+        requests, _ = generate_requests(data.get('teachers', []), data.get('subjects', []), data.get('batches', []))
+
+        for term in terms:
+            config = dict(data.get('config', DEFAULT_CONFIG), softConstraints=True,
+                          penaltyWeights={other: int(other == term) for other in DEFAULT_PENALTY_WEIGHTS})
+            greedy, _ = greedy_schedule(requests, batch_map, classrooms, config)
+            for engine in engines:
+                model, extract = ENGINES[engine](requests, batch_map, classrooms, config, greedy)
+                solver, status = run_solver(model, dict(DEFAULT_SOLVER_PROFILE, timeLimit=time_limit),
+                                            complete_hint=True)
+                objective = penalty = exact = None
+                if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+                    objective = round(solver.ObjectiveValue())
+                    penalty = LocalSearch(requests, list(extract(solver)), batch_map, classrooms, config).total
+                    if status == cp_model.OPTIMAL and term not in UNMODELED_TERMS.get(engine, ()):
+                        exact = objective == penalty
+                results.append({
+                    'dataset': name,
+                    'term': term,
+                    'engine': engine,
+                    'status': solver.StatusName(status),
+                    'solve_s': round(solver.WallTime(), 3),
+                    'objective': objective,
+                    'penalty': penalty,
+                    'exact': exact,
+                })
+    return results
+
+
+def benchmark_local_search(datasets, engines, seconds, time_limit):
+    """Soft penalties of each engine's timetable before and after `seconds` of local search."""
+    results = []
+    for name, data in datasets:
+        config = data.get('config', DEFAULT_CONFIG)
+        batch_map = {b['id']: b for b in data.get('batches', [])}
+        classrooms = data.get('classrooms', [])
+        requests, _ = generate_requests(data.get('teachers', []), data.get('subjects', []), data.get('batches', []))
+        greedy, _ = greedy_schedule(requests, batch_map, classrooms, config)
+
+        for engine in engines:
+            if engine == GREEDY_ENGINE:
+                placements = [(r_idx,) + placement[:3] + (requests[r_idx]['teacher_id'],)
+                              for r_idx, placement in sorted(greedy.items())]
+            else:
+                model, extract = ENGINES[engine](requests, batch_map, classrooms, config, greedy)
+                solver, status = run_solver(model, dict(DEFAULT_SOLVER_PROFILE, timeLimit=time_limit),
+                                            complete_hint=True)
+                if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+                    continue
+                placements = list(extract(solver))
+
+            search = LocalSearch(requests, placements, batch_map, classrooms, config)
+            before = search.breakdown()
+            penalty = search.total
+            moves = search.run(seconds)
+            after = search.breakdown()
+            row = {
+                'dataset': name,
+                'engine': engine,
+                'requests': len(requests),
+                'penalty_before': penalty,
+                'penalty_after': search.total,
+                'moves': moves,
+            }
+            row.update({term: f"{before[term]}->{after[term]}" for term in before})
+            results.append(row)
+    return results
+
+
+class FirstSolutionTimer(cp_model.CpSolverSolutionCallback):
+    """Records wall time from Solve() to the first feasible solution."""
+
+    def __init__(self):
+        super().__init__()
+        self.start = time.perf_counter()
+        self.first = None
+
+    def on_solution_callback(self):
+        if self.first is None:
+            self.first = time.perf_counter() - self.start
+
+
+def sweep_profiles(datasets, engine, workers, strategies, presolve_levels, seeds, time_limit):
+    """Solve every dataset under every combination of solver settings."""
+    results = []
+    for name, data in datasets:
+        requests, model, _, build_time = build_engine(data, engine)
+        for n_workers, strategy, presolve, seed in itertools.product(workers, strategies, presolve_levels, seeds):
+            profile = dict(DEFAULT_SOLVER_PROFILE, workers=n_workers, strategy=strategy,
+                           presolve=presolve, seed=seed, timeLimit=time_limit)
+            timer = FirstSolutionTimer()
+            solver, status = run_solver(model, profile, timer)
+            results.append({
+                'dataset': name,
+                'workers': n_workers,
+                'strategy': strategy,
+                'presolve': presolve,
+                'seed': seed,
+                'first_feasible_s': None if timer.first is None else round(timer.first, 3),
+                'solve_s': round(solver.WallTime(), 3),
+                'status': solver.StatusName(status),
+            })
+    return results
+
+
+LADDER_COLUMNS = ['batches', 'teachers', 'rooms', 'engine', 'variables', 'constraints', 'build_s', 'solve_s',
+                  'total_s', 'peak_rss_mb', 'status', 'entries']
+
+
+def ladder_rung(batches, engine, time_limit, generator):
+    """One ladder step: generate, then solve_schedule, in a fresh process (see benchmark_ladder)."""
+    data = generate_sample_data.generate_data(batches, **generator)
+    stats = {}
+    start = time.perf_counter()
+    try:
+        schedule = solve_schedule(data, engine=engine, solver_profile={'timeLimit': time_limit}, stats=stats)
+    except InfeasibleInput as e:
+        schedule = []
+        stats.setdefault('status', f"INFEASIBLE ({e.report['stage']})")
+    total = time.perf_counter() - start
+    return {
+        'batches': batches,
+        'teachers': len(data['teachers']),
+        'rooms': len(data['classrooms']),
+        'engine': engine,
+        'variables': stats.get('variables'),
+        'constraints': stats.get('constraints'),
+        'build_s': stats.get('build'),
+        'solve_s': stats.get('solve'),
+        'total_s': round(total, 3),
+        # ru_maxrss is in KiB on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'status': stats.get('status', 'GREEDY' if engine == GREEDY_ENGINE else 'UNKNOWN'),
+        'entries': len(schedule),
+    }
+
+
+def benchmark_ladder(sizes, engines, time_limit, generator):
+    """Whole solve_schedule runs on generated datasets of growing batch count.
+
+    Each rung runs in its own freshly spawned process, so peak RSS is that
+    run's alone rather than the high-water mark of everything before it, and
+    a rung killed for running out of memory is reported as CRASHED.
+    """
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for batches in sizes:
+        for engine in engines:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                try:
+                    row = pool.submit(ladder_rung, batches, engine, time_limit, generator).result()
+                except concurrent.futures.process.BrokenProcessPool:
+                    # Usually the OOM killer: a result the ladder should show, not abort on
+                    row = dict(dict.fromkeys(LADDER_COLUMNS), batches=batches, engine=engine, status='CRASHED')
+            results.append(row)
+            sys.stderr.write(f"Ladder: {json.dumps(row)}\n")
+    return results
+
+
+def print_table(rows, columns):
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in columns}
+    print('  '.join(c.ljust(widths[c]) for c in columns))
+    for r in rows:
+        print('  '.join(str(r[c]).ljust(widths[c]) for c in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scheduler benchmarks.")
+    parser.add_argument('--json', action='store_true', help="Print raw JSON rows instead of a table.")
+    parser.add_argument('--csv', action='store_true', help="Print CSV rows instead of a table.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_engines = sub.add_parser('engines', help="Build and solve each dataset with each engine.")
+    p_engines.add_argument('datasets', nargs='*', default=DEFAULT_DATASETS)
+    p_engines.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=sorted(ENGINES))
+    p_engines.add_argument('--time-limit', type=float, default=30.0)
+
+    p_build = sub.add_parser('build', help="Model-build micro-benchmark at increasing scale.")
+    p_build.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=sorted(ENGINES))
+    p_build.add_argument('--scales', nargs='+', type=int, default=[1, 10, 50])
+
+    p_profiles = sub.add_parser('profiles', help="Sweep solver profiles: time-to-first-feasible and final status.")
+    p_profiles.add_argument('datasets', nargs='*', default=DEFAULT_DATASETS)
+    p_profiles.add_argument('--engine', choices=sorted(ENGINES), default='boolean')
+    p_profiles.add_argument('--workers', nargs='+', type=int, default=[1, 4, 8, 16])
+    p_profiles.add_argument('--strategies', nargs='+', default=['automatic', 'portfolio', 'fixed'])
+    p_profiles.add_argument('--presolve', nargs='+', type=int, default=[2])
+    p_profiles.add_argument('--seeds', nargs='+', type=int, default=[0])
+    p_profiles.add_argument('--time-limit', type=float, default=30.0)
+
+    p_fill = sub.add_parser('fill', help="Self-study fill pass: vectorized vs. original loops.")
+    p_fill.add_argument('--scales', nargs='+', type=int, default=[1, 10, 50])
+    p_fill.add_argument('--repeat', type=int, default=3)
+
+    p_io = sub.add_parser('io', help="Input parse and schedule emit time per JSON backend (stdlib, orjson, msgspec).")
+    p_io.add_argument('--scales', nargs='+', type=int, default=[1, 10, 50])
+    p_io.add_argument('--repeat', type=int, default=5)
+
+    p_store = sub.add_parser('store', help="Schedule save time: full rewrite vs. diff, with an ids-included equality check.")
+    p_store.add_argument('--scales', nargs='+', type=int, default=[1, 10, 50])
+    p_store.add_argument('--saves', type=int, default=10)
+
+    p_requests = sub.add_parser('requests', help="Request generation time, with a regression check against a fixture.")
+    p_requests.add_argument('--scales', nargs='+', type=int, default=[1, 10, 50])
+    p_requests.add_argument('--repeat', type=int, default=3)
+    p_requests.add_argument('--update-fixture', action='store_true',
+                            help="Rewrite scripts/fixtures/expected_requests.json from the current output.")
+
+    p_teachers = sub.add_parser('teachers', help="Greedy teacher pre-assignment vs. joint assignment in the solver.")
+    p_teachers.add_argument('--seeds', nargs='+', type=int, default=[0, 1, 2, 3, 4])
+    p_teachers.add_argument('--scales', nargs='+', type=int, default=[1, 3])
+    p_teachers.add_argument('--load-factor', type=float, default=1.0,
+                            help="Multiply every teacher's load caps, e.g. 0.5 for a tight week.")
+    p_teachers.add_argument('--time-limit', type=float, default=30.0)
+
+    p_symmetry = sub.add_parser('symmetry', help="Time-to-feasible and infeasibility proofs with and without symmetry breaking.")
+    p_symmetry.add_argument('datasets', nargs='*', default=DEFAULT_DATASETS)
+    p_symmetry.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=['boolean', 'decomposed', 'joint'])
+    p_symmetry.add_argument('--time-limit', type=float, default=60.0)
+
+    p_decompose = sub.add_parser('decompose', help="Whole solve time as one model and split into independent departments.")
+    p_decompose.add_argument('datasets', nargs='*', default=DEFAULT_DATASETS[:1])
+    p_decompose.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=['boolean', 'decomposed'])
+    p_decompose.add_argument('--scales', nargs='+', type=int, default=[2, 5])
+    p_decompose.add_argument('--processes', type=int, default=0, help="0 = one per core.")
+    p_decompose.add_argument('--time-limit', type=float, default=60.0)
+
+    p_warm = sub.add_parser('warmstart', help="Greedy heuristic time and quality, and solves with and without its hints.")
+    p_warm.add_argument('datasets', nargs='*', default=DEFAULT_DATASETS)
+    p_warm.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=sorted(ENGINES))
+    p_warm.add_argument('--scales', nargs='+', type=int, default=[1, 3])
+    p_warm.add_argument('--time-limit', type=float, default=60.0)
+
+    p_local = sub.add_parser('localsearch', help="Soft penalties of each engine's timetable before and after local search.")
+    p_local.add_argument('datasets', nargs='*', default=DEFAULT_DATASETS)
+    p_local.add_argument('--engines', nargs='+', choices=sorted([*ENGINES, GREEDY_ENGINE]),
+                         default=sorted([*ENGINES, GREEDY_ENGINE]))
+    p_local.add_argument('--seconds', type=float, default=5.0)
+    p_local.add_argument('--time-limit', type=float, default=60.0)
+
+    p_incremental = sub.add_parser('incremental', help="Pins kept and classes moved when one busy teacher is absent.")
+    p_incremental.add_argument('datasets', nargs='*', default=DEFAULT_DATASETS[:1])
+    p_incremental.add_argument('--engine', choices=sorted(ENGINES), default='boolean')
+    p_incremental.add_argument('--absences', type=int, default=3, help="How many of the busiest teachers to try.")
+    p_incremental.add_argument('--time-limit', type=float, default=60.0)
+
+    p_lean = sub.add_parser('lean', help="Model-build time and proto size with and without variable names.")
+    p_lean.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=['boolean', 'decomposed'])
+    p_lean.add_argument('--scales', nargs='+', type=int, default=[1, 10, 50])
+
+    p_soft = sub.add_parser('soft', help="Model size and penalty with and without the soft-constraint objective.")
+    p_soft.add_argument('datasets', nargs='*', default=DEFAULT_DATASETS)
+    p_soft.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=sorted(ENGINES))
+    p_soft.add_argument('--time-limit', type=float, default=30.0)
+    p_soft.add_argument('--local-search', type=float, default=SOFT_LOCAL_SEARCH, metavar='SECONDS')
+
+    p_objective = sub.add_parser('objective', help="Check the soft objective against LocalSearch's penalty count, "
+                                                   "one term at a time.")
+    p_objective.add_argument('datasets', nargs='*', default=DEFAULT_DATASETS[:1])
+    p_objective.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=['boolean', 'joint'])
+    p_objective.add_argument('--terms', nargs='+', choices=sorted(DEFAULT_PENALTY_WEIGHTS),
+                             default=list(DEFAULT_PENALTY_WEIGHTS))
+    p_objective.add_argument('--time-limit', type=float, default=20.0)
+
+    p_ladder = sub.add_parser('ladder', help="solve_schedule on generated datasets from 5 to 500 batches.")
+    p_ladder.add_argument('--sizes', nargs='+', type=int, default=[5, 10, 20, 50, 100, 200, 500])
+    p_ladder.add_argument('--engines', nargs='+', choices=sorted([*ENGINES, GREEDY_ENGINE]),
+                          default=['boolean', 'decomposed'])
+    p_ladder.add_argument('--departments', type=int, default=1)
+    p_ladder.add_argument('--subjects', type=int, default=len(generate_sample_data.SUBJECTS))
+    p_ladder.add_argument('--qualification', type=float, default=0.1)
+    p_ladder.add_argument('--load', type=float, default=0.8)
+    p_ladder.add_argument('--seed', type=int, default=0)
+    p_ladder.add_argument('--time-limit', type=float, default=60.0)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'ladder':
+        generator = {'num_subjects': args.subjects, 'qualification': args.qualification, 'load': args.load,
+                     'departments': args.departments, 'seed': args.seed}
+        rows = benchmark_ladder(args.sizes, args.engines, args.time_limit, generator)
+        columns = LADDER_COLUMNS
+    elif args.command == 'decompose':
+        datasets = [(os.path.relpath(path, REPO_ROOT), load_dataset(path)) for path in args.datasets]
+        datasets.append(('generate_sample_data', generated_dataset()))
+        rows = benchmark_decompose(datasets, args.engines, args.scales, args.processes, args.time_limit)
+        columns = ['dataset', 'scale', 'engine', 'decompose', 'requests', 'components', 'largest', 'total_s', 'entries']
+    elif args.command == 'incremental':
+        datasets = [(os.path.relpath(path, REPO_ROOT), load_dataset(path)) for path in args.datasets]
+        datasets.append(('generate_sample_data', generated_dataset()))
+        rows = benchmark_incremental(datasets, args.engine, args.absences, args.time_limit)
+        columns = ['dataset', 'absent', 'classes', 'requests', 'pinned_pct', 'resource_pct', 'status', 'moved', 'total_s']
+        # One absent teacher should leave most of the week pinned
+        if not all(row['pinned_pct'] >= 50 for row in rows):
+            print_table(rows, columns)
+            sys.exit("A single-teacher absence unpinned most of the schedule")
+    elif args.command == 'lean':
+        rows = benchmark_lean(args.engines, args.scales)
+        columns = ['dataset', 'scale', 'engine', 'lean', 'variables', 'build_s', 'proto_mb', 'names_match']
+        if not all(row['names_match'] is not False for row in rows):
+            print_table(rows, columns)
+            sys.exit("Lean model side table does not reproduce the variable names")
+    elif args.command == 'soft':
+        datasets = [(os.path.relpath(path, REPO_ROOT), load_dataset(path)) for path in args.datasets]
+        datasets.append(('generate_sample_data', generated_dataset()))
+        rows = benchmark_soft_constraints(datasets, args.engines, args.time_limit, args.local_search)
+        columns = ['dataset', 'engine', 'soft', 'local_search', 'variables', 'constraints', 'build_s', 'solve_s',
+                   'status', 'penalty']
+    elif args.command == 'objective':
+        datasets = [(os.path.relpath(path, REPO_ROOT), load_dataset(path)) for path in args.datasets]
+        datasets.append(('generate_sample_data', generated_dataset()))
+        rows = benchmark_objective(datasets, args.engines, args.terms, args.time_limit)
+        columns = ['dataset', 'term', 'engine', 'status', 'solve_s', 'objective', 'penalty', 'exact']
+        if not all(row['exact'] is not False for row in rows):
+            print_table(rows, columns)
+            sys.exit("An optimal soft objective differs from the timetable's penalty count")
+    elif args.command == 'localsearch':
+        datasets = [(os.path.relpath(path, REPO_ROOT), load_dataset(path)) for path in args.datasets]
+        datasets.append(('generate_sample_data', generated_dataset()))
+        rows = benchmark_local_search(datasets, args.engines, args.seconds, args.time_limit)
+        columns = ['dataset', 'engine', 'requests', 'penalty_before', 'penalty_after', 'moves',
+                   'consecutive', 'teacherGaps', 'dailyLoad', 'preferredSlots']
+    elif args.command == 'warmstart':
+        datasets = [(os.path.relpath(path, REPO_ROOT), load_dataset(path)) for path in args.datasets]
+        datasets.append(('generate_sample_data', generated_dataset()))
+        rows = benchmark_warm_start(datasets, args.engines, args.scales, args.time_limit)
+        columns = ['dataset', 'scale', 'requests', 'greedy_s', 'unplaced', 'engine', 'warm_start',
+                   'first_feasible_s', 'solve_s', 'status']
+    elif args.command == 'symmetry':
+        datasets = [(os.path.relpath(path, REPO_ROOT), load_dataset(path)) for path in args.datasets]
+        datasets.append(('generate_sample_data', generated_dataset()))
+        rows = benchmark_symmetry(datasets, args.engines, args.time_limit)
+        columns = ['dataset', 'variant', 'engine', 'symmetry', 'variables', 'build_s', 'first_feasible_s', 'solve_s', 'status']
+    elif args.command == 'teachers':
+        rows = benchmark_teachers(args.seeds, args.scales, args.load_factor, args.time_limit)
+        columns = ['scale', 'engine', 'runs', 'feasible', 'feasible_rate', 'mean_time_s', 'max_time_s']
+    elif args.command == 'io':
+        rows = benchmark_io(args.scales, args.repeat)
+        columns = ['scale', 'input_mb', 'entries', 'backend', 'parse_ms', 'emit_ms', 'msgpack_ms']
+    elif args.command == 'store':
+        rows = benchmark_store(args.scales, args.saves)
+        columns = ['scale', 'entries', 'renumber', 'saves', 'full_ms', 'delta_ms', 'changed', 'rewritten', 'identical']
+        if not all(row['identical'] for row in rows):
+            print_table(rows, columns)
+            sys.exit("The stored schedule differs from the saved one")
+    elif args.command == 'requests':
+        rows = benchmark_requests(args.scales, args.repeat, args.update_fixture)
+        columns = ['dataset', 'scale', 'requests', 'legacy_s', 'indexed_s', 'speedup', 'identical']
+        if any(row['identical'] is False for row in rows):
+            print_table(rows, columns)
+            sys.exit("Request generation diverged from the assignments in " + os.path.relpath(REQUESTS_FIXTURE, REPO_ROOT))
+    elif args.command == 'fill':
+        rows = benchmark_fill(args.scales, args.repeat)
+        columns = ['scale', 'batches', 'rooms', 'teachers', 'filled', 'legacy_s', 'vectorized_s', 'speedup', 'identical']
+    elif args.command == 'profiles':
+        datasets = [(os.path.relpath(path, REPO_ROOT), load_dataset(path)) for path in args.datasets]
+        datasets.append(('generate_sample_data', generated_dataset()))
+        rows = sweep_profiles(datasets, args.engine, args.workers, args.strategies,
+                              args.presolve, args.seeds, args.time_limit)
+        columns = ['dataset', 'workers', 'strategy', 'presolve', 'seed', 'first_feasible_s', 'solve_s', 'status']
+    elif args.command == 'engines':
+        rows = compare_engines(args.datasets, args.engines, args.time_limit)
+        columns = ['dataset', 'engine', 'requests', 'variables', 'constraints', 'build_s', 'solve_s', 'status']
+    else:
+        rows = benchmark_build(args.engines, args.scales)
+        columns = ['dataset', 'scale', 'engine', 'requests', 'variables', 'constraints', 'build_s']
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    elif args.csv:
+        writer = csv.DictWriter(sys.stdout, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        print_table(rows, columns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import subprocess
+import contextlib
+
+from serialization import dumps, loads, read_schedule
+from schedule_diff import diff_schedules, entry_key
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.environ.get('SCHEDULER_DB', os.path.join(REPO_ROOT, 'data.db'))
+DATA_JSON = os.path.join(REPO_ROOT, 'data.json')
+# 'sqlite' or 'json' forces the store open_store() picks, as it does for src/lib/db.ts
+STORE = os.environ.get('SCHEDULER_STORE')
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+# Schedule journal: every JOURNAL_COMPACT_EVERY saves, drop all but the last JOURNAL_KEEP revisions
+JOURNAL_KEEP = int(os.environ.get('SCHEDULER_JOURNAL_KEEP', 100))
+JOURNAL_COMPACT_EVERY = 20
+
+# What getInitialData() in src/lib/db.ts falls back to without a stored config
+DEFAULT_CONFIG = {'daysPerWeek': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'], 'slotsPerDay': 6}
+
+# Entity table -> its indexed columns, each copied from the entity field of the same name
+ENTITY_COLUMNS = {
+    'subjects': ['name', 'code', 'type'],
+    'teachers': ['name', 'department'],
+    'batches': ['name', 'department'],
+    'classrooms': ['name', 'type', 'capacity'],
+}
+# Membership lists mirrored into link tables: entity table -> (field, link table, owner column)
+LINKS = {
+    'teachers': ('qualifiedSubjects', 'qualifications', 'teacher_id'),
+    'batches': ('requiredSubjects', 'batch_subjects', 'batch_id'),
+}
+
+
+class DataStore:
+    """The app's data in SQLite (see schema.sql), shared with src/lib/db.ts.
+
+    Each change touches only its own rows, inside one transaction, instead
+    of rewriting all of data.json. The database runs in WAL mode, so
+    readers such as a running scheduler never block the app's writes, and
+    concurrent writers wait for each other (up to `timeout` seconds)
+    instead of overwriting each other's changes. A new, empty store imports
+    `seed` (data.json by default) so existing installs keep their data.
+    load() returns the data.json-shaped dict the scheduler takes as input.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, seed=DATA_JSON, timeout=5.0):
+        self.path = path
+        # Autocommit; transaction() opens the transactions explicitly
+        self.db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        self.db.execute('PRAGMA foreign_keys = ON')
+        with open(SCHEMA_FILE, 'r') as f:
+            self.db.executescript(f.read())
+        if seed and os.path.exists(seed) and self.is_empty():
+            with open(seed, 'r') as f:
+                self.import_data(loads(f.read()))
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # IMMEDIATE takes the write lock up front, so two writers queue on
+        # busy_timeout instead of failing when the second one upgrades
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.db
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+
+    def is_empty(self):
+        tables = [*ENTITY_COLUMNS, 'schedule_entries', 'settings']
+        return not any(self.db.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone() for table in tables)
+
+    # --- Reads ---
+
+    def entities(self, kind):
+        return [loads(doc) for (doc,) in self.db.execute(f'SELECT doc FROM {kind} ORDER BY rowid')]
+
+    def schedule(self):
+        return [loads(doc) for (doc,) in self.db.execute('SELECT doc FROM schedule_entries ORDER BY position')]
+
+    def config(self):
+        row = self.db.execute("SELECT value FROM settings WHERE key = 'config'").fetchone()
+        return loads(row[0]) if row else dict(DEFAULT_CONFIG)
+
+    def load(self):
+        """Everything, shaped like data.json: scheduler input, and what export writes."""
+        # One read transaction, so the parts come from the same snapshot
+        self.db.execute('BEGIN')
+        try:
+            data = {kind: self.entities(kind) for kind in ENTITY_COLUMNS}
+            data['config'] = self.config()
+            data['schedule'] = self.schedule()
+        finally:
+            self.db.execute('COMMIT')
+        return data
+
+    # --- Writes ---
+
+    def _upsert(self, kind, entities):
+        columns = ENTITY_COLUMNS[kind]
+        placeholders = ', '.join('?' * (len(columns) + 2))
+        updates = ', '.join(f'{column} = excluded.{column}' for column in [*columns, 'doc'])
+        # ON CONFLICT keeps the row (and its rowid, so its place in the list)
+        self.db.executemany(
+            f'INSERT INTO {kind} (id, {", ".join(columns)}, doc) VALUES ({placeholders}) '
+            f'ON CONFLICT (id) DO UPDATE SET {updates}',
+            [(entity['id'], *(entity.get(column) for column in columns), dumps(entity)) for entity in entities],
+        )
+        if kind in LINKS:
+            field, table, owner = LINKS[kind]
+            self.db.executemany(f'DELETE FROM {table} WHERE {owner} = ?', [(entity['id'],) for entity in entities])
+            self.db.executemany(
+                f'INSERT OR IGNORE INTO {table} ({owner}, subject_id) VALUES (?, ?)',
+                [(entity['id'], s_id) for entity in entities for s_id in entity.get(field) or []],
+            )
+
+    def upsert(self, kind, entities):
+        """Insert or replace entities of one kind ('teachers', ...) by id, all in one transaction."""
+        with self.transaction():
+            self._upsert(kind, entities)
+
+    def upsert_all(self, changes):
+        """upsert() for several kinds at once: changes maps kind -> entities, one transaction for all."""
+        with self.transaction():
+            for kind, entities in changes.items():
+                self._upsert(kind, entities)
+
+    def remove(self, kind, ids):
+        with self.transaction():
+            self.db.executemany(f'DELETE FROM {kind} WHERE id = ?', [(entity_id,) for entity_id in ids])
+
+    def set_config(self, config):
+        with self.transaction():
+            self.db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('config', ?)", (dumps(config),))
+
+    def _insert_entries(self, entries, start):
+        self.db.executemany(
+            'INSERT INTO schedule_entries (position, id, day, period, subject_id, teacher_id, classroom_id, doc) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(position, entry.get('id'), entry['day'], entry['period'], entry.get('subjectId'),
+              entry.get('teacherId'), entry.get('classroomId'), dumps(entry))
+             for position, entry in enumerate(entries, start)],
+        )
+        self.db.executemany(
+            'INSERT OR IGNORE INTO schedule_batches (batch_id, position) VALUES (?, ?)',
+            [(b_id, position) for position, entry in enumerate(entries, start) for b_id in entry.get('batchIds') or []],
+        )
+
+    def save_schedule(self, schedule):
+        """Bring the stored schedule to `schedule`, writing only what changed.
+
+        The changes (schedule_diff.diff_schedules against the stored
+        schedule) go to their own rows and are appended to schedule_journal
+        as one revision, in one transaction. Unchanged entries that the new
+        schedule numbers differently get the new ids without a revision, so
+        the stored schedule always equals `schedule`, ids included; an
+        identical schedule writes nothing. Returns the ScheduleDiff.
+        """
+        with self.transaction():
+            positions = {}
+            stored = []
+            for position, doc in self.db.execute('SELECT position, doc FROM schedule_entries ORDER BY position'):
+                entry = loads(doc)
+                positions[id(entry)] = position
+                stored.append(entry)
+            diff = diff_schedules(stored, schedule)
+            if not any(diff):
+                return diff
+
+            self.db.executemany('DELETE FROM schedule_entries WHERE position = ?',
+                                [(positions[id(entry)],) for entry in diff.removed])
+            # A move keeps the entry's batches, so its schedule_batches rows stay
+            self.db.executemany(
+                'UPDATE schedule_entries SET id = ?, day = ?, period = ?, subject_id = ?, teacher_id = ?, '
+                'classroom_id = ?, doc = ? WHERE position = ?',
+                [(new.get('id'), new['day'], new['period'], new.get('subjectId'), new.get('teacherId'),
+                  new.get('classroomId'), dumps(new), positions[id(old)]) for old, new in diff.moved],
+            )
+            self.db.executemany('UPDATE schedule_entries SET id = ?, doc = ? WHERE position = ?',
+                                [(new.get('id'), dumps(new), positions[id(old)]) for old, new in diff.rewritten])
+            (start,) = self.db.execute('SELECT COALESCE(MAX(position), -1) + 1 FROM schedule_entries').fetchone()
+            self._insert_entries(diff.inserted, start)
+            if not diff.changed:
+                return diff
+
+            revision = self.schedule_revision() + 1
+            self.db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('scheduleRevision', ?)",
+                            (str(revision),))
+            ops = ([('insert', entry_key(new), None, new) for new in diff.inserted]
+                   + [('remove', entry_key(old), old, None) for old in diff.removed]
+                   + [('move', entry_key(new), old, new) for old, new in diff.moved])
+            self.db.executemany(
+                'INSERT INTO schedule_journal (revision, op, batch_key, day, period, old_doc, new_doc) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(revision, op, *key, old and dumps(old), new and dumps(new)) for op, key, old, new in ops],
+            )
+            if revision % JOURNAL_COMPACT_EVERY == 0:
+                self._compact_journal(revision, JOURNAL_KEEP)
+        return diff
+
+    def schedule_revision(self):
+        """The last saved schedule_journal revision, 0 before the first save."""
+        row = self.db.execute("SELECT value FROM settings WHERE key = 'scheduleRevision'").fetchone()
+        return int(row[0]) if row else 0
+
+    def journal(self, since=0):
+        """Journal operations after revision `since`, oldest first, as dicts."""
+        rows = self.db.execute(
+            'SELECT revision, saved_at, op, old_doc, new_doc FROM schedule_journal WHERE revision > ? ORDER BY seq',
+            (since,),
+        )
+        return [{'revision': revision, 'savedAt': saved_at, 'op': op,
+                 'old': old_doc and loads(old_doc), 'new': new_doc and loads(new_doc)}
+                for revision, saved_at, op, old_doc, new_doc in rows]
+
+    def _compact_journal(self, revision, keep):
+        return self.db.execute('DELETE FROM schedule_journal WHERE revision <= ?', (revision - keep,)).rowcount
+
+    def compact_journal(self, keep=JOURNAL_KEEP):
+        """Drop all but the last `keep` revisions of the journal; returns the number of operations dropped.
+
+        The stored schedule is always current, so this only shortens the audit trail.
+        """
+        with self.transaction():
+            return self._compact_journal(self.schedule_revision(), keep)
+
+    def import_data(self, data):
+        """Replace everything with a data.json-shaped dict, in one transaction."""
+        with self.transaction():
+            for kind in ENTITY_COLUMNS:
+                self.db.execute(f'DELETE FROM {kind}')
+                self._upsert(kind, data.get(kind) or [])
+            self.db.execute('DELETE FROM settings')
+            if data.get('config') is not None:
+                self.db.execute("INSERT INTO settings (key, value) VALUES ('config', ?)", (dumps(data['config']),))
+            # A new schedule history starts here: the journal was about the old data
+            self.db.execute('DELETE FROM schedule_entries')
+            self.db.execute('DELETE FROM schedule_journal')
+            self._insert_entries(data.get('schedule') or [], 0)
+
+
+class JsonStore:
+    """The app's data in data.json, for when the app itself uses it (see app_uses_sqlite).
+
+    The same calls as DataStore, kept the way src/lib/db.ts falls back
+    without node:sqlite: every change reads the whole file and writes it
+    back. There is no schedule journal, so schedule_revision() is None.
+    """
+
+    def __init__(self, path=DATA_JSON):
+        self.path = path
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextlib.contextmanager
+    def _update(self):
+        data = self.load()
+        yield data
+        with open(self.path, 'w') as f:
+            f.write(json.dumps(data, indent=2))
+
+    @staticmethod
+    def empty_data():
+        return dict({kind: [] for kind in ENTITY_COLUMNS}, config=dict(DEFAULT_CONFIG), schedule=[])
+
+    def load(self):
+        data = self.empty_data()
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                data.update(loads(f.read()))
+        return data
+
+    def upsert(self, kind, entities):
+        self.upsert_all({kind: entities})
+
+    def upsert_all(self, changes):
+        with self._update() as data:
+            for kind, entities in changes.items():
+                index = {entity['id']: i for i, entity in enumerate(data[kind])}
+                for entity in entities:
+                    if entity['id'] in index:
+                        data[kind][index[entity['id']]] = entity
+                    else:
+                        index[entity['id']] = len(data[kind])
+                        data[kind].append(entity)
+
+    def remove(self, kind, ids):
+        ids = set(ids)
+        with self._update() as data:
+            data[kind] = [entity for entity in data[kind] if entity['id'] not in ids]
+
+    def set_config(self, config):
+        with self._update() as data:
+            data['config'] = config
+
+    def save_schedule(self, schedule):
+        """Replace the stored schedule; returns the ScheduleDiff against the old one."""
+        with self._update() as data:
+            diff = diff_schedules(data['schedule'], schedule)
+            data['schedule'] = schedule
+        return diff
+
+    def schedule_revision(self):
+        return None
+
+    def import_data(self, data):
+        """Replace everything with a data.json-shaped dict."""
+        with self._update() as stored:
+            stored.clear()
+            stored.update(self.empty_data(), **data)
+
+
+def app_uses_sqlite(node=None):
+    """Whether the app keeps its data in SQLite rather than data.json.
+
+    getDb() in src/lib/db.ts uses SQLite when the Node.js running the app
+    has node:sqlite (22.13+), unless SCHEDULER_STORE=json. This asks the
+    `node` on PATH (or `node`) the same question, so scripts write where the
+    app reads; set SCHEDULER_STORE when the app runs on another Node.js,
+    e.g. Electron's. Without a usable node it assumes SQLite.
+    """
+    if STORE:
+        return STORE != 'json'
+    probe = "try { process.exit(process.getBuiltinModule?.('node:sqlite') ? 0 : 1) } catch { process.exit(1) }"
+    try:
+        return subprocess.run([node or 'node', '-e', probe], capture_output=True, timeout=30).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return True
+
+
+def open_store(**kwargs):
+    """The store the app uses: a DataStore (kwargs go to it), or a JsonStore on data.json."""
+    return DataStore(**kwargs) if app_uses_sqlite() else JsonStore()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import data.json into the SQLite store, export it back, "
+                                                 "or save and inspect schedule revisions.")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="Database file (default: SCHEDULER_DB or data.db).")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_import = sub.add_parser('import', help="Replace the store's contents with a data.json file.")
+    p_import.add_argument('input', nargs='?', default=DATA_JSON)
+    p_export = sub.add_parser('export', help="Write the store's contents as data.json.")
+    p_export.add_argument('--output', '-o', default='-', help="Output file, '-' for stdout.")
+    p_save = sub.add_parser('save-schedule', help="Save scheduler output as a new revision of the stored schedule.")
+    p_save.add_argument('input', nargs='?', default='-', help="Schedule file, '-' for stdin.")
+    p_journal = sub.add_parser('journal', help="Print the schedule journal, one JSON operation per line.")
+    p_journal.add_argument('--since', type=int, default=0, help="Only revisions after this one.")
+    p_compact = sub.add_parser('compact', help="Drop all but the last revisions of the schedule journal.")
+    p_compact.add_argument('--keep', type=int, default=JOURNAL_KEEP)
+    args = parser.parse_args(argv)
+
+    if args.command == 'import':
+        with open(args.input, 'r') as f:
+            data = json.load(f)
+        with DataStore(args.db, seed=None) as store:
+            store.import_data(data)
+        counts = {key: len(value) for key, value in data.items() if isinstance(value, list)}
+        sys.stderr.write(f"Imported {json.dumps(counts)} into {args.db}\n")
+    elif args.command == 'save-schedule':
+        if args.input == '-':
+            schedule = read_schedule(sys.stdin.read())
+        else:
+            with open(args.input, 'r') as f:
+                schedule = read_schedule(f.read())
+        with DataStore(args.db) as store:
+            diff = store.save_schedule(schedule)
+            revision = store.schedule_revision()
+        if diff.changed:
+            sys.stderr.write(f"Revision {revision}: {len(diff.inserted)} inserted, {len(diff.removed)} removed, "
+                             f"{len(diff.moved)} moved\n")
+        else:
+            sys.stderr.write(f"Unchanged, still revision {revision}\n")
+    elif args.command == 'journal':
+        with DataStore(args.db, seed=None) as store:
+            for op in store.journal(args.since):
+                print(json.dumps(op))
+    elif args.command == 'compact':
+        with DataStore(args.db, seed=None) as store:
+            dropped = store.compact_journal(args.keep)
+        sys.stderr.write(f"Dropped {dropped} journal operations\n")
+    else:
+        with DataStore(args.db, seed=None) as store:
+            data = store.load()
+        text = json.dumps(data, indent=2)
+        if args.output == '-':
+            print(text)
+        else:
+            with open(args.output, 'w') as f:
+                f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
+import sys
 import json
+import math
 import random
-import os
+import argparse
 
 # Configuration for Guaranteed Feasibility
-OUTPUT_FILE = 'data.json'
 NUM_BATCHES = 10
 NUM_TEACHERS = 20 # INCREASED from 15
 NUM_CLASSROOMS = 12 # 10 Theory, 2 Labs
@@ -111,11 +112,162 @@ def generate_robust_data():
 
     return data
 
-if __name__ == "__main__":
-    data = generate_robust_data()
-    target_path = os.path.join(os.getcwd(), 'data.json')
-    
-    with open(target_path, 'w') as f:
+def generate_data(num_batches=NUM_BATCHES, num_teachers=None, num_classrooms=None, num_subjects=len(SUBJECTS),
+                  qualification=0.1, load=0.8, departments=1, seed=0):
+    """A synthetic dataset of any size, reproducible from `seed`.
+
+    Every batch takes all subjects of its department, so num_subjects bounds
+    the weekly hours per batch (about 3 credits each against a 40-slot week).
+    qualification is the chance that a teacher can also teach each other
+    subject of their department. load is how tight the week is: the share of
+    teacher hours, and of room slots, that the timetable needs. Teacher and
+    room counts default to what that tightness asks for; when given, the
+    teachers' weekly caps are sized to it instead.
+    """
+    rng = random.Random(seed)
+    total_slots = len(DAYS) * SLOTS_PER_DAY
+    dept_names = [f"Dept {d + 1}" for d in range(departments)]
+
+    # 1. Subjects: the SUBJECTS mix (one Lab in six) repeated per department
+    subjects = []
+    dept_subjects = {dept: [] for dept in dept_names}
+    subject_dept = {}
+    for d, dept in enumerate(dept_names):
+        for k in range(num_subjects):
+            template = SUBJECTS[k % len(SUBJECTS)]
+            subject = {
+                "id": f"sub_{d + 1}_{k + 1}",
+                "name": f"{template['name']} {k // len(SUBJECTS) + 1} ({dept})",
+                "code": f"{template['code']}-{d + 1}{k + 1:02d}",
+                "type": template['type'],
+                "credits": template['credits'] if template['type'] == "Lab" else rng.choice([2, 3, 4]),
+            }
+            subjects.append(subject)
+            dept_subjects[dept].append(subject)
+            subject_dept[subject['id']] = dept
+
+    # 2. Batches, spread round-robin over the departments
+    batches = []
+    for i in range(num_batches):
+        dept = dept_names[i % departments]
+        batches.append({
+            "id": f"batch_{i + 1}",
+            "name": f"Batch {i + 1}",
+            "size": rng.randint(30, 60),
+            "department": dept,
+            "requiredSubjects": [s['id'] for s in dept_subjects[dept]],
+        })
+
+    # Weekly hours each subject needs across its batches
+    demand = {s['id']: 0 for s in subjects}
+    credits = {s['id']: s['credits'] for s in subjects}
+    for batch in batches:
+        for s_id in batch['requiredSubjects']:
+            demand[s_id] += credits[s_id]
+    taught = [s for s in subjects if demand[s['id']]]
+
+    # 3. Teachers: hired per subject in proportion to its hours
+    max_week = 20
+    if num_teachers is None:
+        counts = {s['id']: math.ceil(demand[s['id']] / (max_week * load)) for s in taught}
+    else:
+        total = sum(demand.values()) or 1
+        counts = {s['id']: max(1, math.floor(num_teachers * demand[s['id']] / total)) for s in taught}
+        # Hand out what rounding left over to the busiest subjects per head
+        while sum(counts.values()) < num_teachers and counts:
+            busiest = max(counts, key=lambda s_id: demand[s_id] / counts[s_id])
+            counts[busiest] += 1
+
+    # One weekly cap per department, sized for its busiest subject: teachers
+    # also take classes of their secondary subjects, so caps must not differ
+    week_caps = {}
+    for subject in taught:
+        share = demand[subject['id']] / counts[subject['id']]
+        dept = subject_dept[subject['id']]
+        week_caps[dept] = max(week_caps.get(dept, 1), math.ceil(share / load))
+
+    teachers = []
+    for subject in taught:
+        dept = subject_dept[subject['id']]
+        week = week_caps[dept]
+        for _ in range(counts[subject['id']]):
+            qualified = [subject['id']] + [s['id'] for s in dept_subjects[dept]
+                                           if s is not subject and rng.random() < qualification]
+            teachers.append({
+                "id": f"teacher_{len(teachers) + 1}",
+                "name": f"Teacher {len(teachers) + 1}",
+                "department": dept,
+                "qualifiedSubjects": qualified,
+                "maxLoadPerDay": min(SLOTS_PER_DAY, math.ceil(week / len(DAYS)) + 1),
+                "maxLoadPerWeek": week,
+                "isAbsent": False,
+            })
+
+    # 4. Classrooms: enough room-slots per type for the same tightness
+    sessions = {"Theory": 0, "Lab": 0}
+    for subject in subjects:
+        sessions[subject['type']] += demand[subject['id']]
+    if num_classrooms is None:
+        rooms = {kind: math.ceil(n / (total_slots * load)) for kind, n in sessions.items()}
+    else:
+        labs = 0
+        if sessions["Lab"]:
+            labs = min(num_classrooms - 1, max(1, round(num_classrooms * sessions["Lab"] / sum(sessions.values()))))
+        rooms = {"Theory": num_classrooms - labs, "Lab": labs}
+
+    classrooms = []
+    for i in range(rooms["Theory"]):
+        classrooms.append({"id": f"room_{i + 1}", "name": f"Room {101 + i}", "capacity": 60, "type": "Theory"})
+    for i in range(rooms["Lab"]):
+        classrooms.append({"id": f"lab_{i + 1}", "name": f"Lab {i + 1}", "capacity": 60, "type": "Lab"})
+
+    return {
+        "teachers": teachers,
+        "classrooms": classrooms,
+        "subjects": subjects,
+        "batches": batches,
+        "config": {
+            "daysPerWeek": DAYS,
+            "slotsPerDay": SLOTS_PER_DAY,
+            "breakAfter": BREAK_AFTER
+        },
+        "schedule": []
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic scheduler dataset.")
+    parser.add_argument('--batches', type=int, default=NUM_BATCHES)
+    parser.add_argument('--teachers', type=int, help="Default: as many as --load asks for.")
+    parser.add_argument('--classrooms', type=int, help="Default: as many as --load asks for.")
+    parser.add_argument('--subjects', type=int, default=len(SUBJECTS), help="Subjects per department.")
+    parser.add_argument('--departments', type=int, default=1)
+    parser.add_argument('--qualification', type=float, default=0.1,
+                        help="Chance a teacher also teaches each other subject of their department.")
+    parser.add_argument('--load', type=float, default=0.8,
+                        help="Share of teacher hours and room slots the timetable needs (1.0 = no slack).")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--robust', action='store_true',
+                        help="The fixed 10-batch dataset instead (ignores the size options).")
+    parser.add_argument('--output', '-o', default='-', help="File to write; default stdout.")
+    args = parser.parse_args(argv)
+
+    if args.robust:
+        random.seed(args.seed)
+        data = generate_robust_data()
+    else:
+        data = generate_data(args.batches, args.teachers, args.classrooms, args.subjects,
+                             args.qualification, args.load, args.departments, args.seed)
+
+    if args.output == '-':
+        json.dump(data, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return
+    with open(args.output, 'w') as f:
         json.dump(data, f, indent=2)
-    
-    print(f"Generated ROBUST sample data at {target_path}")
+    sys.stderr.write(f"Generated {len(data['batches'])} batches, {len(data['teachers'])} teachers and "
+                     f"{len(data['classrooms'])} classrooms at {args.output}\n")
+
+
+if __name__ == "__main__":
+    main()
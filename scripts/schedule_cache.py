@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import hashlib
+import tempfile
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'SCHEDULER_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.scheduler_cache'),
+)
+DEFAULT_MAX_BYTES = int(os.environ.get('SCHEDULER_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+
+# Fields that can change the solver's output. Everything else on an entity
+# (name, code, ...) is display-only and left out of the cache key.
+SOLVER_FIELDS = {
+    'teachers': ['id', 'department', 'qualifiedSubjects', 'maxLoadPerDay', 'maxLoadPerWeek',
+                 'preferredSlots', 'unavailableSlots', 'isAbsent'],
+    'classrooms': ['id', 'capacity', 'type'],
+    'subjects': ['id', 'type', 'credits', 'requiredBatches'],
+    'batches': ['id', 'size', 'department', 'requiredSubjects'],
+}
+# Membership lists: only used with `in`, so their order is irrelevant
+SET_FIELDS = {'qualifiedSubjects', 'requiredBatches', 'requiredSubjects'}
+
+
+def canonical_input(data, options):
+    """Reduce scheduler input to the parts that affect the result."""
+    canonical = {'options': options, 'config': data.get('config')}
+    for key, fields in SOLVER_FIELDS.items():
+        entities = []
+        for entity in data.get(key, []):
+            reduced = {}
+            for field in fields:
+                if entity.get(field) is None:
+                    continue
+                value = entity[field]
+                reduced[field] = sorted(value) if field in SET_FIELDS else value
+            entities.append(reduced)
+        # List order is kept: it drives request numbering and tie-breaks
+        canonical[key] = entities
+    if options.get('incremental'):
+        canonical['schedule'] = data.get('schedule') or []
+    return canonical
+
+
+def input_hash(data, options):
+    payload = json.dumps(canonical_input(data, options), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ScheduleCache:
+    """On-disk schedule cache keyed by input hash, evicting least recently used files by total size."""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                schedule = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        # Touch so eviction sees this entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass  # evicted by another worker since it was read
+        self.hits += 1
+        return schedule
+
+    def put(self, key, schedule):
+        """Store a schedule; a failed write is logged, never raised, so it cannot fail the solve."""
+        tmp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # A unique temp file per writer: two workers may finish the same input at once
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f"{key}.", suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(schedule, f)
+            os.replace(tmp_path, self._path(key))
+            tmp_path = None
+        except OSError as e:
+            sys.stderr.write(f"Cache write failed: {e}\n")
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        self.evict()
+
+    def evict(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError as e:
+            sys.stderr.write(f"Cache eviction failed: {e}\n")
+            return
+        entries = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def report(self, outcome):
+        sys.stderr.write(f"Cache {outcome} (hits={self.hits}, misses={self.misses}).\n")
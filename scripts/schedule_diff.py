@@ -0,0 +1,113 @@
+from collections import namedtuple
+
+# Fields that make two entries the same class in the same place; 'id' is left
+# out because every solve numbers its entries afresh
+ENTRY_FIELDS = ('subjectId', 'teacherId', 'classroomId', 'batchIds', 'day', 'period')
+
+
+class ScheduleDiff(namedtuple('ScheduleDiff', ['inserted', 'removed', 'moved', 'rewritten'])):
+    """inserted, removed: [entry]; moved: [(old entry, new entry)].
+
+    rewritten: [(old entry, new entry)] of unchanged entries that are not
+    equal as stored, in practice because the id differs. They are not
+    changes to the timetable, but storing the new schedule must still give
+    them the new ids: a re-solve numbers entries afresh and can hand an
+    unchanged entry the id a moved one had before.
+    """
+    __slots__ = ()
+
+    @property
+    def changed(self):
+        """Whether the timetable itself changed, not just how its entries are stored."""
+        return bool(self.inserted or self.removed or self.moved)
+
+
+def batch_key(entry):
+    """The entry's batches as one string, the same whatever order batchIds lists them in."""
+    return ','.join(sorted(entry.get('batchIds') or []))
+
+
+def entry_key(entry):
+    """(batches, day, period): where the entry sits in its batches' timetables."""
+    return batch_key(entry), entry['day'], entry['period']
+
+
+def same_entry(a, b):
+    return all(a.get(field) == b.get(field) for field in ENTRY_FIELDS if field != 'batchIds') and \
+        batch_key(a) == batch_key(b)
+
+
+def diff_schedules(old, new):
+    """What turns schedule `old` into `new`, keyed by (batch, day, period).
+
+    An entry of `new` with an identical entry at its key in `old` is
+    unchanged, and rewritten if it differs from that entry as stored (its
+    id or batchIds order). Of the rest, an old and a new entry of the same
+    batches and subject are paired as moved: the class went to another
+    slot, room or teacher. Unpaired new entries are inserted, unpaired old ones removed.
+    Pairs are made in schedule order, so the diff is deterministic.
+    """
+    old_by_key = {}
+    for entry in old:
+        old_by_key.setdefault(entry_key(entry), []).append(entry)
+
+    added = []
+    rewritten = []
+    for entry in new:
+        candidates = old_by_key.get(entry_key(entry), [])
+        # An exact copy first, so rewrites are only made where needed
+        match = next((i for i, candidate in enumerate(candidates) if candidate == entry), None)
+        if match is None:
+            match = next((i for i, candidate in enumerate(candidates) if same_entry(candidate, entry)), None)
+        if match is None:
+            added.append(entry)
+            continue
+        old_entry = candidates.pop(match)
+        if old_entry != entry:
+            rewritten.append((old_entry, entry))
+    dropped = [entry for entries in old_by_key.values() for entry in entries]
+
+    by_class = {}
+    for entry in dropped:
+        by_class.setdefault((batch_key(entry), entry.get('subjectId')), []).append(entry)
+    inserted = []
+    moved = []
+    for entry in added:
+        sources = by_class.get((batch_key(entry), entry.get('subjectId')))
+        if sources:
+            moved.append((sources.pop(0), entry))
+        else:
+            inserted.append(entry)
+    moved_from = {id(old_entry) for old_entry, _ in moved}
+    removed = [entry for entry in dropped if id(entry) not in moved_from]
+    return ScheduleDiff(inserted, removed, moved, rewritten)
+
+
+def apply_diff(schedule, diff):
+    """Patch `schedule` with a diff_schedules() result; returns a new list.
+
+    Entries are found by key and content, not identity, so a diff applies
+    to any copy of the schedule it was computed from. Moved and rewritten
+    entries are replaced in place and inserted ones appended: the result
+    holds exactly the entries of the new schedule, ids included, though not
+    necessarily in its order. Raises ValueError for an entry to remove
+    or move that is not there.
+    """
+    patched = list(schedule)
+    at_key = {}
+    for i, entry in enumerate(patched):
+        at_key.setdefault(entry_key(entry), []).append(i)
+    touched = set()
+
+    def locate(entry):
+        for i in at_key.get(entry_key(entry), []):
+            if i not in touched and same_entry(patched[i], entry):
+                touched.add(i)
+                return i
+        raise ValueError(f"No entry for {entry_key(entry)} in the schedule")
+
+    for entry in diff.removed:
+        patched[locate(entry)] = None
+    for old_entry, new_entry in diff.moved + diff.rewritten:
+        patched[locate(old_entry)] = new_entry
+    return [entry for entry in patched if entry is not None] + list(diff.inserted)
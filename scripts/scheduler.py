@@ -1,393 +1,2838 @@
+import os
 import sys
 import json
+import math
+import time
+import random
+import heapq
+import bisect
+import functools
+import itertools
+import argparse
+import concurrent.futures
+from collections import Counter, namedtuple
+import numpy as np
 from ortools.sat.python import cp_model
 
-def solve_schedule(data):
-    # Unpack data
-    teachers = data.get('teachers', [])
-    classrooms = data.get('classrooms', [])
-    subjects = data.get('subjects', [])
-    batches = data.get('batches', [])
-    config = data.get('config', {'slotsPerDay': 6, 'daysPerWeek': ['Mon', 'Tue', 'Wed', 'Thu', 'Fri']})
+from schedule_cache import ScheduleCache, input_hash
+from solve_profiler import PROFILER
+from data_store import DEFAULT_DB_PATH, DataStore
+from serialization import INPUT_FORMATS, OUTPUT_FORMATS, decode, dumps, read_frames, write_schedule
 
-    days = config['daysPerWeek']
-    slots_per_day = config['slotsPerDay']
-    total_slots = len(days) * slots_per_day
+DEFAULT_CONFIG = {'slotsPerDay': 6, 'daysPerWeek': ['Mon', 'Tue', 'Wed', 'Thu', 'Fri']}
+
+# Engine modes selectable through config['engine'] or --engine.
+# 'boolean' : one BoolVar per request x day x period x room (original model)
+# 'compact' : one slot IntVar + one room IntVar per request
+# 'decomposed' : time-only model, rooms matched per slot after solving
+# 'joint' : decomposed, with the teacher of each (batch, subject) chosen by the solver
+# 'greedy' : DSATUR heuristic only, no solver (see greedy_schedule)
+DEFAULT_ENGINE = 'boolean'
+GREEDY_ENGINE = 'greedy'
+
+# CP-SAT settings, overridable through config['solver'] or CLI flags.
+# workers  : parallel search workers (0 = one per core)
+# timeLimit: seconds
+# seed     : random seed (None = solver default)
+# presolve : 0 = off, 1 = presolve without probing, 2 = full
+# strategy : CP-SAT search branching, e.g. automatic, fixed, portfolio, lp, pseudo_cost
+# processes: solver processes when decomposing (0 = one per core)
+DEFAULT_SOLVER_PROFILE = {
+    'workers': 0,
+    'timeLimit': 30.0,
+    'seed': None,
+    'presolve': 2,
+    'strategy': 'automatic',
+    'processes': 0,
+}
+
+# Soft-constraint penalty weights, overridable through config['penaltyWeights'].
+# consecutive   : each class beyond MAX_CONSECUTIVE in a row without a break (batches and teachers)
+# teacherGaps   : each idle period between a teacher's first and last class of a day
+# dailyLoad     : each class above an even spread of the week over the days (batches and teachers)
+# preferredSlots: each class outside its teacher's preferredSlots (teachers that list any)
+# subjectSpread : each session of a subject above an even spread over the days (per batch)
+DEFAULT_PENALTY_WEIGHTS = {
+    'consecutive': 3,
+    'teacherGaps': 1,
+    'dailyLoad': 2,
+    'preferredSlots': 1,
+    'subjectSpread': 2,
+}
+MAX_CONSECUTIVE = 2
+# Seconds of local search when softConstraints is on and localSearch is unset.
+# CP-SAT's objective alone barely moves from the greedy hint on a typical
+# time limit (data.json: 331 -> 155 weighted penalty with 1s of local search).
+SOFT_LOCAL_SEARCH = 2
+
+# Where a request sat in the previous schedule (incremental mode).
+# fixed=True pins it there; otherwise it is only a solver hint.
+Placement = namedtuple('Placement', ['d_idx', 'p_idx', 'room_id', 'fixed'])
+
+
+class InfeasibleInput(ValueError):
+    """No timetable exists for the input; report explains why (see check_feasibility)."""
+
+    def __init__(self, report):
+        super().__init__(f"No feasible timetable: {report['summary']}")
+        self.report = report
+
+
+class TeacherPool:
+    """Least-loaded teacher lookup over fixed candidate groups.
+
+    Each group (teachers qualified for a subject, or teachers of a
+    department) keeps a heap of (load, id, seq, teacher). Loads only grow, so
+    when a teacher's load changes a fresh entry is pushed to each of its
+    groups and outdated entries are dropped lazily when they reach the top.
+    Picking is O(log n) instead of a sort of the whole group.
+    """
+
+    def __init__(self, teachers):
+        self.seq = itertools.count() # never compare the teacher dicts
+        self.load = {}
+        self.groups = {}
+        self.members = {}
+        self.groups_of = {}
+        self.candidate_cache = {}
+        self.order = {}
+        for t in teachers:
+            self.order.setdefault(t['id'], len(self.order))
+            self.load.setdefault(t['id'], 0)
+            keys = {('subject', s_id) for s_id in t.get('qualifiedSubjects', [])}
+            keys.add(('department', t.get('department')))
+            for key in keys:
+                self.groups.setdefault(key, []).append((0, t['id'], next(self.seq), t))
+                self.members.setdefault(key, {})[t['id']] = t
+            self.groups_of.setdefault(t['id'], set()).update(keys)
+        for heap in self.groups.values():
+            heapq.heapify(heap)
+
+    def has(self, key):
+        return key in self.groups
+
+    def candidates(self, key):
+        """Every teacher of a group, in input order (shared tuple per group)."""
+        if key not in self.candidate_cache:
+            members = self.members[key]
+            self.candidate_cache[key] = tuple(sorted(members.values(), key=lambda t: self.order[t['id']]))
+        return self.candidate_cache[key]
+
+    def member(self, key, t_id):
+        return self.members.get(key, {}).get(t_id)
+
+    def least_loaded(self, key):
+        heap = self.groups[key]
+        while heap[0][0] != self.load[heap[0][1]]:
+            heapq.heappop(heap)
+        return heap[0][3]
+
+    def least_loaded_within_cap(self, key, credits):
+        """Least-loaded teacher whose maxLoadPerWeek still admits `credits` more.
+
+        Falls back to the plain least-loaded teacher when nobody has room.
+        """
+        teacher = self.least_loaded(key)
+        if self.fits(teacher, credits):
+            return teacher
+        # Rare path: walk the group in (load, id) order
+        for t in sorted(self.members[key].values(), key=lambda t: (self.load[t['id']], t['id'])):
+            if self.fits(t, credits):
+                return t
+        return teacher
+
+    def fits(self, teacher, credits):
+        cap = teacher.get('maxLoadPerWeek')
+        return not cap or self.load[teacher['id']] + credits <= cap
+
+    def add_load(self, t_id, credits):
+        self.load[t_id] += credits
+        if not credits:
+            return
+        for key in self.groups_of[t_id]:
+            t = self.members[key][t_id]
+            heapq.heappush(self.groups[key], (self.load[t_id], t_id, next(self.seq), t))
 
-    # 1. Prepare Data
-    # Map IDs to objects for easy lookup
-    teacher_map = {t['id']: t for t in teachers}
-    room_map = {r['id']: r for r in classrooms}
-    subject_map = {s['id']: s for s in subjects}
-    batch_map = {b['id']: b for b in batches}
 
+def generate_requests(teachers, subjects, batches, preferred_teachers=None):
     # Generate Class Instances (Requests)
     # A "Class Instance" is one specific occurrence of a subject being taught to a batch
     requests = []
-    
+
     # Simple logic: Each batch takes each subject it is required to take.
     # We need to deduce this.
     # For MVP: Iterate all batches, and for each batch, iterate all subjects.
     # If subject.requiredBatches is empty OR contains batch.id, assume it's needed.
-    
+
     req_id_counter = 0
     teacher_assigned_load = {} # Track assigned credits to balance load
-    
+
+    # Absent teachers are never assigned
+    teachers = [t for t in teachers if not t.get('isAbsent')]
+
+    # subject -> qualified teachers and department -> teachers, built once
+    pool = TeacherPool(teachers)
+    required_batches = {s['id']: set(s['requiredBatches']) for s in subjects if s.get('requiredBatches')}
+
     for batch in batches:
+        required_subjects = set(batch.get('requiredSubjects') or [])
         for subject in subjects:
             # Check if this batch takes this subject
             # MODIFICATION: Check batch['requiredSubjects'] if present
-            if batch.get('requiredSubjects') and subject['id'] not in batch['requiredSubjects']:
+            if required_subjects and subject['id'] not in required_subjects:
                 continue
 
-            if subject.get('requiredBatches') and batch['id'] not in subject['requiredBatches']:
+            if subject['id'] in required_batches and batch['id'] not in required_batches[subject['id']]:
                 continue
-            
-            # Logic: If subject has no 'requiredBatches', does it mean ALL batches take it? 
-            # Or none? Let's assume if array exists and is not empty, it's specific. 
+
+            # Logic: If subject has no 'requiredBatches', does it mean ALL batches take it?
+            # Or none? Let's assume if array exists and is not empty, it's specific.
             # If empty/undefined, maybe it's general? Let's stick to: if array exists, check it.
-            # If it doesn't exist, we might skip or include. 
+            # If it doesn't exist, we might skip or include.
             # Safer assumption for School: explicitly linked.
-            # But earlier TS code assumed "Each Batch takes ALL Subjects", so let's stick to that for parity 
+            # But earlier TS code assumed "Each Batch takes ALL Subjects", so let's stick to that for parity
             # unless specific fields exist.
-            
+
             # Finding a teacher
-            # Filter teachers who can teach this subject
-            qualified_teachers = [t for t in teachers if subject['id'] in t.get('qualifiedSubjects', [])]
-            
+            # Teachers who can teach this subject
+            group = ('subject', subject['id'])
+
             # Fallback: if no qualified teacher, pick one from same department
-            if not qualified_teachers:
-                qualified_teachers = [t for t in teachers if t.get('department') == batch.get('department')]
-            
+            if not pool.has(group):
+                group = ('department', batch.get('department'))
+
+            credits = subject.get('credits', 1)
+
             # Fallback: pick any teacher
-            if not qualified_teachers:
-                if teachers: # Assign first teacher available
-                     qualified_teachers = [teachers[0]]
-                else: 
-                     continue # Impossible to schedule without teachers
-
-            # Load Balancing: Pick the teacher with the least current load
-            # Sort by load (asc), then by ID (consistent tie-break)
-            qualified_teachers.sort(key=lambda t: (teacher_assigned_load.get(t['id'], 0), t['id']))
-            assigned_teacher = qualified_teachers[0]
-            
+            if pool.has(group):
+                # Load Balancing: Pick the teacher with the least current load
+                # (ties broken by ID for consistency), skipping teachers that
+                # would go over maxLoadPerWeek
+                assigned_teacher = pool.least_loaded_within_cap(group, credits)
+                candidates = pool.candidates(group)
+            elif teachers: # Assign first teacher available
+                assigned_teacher = teachers[0]
+                candidates = (teachers[0],)
+                group = None
+            else:
+                continue # Impossible to schedule without teachers
+
+            # Incremental re-plans keep the previous teacher while still eligible
+            if preferred_teachers:
+                preferred_id = preferred_teachers.get((batch['id'], subject['id']))
+                preferred = pool.member(group, preferred_id) if group else (
+                    assigned_teacher if preferred_id == assigned_teacher['id'] else None)
+                if preferred and not preferred.get('isAbsent'):
+                    assigned_teacher = preferred
+
             # Update load
-            credits = subject.get('credits', 1)
+            pool.add_load(assigned_teacher['id'], credits)
             teacher_assigned_load[assigned_teacher['id']] = teacher_assigned_load.get(assigned_teacher['id'], 0) + credits
 
     # Create requests based on credits/hours
-            credits = subject.get('credits', 1)
             for _ in range(credits):
                 requests.append({
                     'id': req_id_counter,
                     'batch_id': batch['id'],
                     'subject_id': subject['id'],
                     'teacher_id': assigned_teacher['id'],
+                    # Everyone who could teach it, for engines that choose the teacher themselves
+                    'candidate_teachers': candidates,
                     'type': subject.get('type', 'Theory'),
                     'duration': 1 # Assuming 1 slot
                 })
                 req_id_counter += 1
 
-    sys.stderr.write(f"Generated {len(requests)} requests.\n")
-    sys.stderr.write(f"Teacher Load: {json.dumps(teacher_assigned_load)}\n")
+    for teacher in teachers:
+        cap = teacher.get('maxLoadPerWeek')
+        if cap and teacher_assigned_load.get(teacher['id'], 0) > cap:
+            sys.stderr.write(f"Warning: {teacher['id']} has {teacher_assigned_load[teacher['id']]} sessions, "
+                             f"above maxLoadPerWeek {cap}; no qualified teacher has room for the rest\n")
 
-    # 2. Model
+    return requests, teacher_assigned_load
+
+
+def available_slots(teacher, days, slots_per_day):
+    """Slot numbers (d_idx * slotsPerDay + p_idx) the teacher can be placed in."""
+    if teacher.get('isAbsent'):
+        return []
+    day_index = {day: d_idx for d_idx, day in enumerate(days)}
+    blocked = {
+        day_index[s['day']] * slots_per_day + s['period'] - 1
+        for s in teacher.get('unavailableSlots') or []
+        if s.get('day') in day_index and 1 <= s.get('period', 0) <= slots_per_day
+    }
+    return [slot for slot in range(len(days) * slots_per_day) if slot not in blocked]
+
+
+def preferred_slots(teacher, days, slots_per_day):
+    """Slot numbers the teacher lists in preferredSlots (empty when none are given)."""
+    day_index = {day: d_idx for d_idx, day in enumerate(days)}
+    return {
+        day_index[s['day']] * slots_per_day + s['period'] - 1
+        for s in teacher.get('preferredSlots') or []
+        if s.get('day') in day_index and 1 <= s.get('period', 0) <= slots_per_day
+    }
+
+
+def request_teachers(requests, days, slots_per_day):
+    """Every teacher a request may go to: t_id -> (teacher, set of available slots)."""
+    teachers = {}
+    seen = set() # candidate tuples are shared per teacher group
+    for req in requests:
+        if id(req['candidate_teachers']) in seen:
+            continue
+        seen.add(id(req['candidate_teachers']))
+        for t in req['candidate_teachers']:
+            if t['id'] not in teachers:
+                teachers[t['id']] = (t, set(available_slots(t, days, slots_per_day)))
+    return teachers
+
+
+def session_groups(requests, aggregate=True):
+    """Requests that are modelled as one unit, as lists of r_idx.
+
+    Each credit of a subject is a separate request, so a k-credit subject
+    has k! equivalent placements. With aggregate=True the sessions of one
+    (batch, subject, teacher) form a single group that is placed k times,
+    which leaves exactly one of them. Otherwise every request is its own group.
+    """
+    if not aggregate:
+        return [[r_idx] for r_idx in range(len(requests))]
+    groups = {}
+    for r_idx, req in enumerate(requests):
+        groups.setdefault((req['batch_id'], req['subject_id'], req['teacher_id']), []).append(r_idx)
+    return list(groups.values())
+
+
+class InternedInput:
+    """Dense integer view of the requests that every engine builds on.
+
+    Batches, subjects and teachers are numbered in first-seen request order
+    and rooms in classrooms order; batch_ids, subject_ids, teacher_ids and
+    room_ids map a number back to the original id, which only the output
+    stage needs. Per request r_idx:
+      req_batch, req_subject, req_teacher: int32 arrays of those numbers
+      req_rooms: compatible room numbers (see compatible_rooms), one tuple
+                 shared by every request of the same type and batch size
+    available is a bool matrix teacher number x slot, and teachers the
+    request_teachers() dict the id-keyed helpers take. groups is
+    session_groups() of the requests.
+    """
+
+    __slots__ = ('days', 'slots_per_day', 'total_slots', 'batch_ids', 'subject_ids', 'teacher_ids', 'room_ids',
+                 'room_index', 'req_batch', 'req_subject', 'req_teacher', 'req_rooms', 'teachers', 'available',
+                 'groups')
+
+    def __init__(self, requests, batch_map, classrooms, config):
+        self.days = config['daysPerWeek']
+        self.slots_per_day = config['slotsPerDay']
+        self.total_slots = len(self.days) * self.slots_per_day
+
+        self.room_ids = [room['id'] for room in classrooms]
+        self.room_index = {room_id: i for i, room_id in enumerate(self.room_ids)}
+
+        self.teachers = request_teachers(requests, self.days, self.slots_per_day)
+        self.teacher_ids = list(self.teachers)
+        self.available = np.zeros((len(self.teachers), self.total_slots), dtype=bool)
+        for t, (_, slots) in enumerate(self.teachers.values()):
+            self.available[t, sorted(slots)] = True
+
+        batch_index = {}
+        subject_index = {}
+        for req in requests:
+            batch_index.setdefault(req['batch_id'], len(batch_index))
+            subject_index.setdefault(req['subject_id'], len(subject_index))
+        self.batch_ids = list(batch_index)
+        self.subject_ids = list(subject_index)
+        teacher_index = {t_id: t for t, t_id in enumerate(self.teacher_ids)}
+        self.req_batch = np.fromiter((batch_index[req['batch_id']] for req in requests), np.int32, len(requests))
+        self.req_subject = np.fromiter((subject_index[req['subject_id']] for req in requests), np.int32, len(requests))
+        self.req_teacher = np.fromiter((teacher_index[req['teacher_id']] for req in requests), np.int32, len(requests))
+
+        # Compatible rooms once per (type, batch size), vectorized over the rooms
+        room_types = np.array([room.get('type', 'Theory') for room in classrooms])
+        capacities = np.array([room.get('capacity', 0) for room in classrooms])
+        room_lists = {}
+        self.req_rooms = []
+        for req in requests:
+            key = (req['type'], batch_map[req['batch_id']].get('size', 0))
+            if key not in room_lists:
+                fits = np.flatnonzero((room_types == key[0]) & (capacities >= key[1]))
+                room_lists[key] = tuple(fits.tolist()) or tuple(range(len(classrooms)))
+            self.req_rooms.append(room_lists[key])
+
+        self.groups = session_groups(requests, config.get('symmetryBreaking', True))
+
+    def teacher_slots(self, t):
+        """Slot numbers teacher number t is available in, ascending."""
+        return np.flatnonzero(self.available[t]).tolist()
+
+
+class VariableNames:
+    """Side table of a lean model (config['leanModel']): variable index -> name.
+
+    Lean builders create their per-slot variables without a name, which
+    keeps the string formatting out of the build loop and the strings out
+    of the proto (an unnamed variable shows up as its index, e.g. b1234).
+    A group's variables have consecutive indexes, so the table only records
+    where each group's run starts; name(index) finds the run and asks the
+    builder's namer(g_idx, offset) for the name the variable would have had.
+    Builders attach it as model.variable_names.
+    """
+
+    __slots__ = ('starts', 'runs', 'namer')
+
+    def __init__(self, namer):
+        self.starts = []
+        self.runs = []
+        self.namer = namer
+
+    def add_run(self, key, first_index):
+        self.starts.append(first_index)
+        self.runs.append(key)
+
+    def name(self, index):
+        """Name of variable `index`, None when it belongs to no recorded run."""
+        pos = bisect.bisect_right(self.starts, index) - 1
+        if pos < 0:
+            return None
+        return self.namer(self.runs[pos], index - self.starts[pos])
+
+
+def add_daily_load_caps(model, vars_by_teacher_day, teachers, sessions):
+    """maxLoadPerDay: a teacher's placement vars summed per day stay under the cap.
+
+    vars_by_teacher_day maps (t_id, d_idx) -> [var]. Teachers with no more
+    sessions in the week than their daily cap are skipped; it cannot bind.
+    """
+    for (t_id, d_idx), day_vars in vars_by_teacher_day.items():
+        per_day = teachers[t_id][0].get('maxLoadPerDay')
+        if per_day and sessions[t_id] > per_day:
+            model.Add(sum(day_vars) <= per_day)
+
+
+def add_penalty_terms(model, config, occupancy, pair_days, teachers):
+    """Soft-constraint penalty counts over BoolVar occupancy, as {term: [var]}.
+
+    occupancy maps ('b' | 't', id) -> (sessions, {slot: [BoolVar]}) for
+    batches and teachers, at most one var true per slot; sessions is None
+    when it is not known up front (no dailyLoad term then). pair_days maps
+    (b_id, s_id) -> (sessions, {d_idx: [BoolVar]}); teachers is
+    request_teachers(). Each penalty var is only bounded from below, so the
+counts match LocalSearch.breakdown at an optimum; an intermediate
+solution may overstate them (report LocalSearch.total for those).
+
+    Penalty variables are only created where they can be non-zero: windows
+    whose three slots all have vars, periods between two possible classes,
+    days that can hold more than their even share. Terms with weight 0 are
+    not built at all. Where the occupancy is hinted, so are the penalty
+    variables, which keeps a complete warm start complete.
+    """
+    weights = penalty_weights(config)
+    days = config['daysPerWeek']
+    slots_per_day = config['slotsPerDay']
+    break_after = config.get('breakAfter', 4)
+    terms = {term: [] for term in weights}
+
+    proto = model.Proto()
+    hints = dict(zip(proto.solution_hint.vars, proto.solution_hint.values))
+
+    def hinted(day_vars):
+        """Hinted number of true vars, None unless all of them are hinted."""
+        values = [hints.get(var.Index()) for var in day_vars]
+        return None if None in values else sum(values)
+
+    def new_penalty(upper, name, hint):
+        var = model.NewBoolVar(name) if upper == 1 else model.NewIntVar(0, upper, name)
+        if hint is not None:
+            model.AddHint(var, hint)
+        return var
+
+    for (kind, entity), (sessions, slots) in occupancy.items():
+        name = f'{kind}_{entity}'
+        per_day = {}
+        for slot, slot_vars in slots.items():
+            per_day.setdefault(slot // slots_per_day, {})[slot % slots_per_day] = slot_vars
+
+        for d_idx, day in per_day.items():
+            busy = {p_idx: hinted(slot_vars) for p_idx, slot_vars in day.items()}
+
+            # Three in a row without the break: one penalty per window that is full
+            if weights['consecutive'] and (sessions is None or sessions > MAX_CONSECUTIVE):
+                for p in range(slots_per_day - MAX_CONSECUTIVE):
+                    window = range(p, p + MAX_CONSECUTIVE + 1)
+                    if window[0] <= break_after - 1 < window[-1] or any(p_idx not in day for p_idx in window):
+                        continue
+                    run = None if any(busy[p_idx] is None for p_idx in window) else sum(busy[p_idx] for p_idx in window)
+                    over = new_penalty(1, f'{name}_d{d_idx}_run{p}', None if run is None else int(run > MAX_CONSECUTIVE))
+                    model.Add(sum(var for p_idx in window for var in day[p_idx]) <= MAX_CONSECUTIVE + over)
+                    terms['consecutive'].append(over)
+
+            # Even spread of the entity's week
+            if weights['dailyLoad'] and sessions is not None:
+                share = -(-sessions // len(days))
+                most = min(len(day), sessions)
+                if most > share:
+                    load = None if None in busy.values() else sum(busy.values())
+                    over = new_penalty(most - share, f'{name}_d{d_idx}_load',
+                                       None if load is None else max(0, load - share))
+                    model.Add(sum(var for slot_vars in day.values() for var in slot_vars) - share <= over)
+                    terms['dailyLoad'].append(over)
+
+            # Idle periods between a teacher's first and last class: a period
+            # is a gap when something is taught before and after it, not in it
+            if kind == 't' and weights['teacherGaps'] and len(day) > 1 and sessions != 1:
+                first, last = min(day), max(day)
+                taught = None if None in busy.values() else sorted(p_idx for p_idx, n in busy.items() if n)
+                before = {}
+                after = {}
+                for p_idx in range(first + 1, last):
+                    before[p_idx] = new_penalty(1, f'{name}_d{d_idx}_before{p_idx}',
+                                                None if taught is None else int(bool(taught) and taught[0] < p_idx))
+                    if p_idx - 1 in day:
+                        model.Add(before[p_idx] >= sum(day[p_idx - 1]))
+                    if p_idx - 1 in before:
+                        model.Add(before[p_idx] >= before[p_idx - 1])
+                for p_idx in range(last - 1, first, -1):
+                    after[p_idx] = new_penalty(1, f'{name}_d{d_idx}_after{p_idx}',
+                                               None if taught is None else int(bool(taught) and taught[-1] > p_idx))
+                    if p_idx + 1 in day:
+                        model.Add(after[p_idx] >= sum(day[p_idx + 1]))
+                    if p_idx + 1 in after:
+                        model.Add(after[p_idx] >= after[p_idx + 1])
+                for p_idx in range(first + 1, last):
+                    gap = new_penalty(1, f'{name}_d{d_idx}_gap{p_idx}',
+                                      None if taught is None
+                                      else int(bool(taught) and taught[0] < p_idx < taught[-1] and p_idx not in taught))
+                    model.Add(before[p_idx] + after[p_idx] - sum(day.get(p_idx, [])) - 1 <= gap)
+                    terms['teacherGaps'].append(gap)
+
+        # Classes outside the teacher's preferred slots
+        if kind == 't' and weights['preferredSlots']:
+            preferred = preferred_slots(teachers[entity][0], days, slots_per_day)
+            if preferred:
+                terms['preferredSlots'].extend(var for slot, slot_vars in slots.items()
+                                               if slot not in preferred for var in slot_vars)
+
+    # Sessions of a subject bunched on one day
+    if weights['subjectSpread']:
+        for (b_id, s_id), (sessions, day_vars) in pair_days.items():
+            share = -(-sessions // len(days))
+            for d_idx, vars_of_day in day_vars.items():
+                # The batch has one class per slot, so a day holds at most slotsPerDay of them
+                most = min(sessions, slots_per_day, len(vars_of_day))
+                if most <= share:
+                    continue
+                count = hinted(vars_of_day)
+                over = new_penalty(most - share, f'spread_{b_id}_{s_id}_d{d_idx}',
+                                   None if count is None else max(0, count - share))
+                model.Add(sum(vars_of_day) - share <= over)
+                terms['subjectSpread'].append(over)
+
+    return terms
+
+
+def add_soft_objective(model, config, requests, groups, group_slots, batch_slots, teacher_slots, teachers,
+                       teacher_sessions=True):
+    """Minimize the weighted soft-constraint penalties of a slot-indexed model.
+
+    group_slots maps g_idx (see session_groups) -> [(slot, var)];
+    batch_slots and teacher_slots map (id, slot) -> [BoolVar]. With
+    teacher_sessions=False a teacher's week is not fixed (joint engine).
+    """
+    slots_per_day = config['slotsPerDay']
+    occupancy = {}
+    pair_days = {}
+    for g_idx, slot_vars in group_slots.items():
+        members = groups[g_idx]
+        req = requests[members[0]]
+        occupancy.setdefault(('b', req['batch_id']), [0, {}])[0] += len(members)
+        teacher = occupancy.setdefault(('t', req['teacher_id']), [0, {}])
+        if teacher_sessions:
+            teacher[0] += len(members)
+        pair = pair_days.setdefault((req['batch_id'], req['subject_id']), [0, {}])
+        pair[0] += len(members)
+        for slot, var in slot_vars:
+            pair[1].setdefault(slot // slots_per_day, []).append(var)
+    for kind, index in (('b', batch_slots), ('t', teacher_slots)):
+        for (entity, slot), slot_terms in index.items():
+            occupancy.setdefault((kind, entity), [0, {}])[1][slot] = slot_terms
+    if not teacher_sessions:
+        for (kind, _), entry in occupancy.items():
+            if kind == 't':
+                entry[0] = None
+
+    minimize_penalties(model, config, add_penalty_terms(model, config, occupancy, pair_days, teachers))
+
+
+def minimize_penalties(model, config, terms):
+    """Minimize the weighted penalty counts of add_penalty_terms."""
+    weights = penalty_weights(config)
+    objective = [weights[term] * expr for term, exprs in terms.items() for expr in exprs]
+    sys.stderr.write(f"Objective: {json.dumps({term: len(exprs) for term, exprs in terms.items()})} penalty terms.\n")
+    if objective:
+        model.Minimize(sum(objective))
+
+
+def build_boolean_model(requests, batch_map, classrooms, config, previous=None, ir=None):
+    """One BoolVar per (session group, day, period, room).
+
+    Returns (model, extract) where extract(solver) yields
+    (r_idx, d_idx, p_idx, room_id, teacher_id) for every placed request.
+    previous maps r_idx -> Placement: fixed requests pin their old
+    placement (a fully pinned group only gets those variables), the rest
+    get it as a hint.
+    Variables only exist for compatible rooms and for slots the teacher
+    is available in. Sessions of one (batch, subject) share their variables
+    and are placed k times (see session_groups) unless
+    config['symmetryBreaking'] is false.
+    ir is the InternedInput of the requests, built here when not given.
+    With config['leanModel'] the variables are unnamed and
+    model.variable_names (see VariableNames) gives their names instead.
+    """
+    previous = previous or {}
+    days = config['daysPerWeek']
+    slots_per_day = config['slotsPerDay']
+    lean = config.get('leanModel', False)
+
+    PROFILER.phase('build.setup')
     model = cp_model.CpModel()
+    ir = ir or InternedInput(requests, batch_map, classrooms, config)
+    groups = ir.groups
+    total_slots = ir.total_slots
+    room_ids = ir.room_ids
+    num_rooms = len(room_ids)
+    # Lean: prefix and suffix are both empty, so every name is ''
+    room_suffixes = [''] * num_rooms if lean else room_ids
 
     # Variables
-    x = {} # vars
-    
-    # For each request, create variables for valid slots/rooms
-    for r_idx, req in enumerate(requests):
-        batch = batch_map[req['batch_id']]
-        batch_size = batch.get('size', 0)
-        
-        valid_rooms = [
-            room for room in classrooms 
-            # if room['type'] == req['type'] and room['capacity'] >= batch_size # Removed constraints
-        ]
-        
+    PROFILER.phase('build.variables')
+    # Every variable is bucketed into its indexes as it is created, so the
+    # constraint loops below never have to rescan the whole variable set.
+    # A variable's key is its cell, slot * num_rooms + room number; the
+    # indexes are flat lists over dense integer keys, no hashing involved.
+    vars_by_group = {} # g_idx -> [var]
+    cells_by_group = {} # g_idx -> [cell], parallel to vars_by_group
+    vars_by_room_slot = [[] for _ in range(total_slots * num_rooms)] # cell -> [var]
+    vars_by_teacher_slot = [[] for _ in range(len(ir.teacher_ids) * total_slots)] # t * total_slots + slot -> [var]
+    vars_by_batch_slot = [[] for _ in range(len(ir.batch_ids) * total_slots)] # b * total_slots + slot -> [var]
+    teacher_slot_lists = {} # t -> its available slots, ascending
+
+    # For each group, create variables for valid slots/rooms
+    for g_idx, members in enumerate(groups):
+        r_first = members[0]
+        valid_rooms = ir.req_rooms[r_first]
+
         if not valid_rooms:
-            sys.stderr.write(f"Warning: No valid room for req {r_idx} ({req['type']}, size {batch_size})\n")
+            req = requests[r_first]
+            sys.stderr.write(f"Warning: No valid room for req {members} ({req['type']}, "
+                             f"size {batch_map[req['batch_id']].get('size', 0)})\n")
             continue
 
-        for d_idx in range(len(days)):
-            for p_idx in range(slots_per_day):
-                for room in valid_rooms:
-                    x[(r_idx, d_idx, p_idx, room['id'])] = model.NewBoolVar(f'req_{r_idx}_d{d_idx}_p{p_idx}_r{room["id"]}')
+        b = int(ir.req_batch[r_first])
+        t = int(ir.req_teacher[r_first])
+        if t not in teacher_slot_lists:
+            teacher_slot_lists[t] = ir.teacher_slots(t)
+        t_slots = teacher_slot_lists[t]
+        if not t_slots:
+            sys.stderr.write(f"Warning: Teacher {ir.teacher_ids[t]} has no available slot for req {members}\n")
+            continue
 
-    sys.stderr.write(f"Created {len(x)} variables.\n")
+        group_vars = vars_by_group[g_idx] = []
+        group_cells = cells_by_group[g_idx] = []
+
+        placements = [previous[r_idx] for r_idx in members if r_idx in previous]
+        pinned = {(p.d_idx * slots_per_day + p.p_idx) * num_rooms + ir.room_index[p.room_id]
+                  for p in placements if p.fixed}
+        hinted = {(p.d_idx * slots_per_day + p.p_idx) * num_rooms + ir.room_index[p.room_id]
+                  for p in placements if not p.fixed}
+        # A fully placed group hints its other variables to 0 (a complete hint)
+        hint_rest = len(placements) == len(members) and bool(hinted)
+
+        if len(pinned) == len(members):
+            layout = [(cell // num_rooms, (cell % num_rooms,)) for cell in sorted(pinned)]
+        else:
+            layout = [(slot, valid_rooms) for slot in t_slots]
+
+        for slot, rooms in layout:
+            d_idx, p_idx = divmod(slot, slots_per_day)
+            prefix = '' if lean else f'req_{r_first}_d{d_idx}_p{p_idx}_r'
+            teacher_vars = vars_by_teacher_slot[t * total_slots + slot]
+            batch_vars = vars_by_batch_slot[b * total_slots + slot]
+            for room in rooms:
+                cell = slot * num_rooms + room
+                var = model.NewBoolVar(prefix + room_suffixes[room])
+                if cell in pinned:
+                    model.Add(var == 1)
+                elif cell in hinted:
+                    model.AddHint(var, 1)
+                elif hint_rest:
+                    model.AddHint(var, 0)
+                group_vars.append(var)
+                group_cells.append(cell)
+                vars_by_room_slot[cell].append(var)
+                teacher_vars.append(var)
+                batch_vars.append(var)
+
+    if lean:
+        def variable_name(g_idx, offset):
+            cells = cells_by_group[g_idx]
+            if offset >= len(cells):
+                return None
+            slot, room = divmod(cells[offset], num_rooms)
+            return f'req_{groups[g_idx][0]}_d{slot // slots_per_day}_p{slot % slots_per_day}_r{room_ids[room]}'
+
+        model.variable_names = VariableNames(variable_name)
+        for g_idx, group_vars in vars_by_group.items():
+            if group_vars:
+                model.variable_names.add_run(g_idx, group_vars[0].Index())
+
+    sys.stderr.write(f"Created {sum(len(v) for v in vars_by_group.values())} variables.\n")
 
     # Constraints
-    
+
     # C1: Each request must be scheduled exactly once
-    for r_idx, req in enumerate(requests):
-        # Gather all vars for this request
-        req_vars = []
-        # We need to re-loop or store them efficiently. 
-        # Re-looping x keys is slow.
-        # Let's iterate our created dict keys.
-        # (Optimization: structure x as x[r_idx] = list of vars)
-        
-        # Optimized lookup
-        relevant_vars = [v for k, v in x.items() if k[0] == r_idx]
-        if relevant_vars:
-            model.Add(sum(relevant_vars) == 1)
-        # else: Unscheduled!
-
-    # C2: No Teacher Overlap
-    # For each teacher, day, period -> max 1 class
-    # We iterate all slots, find requests involving teacher T
-    
-    # Pre-calculate request indices per teacher
-    reqs_per_teacher = {}
-    for r_idx, req in enumerate(requests):
-        t_id = req['teacher_id']
-        if t_id not in reqs_per_teacher: reqs_per_teacher[t_id] = []
-        reqs_per_teacher[t_id].append(r_idx)
-
-    for d_idx in range(len(days)):
-        for p_idx in range(slots_per_day):
-            for t_id, r_indices in reqs_per_teacher.items():
-                # Sum of x[r, d, p, any_room] <= 1
-                t_vars = []
-                for r_idx in r_indices:
-                    # Find all vars for this request at this time
-                    # We need access to rooms.
-                    # It's better to iterate x once and bucket by (d, p, teacher)
-                    pass 
-
-    # Efficient Constraint loops
-    # Bucket all variables by (day, period)
-    # slots_vars[(d, p)] = [ (r_idx, room_id, var) ]
-    slots_vars = {}
-    
-    for (r_idx, d_idx, p_idx, room_id), var in x.items():
-        key = (d_idx, p_idx)
-        if key not in slots_vars: slots_vars[key] = []
-        slots_vars[key].append((r_idx, room_id, var))
-
-    for (d_idx, p_idx), entries in slots_vars.items():
-        # entries list of (r_idx, room_id, var)
-        
-        # 1. Room Conflict: Max 1 class per room per slot
-        rooms_in_slot = {}
-        for r_idx, room_id, var in entries:
-            if room_id not in rooms_in_slot: rooms_in_slot[room_id] = []
-            rooms_in_slot[room_id].append(var)
-        
-        for room_id, room_vars in rooms_in_slot.items():
-            model.Add(sum(room_vars) <= 1)
-
-        # 2. Teacher Conflict: Max 1 class per teacher per slot
-        teachers_in_slot = {}
-        for r_idx, room_id, var in entries:
-            t_id = requests[r_idx]['teacher_id']
-            if t_id not in teachers_in_slot: teachers_in_slot[t_id] = []
-            teachers_in_slot[t_id].append(var)
-            
-        for t_id, t_vars in teachers_in_slot.items():
-            model.Add(sum(t_vars) <= 1)
-            
-        # 3. Batch Conflict: Max 1 class per batch per slot
-        batches_in_slot = {}
-        for r_idx, room_id, var in entries:
-            b_id = requests[r_idx]['batch_id']
-            if b_id not in batches_in_slot: batches_in_slot[b_id] = []
-            batches_in_slot[b_id].append(var)
-            
-        for b_id, b_vars in batches_in_slot.items():
-            model.Add(sum(b_vars) <= 1)
+    # (a group of k sessions k times; the batch conflict keeps them in
+    # different slots). Requests with no variables (no valid room) stay unscheduled.
+    PROFILER.phase('build.scheduled_once')
+    for g_idx, group_vars in vars_by_group.items():
+        if len(groups[g_idx]) == 1:
+            model.AddExactlyOne(group_vars)
+        else:
+            model.Add(sum(group_vars) == len(groups[g_idx]))
+
+    # C2: No Overlap
+    # 1. Room Conflict: Max 1 class per room per slot
+    # 2. Teacher Conflict: Max 1 class per teacher per slot
+    # 3. Batch Conflict: Max 1 class per batch per slot
+    PROFILER.phase('build.no_overlap')
+    for index in (vars_by_room_slot, vars_by_teacher_slot, vars_by_batch_slot):
+        for slot_vars in index:
+            if len(slot_vars) > 1:
+                model.AddAtMostOne(slot_vars)
+
+    # C3: maxLoadPerDay
+    PROFILER.phase('build.daily_load')
+    vars_by_teacher_day = {}
+    for t, t_id in enumerate(ir.teacher_ids):
+        for d_idx in range(len(days)):
+            base = t * total_slots + d_idx * slots_per_day
+            day_vars = [var for slot_vars in vars_by_teacher_slot[base:base + slots_per_day] for var in slot_vars]
+            if day_vars:
+                vars_by_teacher_day[(t_id, d_idx)] = day_vars
+    sessions = Counter()
+    for g_idx in vars_by_group:
+        sessions[requests[groups[g_idx][0]]['teacher_id']] += len(groups[g_idx])
+    add_daily_load_caps(model, vars_by_teacher_day, ir.teachers, sessions)
 
     # 4. Consecutive Lecture Constraints
     # Logic: No more than 2 consecutive classes.
     # We check every window of 3 slots: sum(classes in p, p+1, p+2) <= 2
-    
-    # 4a. Batch Constraints
-    # Organize vars by (batch, day, period) -> list of vars
-    # Since we already iterated for "Max 1 per slot", we know sum(vars_at_p) is 0 or 1.
-    # We need to access these sums easily.
-    
-    # Re-use batches_in_slot and teachers_in_slot from previous loop?
-    # They were local to the loop over slots_vars. 
-    # Let's rebuild a global view for ease or iterate differently.
-    
-    # (batch_id, day) -> { period: [vars] }
-    batch_daily_vars = {}
-    teacher_daily_vars = {}
-
-    for (r_idx, d_idx, p_idx, room_id), var in x.items():
-        req = requests[r_idx]
-        b_id = req['batch_id']
-        t_id = req['teacher_id']
-        
-        # Batch
-        if (b_id, d_idx) not in batch_daily_vars: batch_daily_vars[(b_id, d_idx)] = {}
-        if p_idx not in batch_daily_vars[(b_id, d_idx)]: batch_daily_vars[(b_id, d_idx)][p_idx] = []
-        batch_daily_vars[(b_id, d_idx)][p_idx].append(var)
-        
-        # Teacher
-        if (t_id, d_idx) not in teacher_daily_vars: teacher_daily_vars[(t_id, d_idx)] = {}
-        if p_idx not in teacher_daily_vars[(t_id, d_idx)]: teacher_daily_vars[(t_id, d_idx)][p_idx] = []
-        teacher_daily_vars[(t_id, d_idx)][p_idx].append(var)
+    # Since "Max 1 per slot" holds, the per-slot indexes above already give
+    # the 0/1 occupancy of each (entity, day, period); the windows read them directly.
 
     # Apply generic sliding window constraint
-    def add_max_consecutive_constraints(daily_map, limit=2):
+    def add_max_consecutive_constraints(slot_index, limit=2):
         break_after = config.get('breakAfter', 4) # Default to 4 if not set
 
-        for (entity_id, d_idx), p_map in daily_map.items():
+        # slot_index is flat: entity number * total_slots + slot -> [var]
+        for base in range(0, len(slot_index), slots_per_day):
             # For this entity on this day
             # Check windows: [p, p+1, ..., p+limit] -> length limit+1
             # If sum > limit, it violates "max consecutive = limit"
-            
+
             for p in range(slots_per_day - limit):
-                # CHECK: Does this window [p, p+1, p+2] cross the break?
-                # Window indices: p, p+1, p+2
-                # If break is after slot 4 (indices 0,1,2,3), then:
-                # Slot 3 and Slot 4 (indices) are separated by break.
-                # Index 3 is Period 4. Index 4 is Period 5.
-                # If the window includes BOTH index (break_after-1) AND index (break_after),
-                # then it is NOT a consecutive block of lectures.
-                
-                # Actually, simpler: The constraint is "No 3 consecutive CLASSES".
-                # If there is a break between P4 and P5, does P4 and P5 count as consecutive?
-                # User said: "Add a break time ... after 4th lecture".
-                # Usually, a break RESETS the "consecutive" counter.
-                # So P3, P4, (Break), P5 -> IS acceptable? Yes.
-                # P3, P4 is 2. (Break). P5 is 1. No sequence of 3.
-                # So verify: the window [P3, P4, P5] which is indices [2, 3, 4]
-                # Contains index 3 and 4.
-                # If window contains the break boundary, we should NOT enforce the constraint strictly across it
-                # OR we split the day into two segments and enforce separately.
-                
+                # A break RESETS the "consecutive" counter: P3, P4, (Break), P5 is
+                # 2 then 1, not 3 in a row. So a window containing both index
+                # (break_after-1) and index (break_after) is skipped.
                 window_indices = [p + offset for offset in range(limit + 1)]
-                
-                # Check if window crosses the break boundary
-                # Boundary is between (break_after-1) and (break_after)
-                crosses_break = False
-                for i in range(len(window_indices) - 1):
-                    if window_indices[i] == break_after - 1 and window_indices[i+1] == break_after:
-                        crosses_break = True
-                        break
-                
-                if crosses_break:
-                    # If window crosses break, we assume the break breaks the chain.
-                    # So P3, P4, P5 is NOT 3 consecutive. It's 2 then 1.
-                    # So we SKIP adding this constraint.
+
+                if window_indices[0] <= break_after - 1 < window_indices[-1]:
                     continue
 
                 # Gather all variables for periods p, p+1, ... p+limit
                 window_vars = []
                 for idx in window_indices:
-                    window_vars.extend(p_map.get(idx, []))
-                
+                    window_vars.extend(slot_index[base + idx])
+
                 if window_vars:
                     model.Add(sum(window_vars) <= limit)
 
     # Relaxed constraints to ensure feasibility for full schedule
-    # add_max_consecutive_constraints(batch_daily_vars, limit=2)
-    # add_max_consecutive_constraints(teacher_daily_vars, limit=2)
+    # (config.softConstraints penalizes long runs in the objective instead)
+    # add_max_consecutive_constraints(vars_by_batch_slot, limit=2)
+    # add_max_consecutive_constraints(vars_by_teacher_slot, limit=2)
 
-    # 3. Solve
-    solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = 30.0
-    status = solver.Solve(model)
+    if config.get('softConstraints'):
+        PROFILER.phase('build.soft_objective')
+        # The objective helpers are keyed by the original ids
+        add_soft_objective(
+            model, config, requests, groups,
+            {g_idx: [(cell // num_rooms, var) for cell, var in zip(cells_by_group[g_idx], group_vars)]
+             for g_idx, group_vars in vars_by_group.items()},
+            {(ir.batch_ids[key // total_slots], key % total_slots): slot_vars
+             for key, slot_vars in enumerate(vars_by_batch_slot) if slot_vars},
+            {(ir.teacher_ids[key // total_slots], key % total_slots): slot_vars
+             for key, slot_vars in enumerate(vars_by_teacher_slot) if slot_vars},
+            ir.teachers,
+        )
 
-    final_schedule = []
+    def extract(solver):
+        for g_idx, group_vars in vars_by_group.items():
+            # The group's sessions go to its placements in slot order
+            placed = sorted(cell for cell, var in zip(cells_by_group[g_idx], group_vars) if solver.Value(var) == 1)
+            for r_idx, cell in zip(groups[g_idx], placed):
+                slot, room = divmod(cell, num_rooms)
+                yield r_idx, slot // slots_per_day, slot % slots_per_day, ir.room_ids[room], requests[r_idx]['teacher_id']
 
-    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
-        for (r_idx, d_idx, p_idx, room_id), var in x.items():
-            if solver.Value(var) == 1:
-                req = requests[r_idx]
-                final_schedule.append({
-                    'id': f"sched_{r_idx}",
-                    'subjectId': req['subject_id'],
-                    'teacherId': req['teacher_id'],
-                    'classroomId': room_id,
-                    'batchIds': [req['batch_id']],
-                    'day': days[d_idx],
-                    'period': p_idx + 1 # 1-indexed
+    return model, extract
+
+
+def build_compact_model(requests, batch_map, classrooms, config, previous=None, ir=None):
+    """Slot-indexed model: per request one slot IntVar and one room IntVar.
+
+    Slots are numbered d_idx * slotsPerDay + p_idx. A third "cell" IntVar
+    (slot * len(classrooms) + room) lets a single AllDifferent express the
+    room conflict, and per-batch / per-teacher AllDifferent over the slot
+    vars express the other two. Variable count is 3 * len(requests),
+    independent of the number of rooms and slots. Room and slot domains
+    are restricted to compatible rooms and the teacher's available slots;
+    maxLoadPerDay adds one day IntVar and per-day indicators for requests
+    of teachers whose week is longer than their daily cap. ir is the
+    InternedInput of the requests, built here when not given.
+    """
+    previous = previous or {}
+    days = config['daysPerWeek']
+    slots_per_day = config['slotsPerDay']
+    total_slots = len(days) * slots_per_day
+    num_rooms = len(classrooms)
+
+    model = cp_model.CpModel()
+
+    if not num_rooms:
+        sys.stderr.write("Warning: No classrooms, nothing can be placed\n")
+        return model, lambda solver: iter(())
+
+    PROFILER.phase('build.variables')
+    ir = ir or InternedInput(requests, batch_map, classrooms, config)
+    room_index = ir.room_index
+    teachers = ir.teachers
+
+    slot_vars = {}
+    room_vars = {}
+    cell_vars = []
+    slots_per_batch = {}
+    slots_per_teacher = {}
+    hinted_slots = {} # slot var index -> previous slot, to hint the day indicators too
+
+    for r_idx, req in enumerate(requests):
+        t_slots = teachers[req['teacher_id']][1]
+        if not t_slots:
+            sys.stderr.write(f"Warning: Teacher {req['teacher_id']} has no available slot for req {r_idx}\n")
+            continue
+        s = model.NewIntVarFromDomain(cp_model.Domain.FromValues(sorted(t_slots)), f'slot_{r_idx}')
+        r = model.NewIntVarFromDomain(cp_model.Domain.FromValues(ir.req_rooms[r_idx]), f'room_{r_idx}')
+        cell = model.NewIntVar(0, total_slots * num_rooms - 1, f'cell_{r_idx}')
+        model.Add(cell == s * num_rooms + r)
+
+        placement = previous.get(r_idx)
+        if placement:
+            old_slot = placement.d_idx * slots_per_day + placement.p_idx
+            old_room = room_index[placement.room_id]
+            if placement.fixed:
+                model.Add(s == old_slot)
+                model.Add(r == old_room)
+            else:
+                model.AddHint(s, old_slot)
+                model.AddHint(r, old_room)
+                model.AddHint(cell, old_slot * num_rooms + old_room)
+                hinted_slots[s.Index()] = old_slot
+
+        slot_vars[r_idx] = s
+        room_vars[r_idx] = r
+        cell_vars.append(cell)
+        slots_per_batch.setdefault(req['batch_id'], []).append(s)
+        slots_per_teacher.setdefault(req['teacher_id'], []).append(s)
+
+    sys.stderr.write(f"Created {3 * len(slot_vars)} variables.\n")
+
+    # Room Conflict: no two requests share a (slot, room) cell
+    PROFILER.phase('build.no_overlap')
+    model.AddAllDifferent(cell_vars)
+
+    # Teacher / Batch Conflict: distinct slots per teacher and per batch
+    for t_slots in slots_per_teacher.values():
+        if len(t_slots) > 1:
+            model.AddAllDifferent(t_slots)
+    for b_slots in slots_per_batch.values():
+        if len(b_slots) > 1:
+            model.AddAllDifferent(b_slots)
+
+    # maxLoadPerDay: on_day is only forced up when the session falls on that day
+    PROFILER.phase('build.daily_load')
+    vars_by_teacher_day = {}
+    sessions = {t_id: len(t_slots) for t_id, t_slots in slots_per_teacher.items()}
+    for t_id, t_slots in slots_per_teacher.items():
+        per_day = teachers[t_id][0].get('maxLoadPerDay')
+        if not per_day or sessions[t_id] <= per_day:
+            continue
+        days_open = sorted({slot // slots_per_day for slot in teachers[t_id][1]})
+        for s in t_slots:
+            day = model.NewIntVar(0, len(days) - 1, f'{s.Name()}_day')
+            model.AddDivisionEquality(day, s, slots_per_day)
+            old_slot = hinted_slots.get(s.Index())
+            if old_slot is not None:
+                model.AddHint(day, old_slot // slots_per_day)
+            for d_idx in days_open:
+                on_day = model.NewBoolVar(f'{s.Name()}_d{d_idx}')
+                model.Add(day != d_idx).OnlyEnforceIf(on_day.Not())
+                if old_slot is not None:
+                    model.AddHint(on_day, d_idx == old_slot // slots_per_day)
+                vars_by_teacher_day.setdefault((t_id, d_idx), []).append(on_day)
+    add_daily_load_caps(model, vars_by_teacher_day, teachers, sessions)
+
+    # Soft constraints: without per-slot indicators only preferredSlots can be
+    # expressed cheaply, as one "outside the preferred slots" flag per request
+    if config.get('softConstraints'):
+        PROFILER.phase('build.soft_objective')
+        sys.stderr.write("Note: the compact engine only optimizes preferredSlots; "
+                         "use another engine or localSearch for the other penalties\n")
+        misses = []
+        if penalty_weights(config)['preferredSlots']:
+            for r_idx, s in slot_vars.items():
+                t_id = requests[r_idx]['teacher_id']
+                t_slots = teachers[t_id][1]
+                preferred = preferred_slots(teachers[t_id][0], days, slots_per_day) & t_slots
+                if not preferred or preferred == t_slots:
+                    continue
+                miss = model.NewBoolVar(f'{s.Name()}_unpreferred')
+                model.AddLinearExpressionInDomain(s, cp_model.Domain.FromValues(sorted(preferred))).OnlyEnforceIf(miss.Not())
+                misses.append(miss)
+        minimize_penalties(model, config, {'preferredSlots': misses})
+
+    def extract(solver):
+        for r_idx in slot_vars:
+            slot = solver.Value(slot_vars[r_idx])
+            room = classrooms[solver.Value(room_vars[r_idx])]
+            yield r_idx, slot // slots_per_day, slot % slots_per_day, room['id'], requests[r_idx]['teacher_id']
+
+    return model, extract
+
+
+def compatible_rooms(req, batch, classrooms):
+    """Rooms of the request's type that can seat the batch.
+
+    Falls back to every room (the historical behaviour) when nothing fits,
+    so a dataset without labs still produces a timetable.
+    """
+    batch_size = batch.get('size', 0)
+    rooms = [
+        room for room in classrooms
+        if room.get('type', 'Theory') == req['type'] and room.get('capacity', 0) >= batch_size
+    ]
+    return rooms or list(classrooms)
+
+
+def match_rooms(slot_requests, room_options):
+    """Bipartite matching of requests to rooms within one slot.
+
+    slot_requests: list of r_idx placed in the slot.
+    room_options:  r_idx -> list of candidate room indices, best fit first.
+    Returns {r_idx: room index}; requests left out could not be matched.
+    Kuhn's augmenting paths, trying the most constrained requests first.
+    """
+    room_owner = {}
+
+    def augment(r_idx, seen):
+        for room in room_options[r_idx]:
+            if room in seen:
+                continue
+            seen.add(room)
+            if room not in room_owner or augment(room_owner[room], seen):
+                room_owner[room] = r_idx
+                return True
+        return False
+
+    for r_idx in sorted(slot_requests, key=lambda r: len(room_options[r])):
+        augment(r_idx, set())
+
+    return {r_idx: room for room, r_idx in room_owner.items()}
+
+
+def add_joint_teacher_choice(model, requests, groups, y, previous, teachers, days, slots_per_day):
+    """Teacher choice per (batch, subject) for the time-only model.
+
+    y maps g_idx (see session_groups) -> {slot: var}; teachers is
+    request_teachers(). A candidate cannot be chosen for a pair that uses
+    one of its unavailable slots.
+    Returns (teacher_choices, busy): teacher_choices maps r_idx ->
+    [(teacher, choice var or None)], None marking the only candidate, which
+    needs no variable; busy maps (t_id, slot) -> [BoolVar], at most one true.
+    """
+    pairs = {}
+    for g_idx, group in enumerate(groups):
+        req = requests[group[0]]
+        pairs.setdefault((req['batch_id'], req['subject_id']), []).append(g_idx)
+
+    teacher_choices = {}
+    busy = {} # (t_id, slot) -> [0/1 terms]
+    weekly = {} # t_id -> (teacher, [(sessions, choice var or None)])
+
+    for pair_idx, pair_groups in enumerate(pairs.values()):
+        members = [r_idx for g_idx in pair_groups for r_idx in groups[g_idx]]
+        first = requests[members[0]]
+        candidates = first['candidate_teachers']
+        # The batch is in at most one session per slot, so this is 0/1
+        pair_vars = {}
+        for g_idx in pair_groups:
+            for slot, var in y[g_idx].items():
+                pair_vars.setdefault(slot, []).append(var)
+        occupancy = {slot: sum(slot_vars) for slot, slot_vars in pair_vars.items()}
+        hinted_slots = None
+        if all(r_idx in previous for r_idx in members):
+            hinted_slots = {previous[r_idx].d_idx * slots_per_day + previous[r_idx].p_idx for r_idx in members}
+
+        if len(candidates) == 1:
+            options = [(candidates[0], None)]
+        else:
+            options = [(t, model.NewBoolVar(f'teach_{pair_idx}_{t_idx}')) for t_idx, t in enumerate(candidates)]
+            model.AddExactlyOne(var for _, var in options)
+            # Greedy pick as a hint; pinned when every session is pinned
+            pinned = all(previous.get(r_idx) and previous[r_idx].fixed for r_idx in members)
+            for t, var in options:
+                if t['id'] == first['teacher_id']:
+                    if pinned:
+                        model.Add(var == 1)
+                    else:
+                        model.AddHint(var, 1)
+                else:
+                    model.AddHint(var, 0)
+
+        for t, chosen in options:
+            weekly.setdefault(t['id'], (t, []))[1].append((len(members), chosen))
+            t_slots = teachers[t['id']][1]
+            for slot, occupied in occupancy.items():
+                if chosen is None:
+                    busy.setdefault((t['id'], slot), []).extend(pair_vars[slot])
+                    continue
+                if slot not in t_slots:
+                    # Unavailable then: not chosen if the pair uses this slot
+                    model.Add(occupied + chosen <= 1)
+                    continue
+                # teaches = occupancy AND chosen, exactly: the soft objective's
+                # gap terms count it negatively, so a free teaches would be set
+                # in idle periods to hide gaps
+                teaches = model.NewBoolVar(f'teach_{pair_idx}_{t["id"]}_s{slot}')
+                model.Add(occupied + chosen - teaches <= 1)
+                model.Add(teaches <= occupied)
+                model.Add(teaches <= chosen)
+                if hinted_slots is not None:
+                    model.AddHint(teaches, slot in hinted_slots and t['id'] == first['teacher_id'])
+                busy.setdefault((t['id'], slot), []).append(teaches)
+
+        for r_idx in members:
+            teacher_choices[r_idx] = options
+
+    # No Teacher Overlap
+    for terms in busy.values():
+        if len(terms) > 1:
+            model.Add(sum(terms) <= 1)
+
+    for t_id, (teacher, loads) in weekly.items():
+        # maxLoadPerDay
+        per_day = teacher.get('maxLoadPerDay')
+        if per_day:
+            for d_idx in range(len(days)):
+                day_terms = [term for p_idx in range(slots_per_day)
+                             for term in busy.get((t_id, d_idx * slots_per_day + p_idx), [])]
+                if len(day_terms) > per_day:
+                    model.Add(sum(day_terms) <= per_day)
+
+        # maxLoadPerWeek
+        per_week = teacher.get('maxLoadPerWeek')
+        if per_week:
+            fixed = sum(sessions for sessions, chosen in loads if chosen is None)
+            optional = [(sessions, chosen) for sessions, chosen in loads if chosen is not None]
+            if fixed > per_week:
+                # Sole candidate for more than the cap: nothing can fix that, so
+                # report it and only keep further pairs away from this teacher
+                sys.stderr.write(f"Warning: {t_id} is the only candidate for {fixed} sessions, "
+                                 f"above maxLoadPerWeek {per_week}\n")
+            if optional:
+                model.Add(sum(sessions * chosen for sessions, chosen in optional) <= max(per_week - fixed, 0))
+
+    return teacher_choices, busy
+
+
+def build_decomposed_model(requests, batch_map, classrooms, config, previous=None, joint_teachers=False, ir=None):
+    """Two-phase model: time slots in CP-SAT, rooms by matching afterwards.
+
+    Phase 1 has one BoolVar per (session group, slot) and no room dimension;
+    a group of k sessions (see session_groups) is placed in k slots.
+    Rooms enter only as per-slot caps: for every distinct set of compatible
+    rooms S, the groups whose compatible set lies inside S may not exceed
+    |S| in any slot. Type/capacity compatibility sets are laminar (nested
+    within a type, disjoint across types), so these caps are exactly Hall's
+    condition and phase 2 always finds a complete room matching.
+    A previous placement pins or hints the slot; its old room is tried first.
+
+    With joint_teachers=True the pre-assigned teacher is only a hint: each
+    (batch, subject) picks one of its candidate_teachers through an
+    ExactlyOne over choice BoolVars, and every session of the pair goes to
+    that teacher. Teacher overlap, maxLoadPerDay and maxLoadPerWeek are
+    enforced over "teacher t teaches pair g in slot s" indicators, created
+    only for pairs with more than one candidate.
+
+    A group only gets slot variables where its teacher (with
+    joint_teachers, any of its candidates) is available. ir is the
+    InternedInput of the requests, built here when not given. With
+    config['leanModel'] the slot variables are unnamed and
+    model.variable_names (see VariableNames) gives their names instead.
+    """
+    previous = previous or {}
+    days = config['daysPerWeek']
+    slots_per_day = config['slotsPerDay']
+    total_slots = len(days) * slots_per_day
+    lean = config.get('leanModel', False)
+
+    model = cp_model.CpModel()
+
+    if not classrooms:
+        sys.stderr.write("Warning: No classrooms, nothing can be placed\n")
+        return model, lambda solver: iter(())
+
+    PROFILER.phase('build.setup')
+    ir = ir or InternedInput(requests, batch_map, classrooms, config)
+    room_index = ir.room_index
+    groups = ir.groups
+
+    # Candidate rooms per group (smallest adequate room first) and the
+    # distinct compatible sets that become per-slot caps.
+    by_size = {}
+    room_options = []
+    room_sets = {}
+    for g_idx, members in enumerate(groups):
+        rooms = ir.req_rooms[members[0]]
+        if rooms not in by_size:
+            by_size[rooms] = sorted(rooms, key=lambda i: (classrooms[i].get('capacity', 0), classrooms[i]['id']))
+        room_options.append(by_size[rooms])
+        room_sets.setdefault(frozenset(rooms), []).append(g_idx)
+
+    # Phase 1 variables: y[g_idx] = {slot: var}
+    # (each group's "placed once" constraint goes with its variables)
+    PROFILER.phase('build.variables')
+    teachers = ir.teachers
+    y = []
+    old_rooms = {} # (g_idx, slot) -> room index of a previous placement
+    vars_by_teacher_slot = {}
+    vars_by_batch_slot = {}
+    if lean:
+        def variable_name(g_idx, offset):
+            slots = list(y[g_idx])
+            return f'req_{groups[g_idx][0]}_s{slots[offset]}' if offset < len(slots) else None
+
+        model.variable_names = VariableNames(variable_name)
+    for g_idx, members in enumerate(groups):
+        req = requests[members[0]]
+        if joint_teachers:
+            slots = set().union(*(teachers[t['id']][1] for t in req['candidate_teachers']))
+        else:
+            slots = teachers[req['teacher_id']][1]
+        if not slots:
+            sys.stderr.write(f"Warning: No available teacher for req {members} in any slot\n")
+        if lean:
+            group_vars = {slot: model.NewBoolVar('') for slot in sorted(slots)}
+            if group_vars:
+                model.variable_names.add_run(g_idx, next(iter(group_vars.values())).Index())
+        else:
+            group_vars = {slot: model.NewBoolVar(f'req_{members[0]}_s{slot}') for slot in sorted(slots)}
+        y.append(group_vars)
+        if len(members) == 1:
+            model.AddExactlyOne(group_vars.values())
+        else:
+            model.Add(sum(group_vars.values()) == len(members))
+
+        hinted = set()
+        for r_idx in members:
+            placement = previous.get(r_idx)
+            if not placement:
+                continue
+            old_slot = placement.d_idx * slots_per_day + placement.p_idx
+            old_rooms[(g_idx, old_slot)] = room_index[placement.room_id]
+            old_var = group_vars.get(old_slot)
+            if old_var is None:
+                continue
+            if placement.fixed:
+                model.Add(old_var == 1)
+            else:
+                model.AddHint(old_var, 1)
+            hinted.add(old_slot)
+        # A fully placed group hints its other slots to 0 (a complete hint)
+        if hinted and all(r_idx in previous for r_idx in members):
+            for slot, var in group_vars.items():
+                if slot not in hinted:
+                    model.AddHint(var, 0)
+        for slot, var in group_vars.items():
+            vars_by_teacher_slot.setdefault((req['teacher_id'], slot), []).append(var)
+            vars_by_batch_slot.setdefault((req['batch_id'], slot), []).append(var)
+
+    sys.stderr.write(f"Created {sum(len(group_vars) for group_vars in y)} variables.\n")
+
+    # Teacher / Batch Conflict
+    conflict_indexes = [vars_by_batch_slot]
+    if joint_teachers:
+        PROFILER.phase('build.teacher_choice')
+        teacher_choices, busy = add_joint_teacher_choice(model, requests, groups, y, previous, teachers,
+                                                         days, slots_per_day)
+    else:
+        conflict_indexes.append(vars_by_teacher_slot)
+        # maxLoadPerDay (the joint choice adds its own)
+        PROFILER.phase('build.daily_load')
+        vars_by_teacher_day = {}
+        for (t_id, slot), slot_vars in vars_by_teacher_slot.items():
+            vars_by_teacher_day.setdefault((t_id, slot // slots_per_day), []).extend(slot_vars)
+        sessions = Counter(req['teacher_id'] for req in requests)
+        add_daily_load_caps(model, vars_by_teacher_day, teachers, sessions)
+    PROFILER.phase('build.no_overlap')
+    for index in conflict_indexes:
+        for slot_vars in index.values():
+            if len(slot_vars) > 1:
+                model.AddAtMostOne(slot_vars)
+
+    # Room capacity caps: groups confined to S <= |S| per slot
+    PROFILER.phase('build.room_caps')
+    for room_set in room_sets:
+        confined = [g_idx for other, members in room_sets.items() if other <= room_set for g_idx in members]
+        if len(confined) <= len(room_set):
+            continue
+        for slot in range(total_slots):
+            slot_vars = [y[g_idx][slot] for g_idx in confined if slot in y[g_idx]]
+            if len(slot_vars) > len(room_set):
+                model.Add(sum(slot_vars) <= len(room_set))
+
+    if config.get('softConstraints'):
+        PROFILER.phase('build.soft_objective')
+        add_soft_objective(
+            model, config, requests, groups,
+            {g_idx: list(group_vars.items()) for g_idx, group_vars in enumerate(y)},
+            vars_by_batch_slot, busy if joint_teachers else vars_by_teacher_slot, teachers,
+            teacher_sessions=not joint_teachers,
+        )
+
+    def teacher_of(solver, r_idx):
+        if not joint_teachers:
+            return requests[r_idx]['teacher_id']
+        for teacher, chosen in teacher_choices[r_idx]:
+            if chosen is None or solver.Value(chosen) == 1:
+                return teacher['id']
+
+    def extract(solver):
+        # Phase 2: assign rooms slot by slot
+        requests_by_slot = {}
+        request_options = {}
+        for g_idx, group_vars in enumerate(y):
+            # The group's sessions go to its slots in order
+            slots = [slot for slot, var in group_vars.items() if solver.Value(var) == 1]
+            for r_idx, slot in zip(groups[g_idx], slots):
+                requests_by_slot.setdefault(slot, []).append(r_idx)
+                old_room = old_rooms.get((g_idx, slot))
+                if old_room in room_options[g_idx]:
+                    request_options[r_idx] = [old_room] + [room for room in room_options[g_idx] if room != old_room]
+                else:
+                    request_options[r_idx] = room_options[g_idx]
+
+        for slot, slot_requests in sorted(requests_by_slot.items()):
+            assignment = match_rooms(slot_requests, request_options)
+            for r_idx in slot_requests:
+                if r_idx not in assignment:
+                    sys.stderr.write(f"Warning: No room left for req {r_idx} in slot {slot}\n")
+                    continue
+                yield (r_idx, slot // slots_per_day, slot % slots_per_day, classrooms[assignment[r_idx]]['id'],
+                       teacher_of(solver, r_idx))
+
+    return model, extract
+
+
+ENGINES = {
+    'boolean': build_boolean_model,
+    'compact': build_compact_model,
+    'decomposed': build_decomposed_model,
+    'joint': functools.partial(build_decomposed_model, joint_teachers=True),
+}
+
+
+def greedy_schedule(requests, batch_map, classrooms, config, previous=None, ir=None):
+    """DSATUR-style constructive timetable, in milliseconds and without a solver.
+
+    Requests are the vertices of a conflict graph (same batch or same
+    teacher) and slots are its colours. The request with the fewest slots
+    left goes next (ties: the most conflicts), into the slot that spreads
+    its subject and its batch's day load best, and into the smallest free
+    compatible room. A slot leaves a request's options once its batch or
+    teacher is busy there, its teacher reached maxLoadPerDay that day, or
+    every compatible room is taken. previous placements are taken first
+    wherever they still fit.
+
+    Returns ({r_idx: Placement}, [unplaced r_idx]). Placements are not
+    fixed, so they can be handed to any engine as hints. ir is the
+    InternedInput of the requests, built here when not given.
+    """
+    previous = previous or {}
+    days = config['daysPerWeek']
+    slots_per_day = config['slotsPerDay']
+    total_slots = len(days) * slots_per_day
+    ir = ir or InternedInput(requests, batch_map, classrooms, config)
+    room_index = ir.room_index
+    # Batch, subject and teacher numbers per request, as plain lists for fast indexing
+    req_batch = ir.req_batch.tolist()
+    req_subject = ir.req_subject.tolist()
+    req_teacher = ir.req_teacher.tolist()
+    per_day_caps = [teacher.get('maxLoadPerDay') for teacher, _ in ir.teachers.values()]
+
+    # Compatible rooms, smallest first; requests with the same list share one tuple
+    room_lists = {}
+    rooms_of = []
+    for rooms in ir.req_rooms:
+        if rooms not in room_lists:
+            room_lists[rooms] = tuple(sorted(rooms, key=lambda room: classrooms[room].get('capacity', 0)))
+        rooms_of.append(room_lists[rooms])
+
+    by_batch = [[] for _ in ir.batch_ids]
+    by_teacher = [[] for _ in ir.teacher_ids]
+    by_rooms = {}
+    for r_idx in range(len(requests)):
+        by_batch[req_batch[r_idx]].append(r_idx)
+        by_teacher[req_teacher[r_idx]].append(r_idx)
+        by_rooms.setdefault(rooms_of[r_idx], []).append(r_idx)
+    lists_with_room = {}
+    for rooms in by_rooms:
+        for room in rooms:
+            lists_with_room.setdefault(room, []).append(rooms)
+
+    teacher_slots = [slots for _, slots in ir.teachers.values()]
+    options = [set(teacher_slots[req_teacher[r_idx]]) if rooms_of[r_idx] else set() for r_idx in range(len(requests))]
+    degree = [len(by_batch[req_batch[r_idx]]) + len(by_teacher[req_teacher[r_idx]]) for r_idx in range(len(requests))]
+    free_rooms = [set(range(len(classrooms))) for _ in range(total_slots)]
+    teacher_day = Counter()
+    batch_day = Counter()
+    subject_day = Counter()
+    placements = {}
+
+    heap = [(len(slots), -degree[r_idx], r_idx) for r_idx, slots in enumerate(options)]
+    heapq.heapify(heap)
+
+    def drop(r_indexes, slots):
+        for r_idx in r_indexes:
+            if r_idx not in placements and not options[r_idx].isdisjoint(slots):
+                options[r_idx].difference_update(slots)
+                heapq.heappush(heap, (len(options[r_idx]), -degree[r_idx], r_idx))
+
+    def place(r_idx, slot, room):
+        b, t = req_batch[r_idx], req_teacher[r_idx]
+        d_idx = slot // slots_per_day
+        placements[r_idx] = Placement(d_idx, slot % slots_per_day, ir.room_ids[room], False)
+        batch_day[b, d_idx] += 1
+        subject_day[b, req_subject[r_idx], d_idx] += 1
+        teacher_day[t, d_idx] += 1
+        drop(by_batch[b], (slot,))
+        drop(by_teacher[t], (slot,))
+        per_day = per_day_caps[t]
+        if per_day and teacher_day[t, d_idx] >= per_day:
+            drop(by_teacher[t], range(d_idx * slots_per_day, (d_idx + 1) * slots_per_day))
+        free_rooms[slot].discard(room)
+        for rooms in lists_with_room.get(room, ()):
+            if free_rooms[slot].isdisjoint(rooms):
+                drop(by_rooms[rooms], (slot,))
+
+    first_free = Counter() # (slot, room list) -> position of its first free room
+    def free_room(r_idx, slot):
+        # Rooms are only ever taken, so each list's position only moves forward
+        rooms = rooms_of[r_idx]
+        key = (slot, rooms)
+        while rooms[first_free[key]] not in free_rooms[slot]:
+            first_free[key] += 1
+        return rooms[first_free[key]]
+
+    # Pinned placements first, then hints, each only where it still fits
+    for r_idx, placement in sorted(previous.items(), key=lambda item: not item[1].fixed):
+        slot = placement.d_idx * slots_per_day + placement.p_idx
+        room = room_index.get(placement.room_id)
+        if slot in options[r_idx] and room in rooms_of[r_idx] and room in free_rooms[slot]:
+            place(r_idx, slot, room)
+
+    unplaced = []
+    while heap:
+        size, _, r_idx = heapq.heappop(heap)
+        if r_idx in placements or size != len(options[r_idx]):
+            continue # placed, or a stale entry
+        if not size:
+            unplaced.append(r_idx)
+            placements[r_idx] = None
+            continue
+        b, subject = req_batch[r_idx], req_subject[r_idx]
+        # Least used day for the subject, then for the batch; earliest slot in it
+        slots_by_day = {}
+        for slot in options[r_idx]:
+            slots_by_day.setdefault(slot // slots_per_day, []).append(slot)
+        d_idx = min(slots_by_day, key=lambda d: (subject_day[b, subject, d], batch_day[b, d], d))
+        slot = min(slots_by_day[d_idx])
+        place(r_idx, slot, free_room(r_idx, slot))
+
+    placements = {r_idx: placement for r_idx, placement in placements.items() if placement}
+    return placements, sorted(unplaced)
+
+
+class LocalSearch:
+    """Simulated annealing over soft penalties, starting from a feasible timetable.
+
+    Neighbourhoods: move one class to another slot (keeping its room when
+    that is free, else the first free compatible room), or swap the slots
+    of two classes of the same batch. A candidate is dropped when it would
+    break a hard constraint: batch, teacher or room overlap, the teacher's
+    available slots, room compatibility or maxLoadPerDay.
+
+    Penalties (see DEFAULT_PENALTY_WEIGHTS) are cached per batch-day,
+    teacher-day and (batch, subject)-day plus one preferredSlots term per
+    class, so a candidate is scored by re-costing only the days it touches.
+    """
+
+    DAY_TERMS = ('consecutive', 'teacherGaps', 'dailyLoad', 'subjectSpread')
+
+    def __init__(self, requests, placements, batch_map, classrooms, config, seed=0):
+        days = config['daysPerWeek']
+        self.slots_per_day = slots_per_day = config['slotsPerDay']
+        self.break_after = config.get('breakAfter', 4)
+        self.weights = penalty_weights(config)
+        self.random = random.Random(seed)
+        teachers = request_teachers(requests, days, slots_per_day)
+
+        self.preferred = {} # t_id -> preferred slots, for teachers that list any
+        for t_id, (teacher, _) in teachers.items():
+            slots = preferred_slots(teacher, days, slots_per_day)
+            if slots:
+                self.preferred[t_id] = slots
+        self.day_cap = {t_id: teacher.get('maxLoadPerDay') for t_id, (teacher, _) in teachers.items()}
+        self.available = {t_id: slots for t_id, (_, slots) in teachers.items()}
+
+        # Parallel lists over the placed classes
+        self.r_idx, self.batch, self.teacher, self.slot, self.room = [], [], [], [], []
+        self.owners = [] # (kind, id) of the class's batch, teacher and (batch, subject) pair
+        self.allowed = [] # sorted available slots of the class's teacher
+        self.rooms = [] # compatible room ids, smallest first
+        room_lists = {}
+        for r_idx, d_idx, p_idx, room_id, t_id in placements:
+            req = requests[r_idx]
+            batch = batch_map[req['batch_id']]
+            key = (req['type'], batch.get('size', 0))
+            if key not in room_lists:
+                rooms = sorted(compatible_rooms(req, batch, classrooms), key=lambda room: room.get('capacity', 0))
+                room_lists[key] = [room['id'] for room in rooms]
+            self.r_idx.append(r_idx)
+            self.batch.append(req['batch_id'])
+            self.teacher.append(t_id)
+            self.owners.append((('b', req['batch_id']), ('t', t_id), ('s', (req['batch_id'], req['subject_id']))))
+            self.slot.append(d_idx * slots_per_day + p_idx)
+            self.room.append(room_id)
+            self.allowed.append(sorted(self.available[t_id]))
+            self.rooms.append(room_lists[key])
+        self.room_sets = {id(rooms): set(rooms) for rooms in self.rooms}
+
+        self.by_batch = {}
+        self.occupant = {} # ('b' | 't' | 'r', id, slot) -> class index
+        self.periods = {} # ('b' | 't' | 's', id, d_idx) -> set of p_idx
+        sessions = Counter()
+        for i, slot in enumerate(self.slot):
+            self.by_batch.setdefault(self.batch[i], []).append(i)
+            for key in self.slot_keys(i, slot, self.room[i]):
+                self.occupant[key] = i
+            for kind, entity in self.owners[i]:
+                self.periods.setdefault((kind, entity, slot // slots_per_day), set()).add(slot % slots_per_day)
+                sessions[kind, entity] += 1
+        # Even spread: ceil(sessions / days) classes a day
+        self.share = {key: -(-count // len(days)) for key, count in sessions.items()}
+
+        self.day_cost = {key: self.cost_of_day(key, periods) for key, periods in self.periods.items()}
+        self.total = sum(self.day_cost.values()) + sum(self.cost_of_slot(i, slot) for i, slot in enumerate(self.slot))
+
+    def slot_keys(self, i, slot, room):
+        return (('b', self.batch[i], slot), ('t', self.teacher[i], slot), ('r', room, slot))
+
+    def day_terms(self, key, periods):
+        """DAY_TERMS counts of one batch-day, teacher-day or (batch, subject)-day."""
+        if key[0] == 's':
+            return 0, 0, 0, max(0, len(periods) - self.share[key[:2]])
+        consecutive = 0
+        run = 0
+        last = None
+        for p_idx in sorted(periods):
+            # The break (after period breakAfter) ends a run
+            run = run + 1 if last == p_idx - 1 and p_idx != self.break_after else 1
+            if run > MAX_CONSECUTIVE:
+                consecutive += 1
+            last = p_idx
+        gaps = max(periods) - min(periods) + 1 - len(periods) if key[0] == 't' and periods else 0
+        load = max(0, len(periods) - self.share[key[:2]])
+        return consecutive, gaps, load, 0
+
+    def cost_of_day(self, key, periods):
+        return sum(count * self.weights[term] for term, count in zip(self.DAY_TERMS, self.day_terms(key, periods)) if count)
+
+    def cost_of_slot(self, i, slot):
+        preferred = self.preferred.get(self.teacher[i])
+        return self.weights['preferredSlots'] if preferred and slot not in preferred else 0
+
+    def evaluate(self, changes):
+        """(penalty delta, new period sets) of changes [(i, slot, room)]; None if a hard constraint breaks."""
+        moving = {i for i, _, _ in changes}
+        claimed = set()
+        for i, slot, room in changes:
+            if room not in self.room_sets[id(self.rooms[i])] or slot not in self.available[self.teacher[i]]:
+                return None
+            for key in self.slot_keys(i, slot, room):
+                if key in claimed or self.occupant.get(key, i) not in moving:
+                    return None
+                claimed.add(key)
+
+        periods = self.changed_periods(changes)
+        delta = sum(self.cost_of_slot(i, slot) - self.cost_of_slot(i, self.slot[i]) for i, slot, _ in changes)
+        for key, new in periods.items():
+            cap = self.day_cap.get(key[1]) if key[0] == 't' else None
+            if cap and len(new) > cap and len(new) > len(self.periods.get(key, ())):
+                return None
+            delta += self.cost_of_day(key, new) - self.day_cost.get(key, 0)
+        return delta, periods
+
+    def changed_periods(self, changes):
+        """New period sets of every batch-day, teacher-day and pair-day the changes touch."""
+        spd = self.slots_per_day
+        periods = {}
+        for i, _, _ in changes:
+            for kind, entity in self.owners[i]:
+                key = (kind, entity, self.slot[i] // spd)
+                periods.setdefault(key, set(self.periods[key])).discard(self.slot[i] % spd)
+        for i, slot, _ in changes:
+            for kind, entity in self.owners[i]:
+                key = (kind, entity, slot // spd)
+                periods.setdefault(key, set(self.periods.get(key, ()))).add(slot % spd)
+        return periods
+
+    def apply(self, changes, periods):
+        for i, _, _ in changes:
+            for key in self.slot_keys(i, self.slot[i], self.room[i]):
+                del self.occupant[key]
+        for i, slot, room in changes:
+            self.total += self.cost_of_slot(i, slot) - self.cost_of_slot(i, self.slot[i])
+            self.slot[i] = slot
+            self.room[i] = room
+            for key in self.slot_keys(i, slot, room):
+                self.occupant[key] = i
+        for key, new in periods.items():
+            cost = self.cost_of_day(key, new)
+            self.total += cost - self.day_cost.get(key, 0)
+            self.periods[key] = new
+            self.day_cost[key] = cost
+
+    def free_room(self, i, slot, moving=()):
+        """The class's own room if free at slot, else the first free compatible one."""
+        for room in itertools.chain((self.room[i],), self.rooms[i]):
+            if self.occupant.get(('r', room, slot), i) in (i, *moving):
+                return room
+        return None
+
+    def neighbour(self):
+        i = self.random.randrange(len(self.slot))
+        if self.random.random() < 0.5:
+            j = self.random.choice(self.by_batch[self.batch[i]])
+            if j == i:
+                return None
+            room_i = self.free_room(i, self.slot[j], (j,))
+            room_j = self.free_room(j, self.slot[i], (i,))
+            if room_i is None or room_j is None or (room_i == room_j and self.slot[i] == self.slot[j]):
+                return None
+            return [(i, self.slot[j], room_i), (j, self.slot[i], room_j)]
+        slot = self.random.choice(self.allowed[i]) if self.allowed[i] else self.slot[i]
+        room = self.free_room(i, slot)
+        if slot == self.slot[i] or room is None:
+            return None
+        return [(i, slot, room)]
+
+    def placements(self, slots=None, rooms=None):
+        """(r_idx, d_idx, p_idx, room_id, teacher_id) per class, of the current state or the given one."""
+        spd = self.slots_per_day
+        slots = self.slot if slots is None else slots
+        rooms = self.room if rooms is None else rooms
+        return [(self.r_idx[i], slot // spd, slot % spd, rooms[i], self.teacher[i]) for i, slot in enumerate(slots)]
+
+    def breakdown(self):
+        """Penalty counts per term, recomputed from scratch."""
+        counts = Counter()
+        for key, periods in self.periods.items():
+            for term, count in zip(self.DAY_TERMS, self.day_terms(key, periods)):
+                counts[term] += count
+        counts['preferredSlots'] = sum(1 for i, slot in enumerate(self.slot) if self.cost_of_slot(i, slot))
+        return {term: counts[term] for term in DEFAULT_PENALTY_WEIGHTS}
+
+    def run(self, time_limit, on_improvement=None, emit_interval=0.5):
+        """Anneal for time_limit seconds (or until no penalty is left) and end on the best timetable seen.
+
+        on_improvement(placements, penalty, elapsed) is called for new best
+        timetables, at most every emit_interval seconds, and once more at
+        the end if the last one was not reported yet. Returns the number
+        of moves made.
+        """
+        start = time.perf_counter()
+        if not self.slot or time_limit <= 0:
+            return 0
+        # Temperature falls geometrically from about one weighted penalty to near zero
+        hot = max(self.weights.values()) or 1
+        cold = hot / 100
+        temperature = hot
+        best_cost = self.total
+        best = None # snapshot of the best state, taken when leaving it
+        reported = True
+        last_emit = start
+        moves = 0
+        iterations = 0
+
+        while True:
+            if iterations % 256 == 0:
+                now = time.perf_counter()
+                if now - start >= time_limit or best_cost == 0:
+                    break
+                temperature = hot * (cold / hot) ** ((now - start) / time_limit)
+                if on_improvement and not reported and now - last_emit >= emit_interval:
+                    on_improvement(self.placements(*(best or ())), best_cost, now - start)
+                    reported = True
+                    last_emit = now
+            iterations += 1
+
+            changes = self.neighbour()
+            if not changes:
+                continue
+            result = self.evaluate(changes)
+            if result is None:
+                continue
+            delta, periods = result
+            if delta > 0 and self.random.random() >= math.exp(-delta / temperature):
+                continue
+            if delta > 0 and best is None and self.total == best_cost:
+                best = (list(self.slot), list(self.room))
+            self.apply(changes, periods)
+            moves += 1
+            if self.total < best_cost:
+                best_cost = self.total
+                best = None
+                reported = False
+
+        if best is not None:
+            # Back to the best state
+            slots, rooms = best
+            changes = [(i, slot, rooms[i]) for i, slot in enumerate(slots)
+                       if (slot, rooms[i]) != (self.slot[i], self.room[i])]
+            self.apply(changes, self.changed_periods(changes))
+        if on_improvement and not reported:
+            on_improvement(self.placements(), self.total, time.perf_counter() - start)
+        return moves
+
+
+def improve_schedule(requests, placements, batch_map, classrooms, config, time_limit, on_improvement=None, seed=0):
+    """Run LocalSearch on engine placements for time_limit seconds; returns the improved placements."""
+    search = LocalSearch(requests, placements, batch_map, classrooms, config, seed)
+    initial = search.total
+    start = time.perf_counter()
+    moves = search.run(time_limit, on_improvement)
+    sys.stderr.write(f"Local search: penalty {initial} -> {search.total} ({json.dumps(search.breakdown())}) "
+                     f"after {moves} moves in {time.perf_counter() - start:.2f}s.\n")
+    return search.placements()
+
+
+def max_flow(capacity, source, sink):
+    """Edmonds-Karp on capacity = {u: {v: cap}} (modified into the residual graph).
+
+    Returns (flow value, nodes still reachable from source): the reachable
+    side of a minimum cut. Direct source -> u -> v -> sink paths are
+    saturated greedily first, so the BFS augmentations only have to
+    reroute what is left.
+    """
+    def push(path, amount):
+        for u, v in path:
+            capacity[u][v] -= amount
+            # Reverse edges only exist once flow has been pushed forward
+            reverse = capacity.setdefault(v, {})
+            reverse[u] = reverse.get(u, 0) + amount
+
+    flow = 0
+    for u in list(capacity[source]):
+        for v in list(capacity.get(u, {})):
+            pushed = min(capacity[source][u], capacity[u][v], capacity.get(v, {}).get(sink, 0))
+            if pushed > 0:
+                push([(source, u), (u, v), (v, sink)], pushed)
+                flow += pushed
+
+    while True:
+        parent = {source: None}
+        queue = [source]
+        for u in queue:
+            for v, cap in capacity.get(u, {}).items():
+                if cap > 0 and v not in parent:
+                    parent[v] = u
+                    queue.append(v)
+        if sink not in parent:
+            return flow, set(parent)
+
+        path = []
+        v = sink
+        while parent[v] is not None:
+            path.append((parent[v], v))
+            v = parent[v]
+        pushed = min(capacity[u][v] for u, v in path)
+        push(path, pushed)
+        flow += pushed
+
+
+def hall_violator(unmatched, options, assignment):
+    """Requests reachable by alternating paths from the unmatched ones, and their options.
+
+    After a maximum matching (match_rooms) these requests have fewer
+    options between them than members: the bottleneck that proves no
+    complete matching exists.
+    """
+    owner = {option: r_idx for r_idx, option in assignment.items()}
+    members = set(unmatched)
+    reached = set()
+    queue = list(unmatched)
+    for r_idx in queue:
+        for option in options[r_idx]:
+            if option in reached:
+                continue
+            reached.add(option)
+            if option in owner and owner[option] not in members:
+                members.add(owner[option])
+                queue.append(owner[option])
+    return members, reached
+
+
+def check_feasibility(requests, batch_map, classrooms, config, joint_teachers=False):
+    """Counting and Hall-type bounds every engine's model has to satisfy.
+
+    Runs before any model is built and takes milliseconds. Checks:
+    - batch_slots: a batch's sessions each need their own slot in which
+      their teacher is free (bipartite matching of sessions to slots).
+    - teacher_load: a teacher's sessions fit their free slots under maxLoadPerDay.
+    - room_slots: sessions confined to a set of compatible rooms fit its room-slots.
+    - teacher_supply: max flow from (batch, subject) demand to qualified
+      teachers. With joint_teachers it is checked against free slots; in
+      all engines also against maxLoadPerWeek.
+
+    Returns {'feasible', 'summary', 'issues', 'elapsed'}. Each issue has
+    the check, severity, the bottleneck entities, demand, capacity and a
+    message. 'error' issues make every timetable impossible. 'warning'
+    issues break maxLoadPerWeek, which a fixed teacher assignment cannot
+    honour (generate_requests reports those too).
+    """
+    start = time.perf_counter()
+    days = config['daysPerWeek']
+    slots_per_day = config['slotsPerDay']
+    total_slots = len(days) * slots_per_day
+    teachers = request_teachers(requests, days, slots_per_day)
+    issues = []
+
+    @functools.lru_cache(maxsize=None)
+    def teacher_capacity(t_id):
+        """Sessions a teacher can give per week: free slots, at most maxLoadPerDay a day."""
+        teacher, t_slots = teachers[t_id]
+        per_day = teacher.get('maxLoadPerDay')
+        free_per_day = Counter(slot // slots_per_day for slot in t_slots)
+        return sum(min(free, per_day) if per_day else free for free in free_per_day.values())
+
+    # Candidate tuples are shared per teacher group, so key them by identity
+    free_slot_cache = {}
+
+    def free_slots(req):
+        """Sorted slots in which the request's teacher (any candidate, if joint) is free."""
+        candidates = req['candidate_teachers'] if joint_teachers else None
+        key = id(candidates) if joint_teachers else req['teacher_id']
+        if key not in free_slot_cache:
+            if joint_teachers:
+                slots = set().union(*(teachers[t['id']][1] for t in candidates))
+            else:
+                slots = teachers[key][1]
+            free_slot_cache[key] = (candidates, sorted(slots))
+        return free_slot_cache[key][1]
+
+    # batch_slots
+    by_batch = {}
+    for r_idx, req in enumerate(requests):
+        by_batch.setdefault(req['batch_id'], []).append(r_idx)
+    for b_id, members in by_batch.items():
+        options = {r_idx: free_slots(requests[r_idx]) for r_idx in members}
+        assignment = match_rooms(members, options)
+        if len(assignment) == len(members):
+            continue
+        unmatched = [r_idx for r_idx in members if r_idx not in assignment]
+        stuck, reachable_slots = hall_violator(unmatched, options, assignment)
+        subjects = sorted({requests[r_idx]['subject_id'] for r_idx in stuck})
+        teacher_ids = sorted({requests[r_idx]['teacher_id'] for r_idx in stuck})
+        issues.append({
+            'check': 'batch_slots',
+            'severity': 'error',
+            'batch': b_id,
+            'subjects': subjects,
+            'teachers': teacher_ids,
+            'demand': len(stuck),
+            'capacity': len(reachable_slots),
+            'message': f"Batch {b_id} needs {len(stuck)} slots for {len(subjects)} subject(s) "
+                       f"but their teachers are free in only {len(reachable_slots)}",
+        })
+
+    # teacher_load (joint_teachers: covered by teacher_supply)
+    if not joint_teachers:
+        sessions = Counter(req['teacher_id'] for req in requests)
+        for t_id, demand in sessions.items():
+            capacity = teacher_capacity(t_id)
+            if demand > capacity:
+                issues.append({
+                    'check': 'teacher_load',
+                    'severity': 'error',
+                    'teacher': t_id,
+                    'demand': demand,
+                    'capacity': capacity,
+                    'message': f"Teacher {t_id} has {demand} sessions but only {capacity} free slots "
+                               f"within maxLoadPerDay",
                 })
-    
-    # 4. Fill Vacant Slots (Post-Processing)
+
+    # room_slots
+    room_sets = Counter()
+    room_set_of = {} # (type, batch size) -> compatible room ids
+    for members in session_groups(requests):
+        req = requests[members[0]]
+        batch = batch_map[req['batch_id']]
+        key = (req['type'], batch.get('size', 0))
+        if key not in room_set_of:
+            room_set_of[key] = frozenset(room['id'] for room in compatible_rooms(req, batch, classrooms))
+        room_sets[room_set_of[key]] += len(members)
+    for room_set in room_sets:
+        demand = sum(count for other, count in room_sets.items() if other <= room_set)
+        capacity = len(room_set) * total_slots
+        if demand > capacity:
+            issues.append({
+                'check': 'room_slots',
+                'severity': 'error',
+                'rooms': sorted(room_set),
+                'demand': demand,
+                'capacity': capacity,
+                'message': f"{demand} sessions fit only {len(room_set)} room(s), "
+                           f"{capacity} room-slots in the week",
+            })
+
+    # teacher_supply: pairs sharing a candidate tuple pool their demand in
+    # one flow node (same max flow, far fewer edges for large groups)
+    pairs = Counter()
+    pools = {} # id(candidates) -> [candidates, demand, pairs]
+    for req in requests:
+        pair = (req['batch_id'], req['subject_id'])
+        pairs[pair] += 1
+        pool = pools.setdefault(id(req['candidate_teachers']), [req['candidate_teachers'], 0, set()])
+        pool[1] += 1
+        pool[2].add(pair)
+    supply_checks = [('warning', 'maxLoadPerWeek')]
+    if joint_teachers:
+        supply_checks.insert(0, ('error', None))
+    for severity, cap_field in supply_checks:
+        graph = {'source': {}}
+        for key, (candidates, demand, _) in pools.items():
+            graph['source'][('pool', key)] = demand
+            graph[('pool', key)] = {('teacher', t['id']): demand for t in candidates}
+        for t_id, (teacher, _) in teachers.items():
+            capacity = teacher_capacity(t_id)
+            if cap_field and teacher.get(cap_field):
+                capacity = min(capacity, teacher[cap_field])
+            graph.setdefault(('teacher', t_id), {})['sink'] = capacity
+        flow, reachable = max_flow(graph, 'source', 'sink')
+        reachable.discard('source')
+        total = len(requests)
+        if flow == total:
+            continue
+        if severity == 'warning' and any(issue['severity'] == 'error' for issue in issues):
+            break
+        # Min cut: the reachable pairs can only use the reachable (saturated) teachers
+        cut_pairs = [pair for node in reachable if node[0] == 'pool' for pair in pools[node[1]][2]]
+        cut_teachers = sorted(node[1] for node in reachable if node[0] == 'teacher')
+        demand = sum(pairs[pair] for pair in cut_pairs)
+        capacity = demand - (total - flow)
+        limit = 'free slots and maxLoadPerDay' + (f' and {cap_field}' if cap_field else '')
+        issues.append({
+            'check': 'teacher_supply',
+            'severity': severity,
+            'teachers': cut_teachers,
+            'subjects': sorted({subject for _, subject in cut_pairs}),
+            'demand': demand,
+            'capacity': capacity,
+            'message': f"{demand} sessions can only be taught by {len(cut_teachers)} teacher(s) "
+                       f"with room for {capacity} under {limit}",
+        })
+
+    errors = [issue for issue in issues if issue['severity'] == 'error']
+    if errors:
+        summary = errors[0]['message'] + (f" (and {len(errors) - 1} more)" if len(errors) > 1 else '')
+    else:
+        summary = f"no bound violated ({len(issues)} warning(s))"
+    return {
+        'feasible': not errors,
+        'stage': 'precheck',
+        'summary': summary,
+        'issues': issues,
+        'elapsed': round(time.perf_counter() - start, 4),
+    }
+
+
+def infeasible_core(requests, batch_map, classrooms, config, time_limit=10.0):
+    """A small set of entities whose constraints alone already admit no timetable.
+
+    Rebuilds the time-only model of the decomposed engine (with the
+    pre-assigned teachers) and guards each constraint family with one
+    assumption literal per entity: a (batch, subject)'s sessions, a
+    batch's no-overlap, a teacher's no-overlap and maxLoadPerDay, and a
+    room set's per-slot cap. CP-SAT reports a sufficient subset of the
+    assumptions, which is then shrunk one entity at a time while the rest
+    stays infeasible, within time_limit overall.
+
+    Returns a list of {'kind', ...ids} dicts; [] when the relaxation is
+    feasible or nothing was proven in time.
+    """
+    deadline = time.perf_counter() + time_limit
+    days = config['daysPerWeek']
+    slots_per_day = config['slotsPerDay']
+    total_slots = len(days) * slots_per_day
+    teachers = request_teachers(requests, days, slots_per_day)
+    groups = session_groups(requests)
+
+    model = cp_model.CpModel()
+    entities = [] # parallel to literals
+    literals = []
+
+    def guard(entity):
+        literal = model.NewBoolVar(f"assume_{len(literals)}")
+        entities.append(entity)
+        literals.append(literal)
+        return literal
+
+    y = []
+    by_batch = {}
+    by_teacher = {}
+    room_sets = {}
+    for g_idx, members in enumerate(groups):
+        req = requests[members[0]]
+        group_vars = {slot: model.NewBoolVar(f'req_{members[0]}_s{slot}') for slot in sorted(teachers[req['teacher_id']][1])}
+        y.append(group_vars)
+        required = guard({'kind': 'sessions', 'batch': req['batch_id'], 'subject': req['subject_id'],
+                          'teacher': req['teacher_id'], 'sessions': len(members)})
+        model.Add(sum(group_vars.values()) == len(members)).OnlyEnforceIf(required)
+        by_batch.setdefault(req['batch_id'], []).append(g_idx)
+        by_teacher.setdefault(req['teacher_id'], []).append(g_idx)
+        rooms = compatible_rooms(req, batch_map[req['batch_id']], classrooms)
+        room_sets.setdefault(frozenset(room['id'] for room in rooms), []).append(g_idx)
+
+    def at_most(group_ids, slots, limit, literal):
+        for slot in slots:
+            slot_vars = [y[g_idx][slot] for g_idx in group_ids if slot in y[g_idx]]
+            if len(slot_vars) > limit:
+                model.Add(sum(slot_vars) <= limit).OnlyEnforceIf(literal)
+
+    for b_id, group_ids in by_batch.items():
+        at_most(group_ids, range(total_slots), 1, guard({'kind': 'batch', 'batch': b_id}))
+
+    for t_id, group_ids in by_teacher.items():
+        literal = guard({'kind': 'teacher', 'teacher': t_id})
+        at_most(group_ids, range(total_slots), 1, literal)
+        per_day = teachers[t_id][0].get('maxLoadPerDay')
+        if per_day:
+            for d_idx in range(len(days)):
+                day_vars = [y[g_idx][slot] for g_idx in group_ids
+                            for slot in range(d_idx * slots_per_day, (d_idx + 1) * slots_per_day) if slot in y[g_idx]]
+                if len(day_vars) > per_day:
+                    model.Add(sum(day_vars) <= per_day).OnlyEnforceIf(literal)
+
+    for room_set in room_sets:
+        confined = [g_idx for other, group_ids in room_sets.items() if other <= room_set for g_idx in group_ids]
+        if len(confined) > len(room_set):
+            at_most(confined, range(total_slots), len(room_set), guard({'kind': 'rooms', 'rooms': sorted(room_set)}))
+
+    def infeasible_with(assumed):
+        """Sufficient assumption indices if infeasible, None if not (or not proven in time)."""
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return None
+        model.ClearAssumptions()
+        model.AddAssumptions([literals[i] for i in assumed])
+        solver = cp_model.CpSolver()
+        solver.parameters.max_time_in_seconds = remaining
+        # Cores come from the single-worker search; the full LP relaxation
+        # lets it prove counting arguments (e.g. a day cap) quickly
+        solver.parameters.num_workers = 1
+        solver.parameters.linearization_level = 2
+        if solver.Solve(model) != cp_model.INFEASIBLE:
+            return None
+        return [assumption_of[i] for i in solver.SufficientAssumptionsForInfeasibility()]
+
+    assumption_of = {literal.Index(): i for i, literal in enumerate(literals)}
+    core = infeasible_with(range(len(literals)))
+    if core is None:
+        return []
+
+    # Deletion pass: drop every entity the rest stays infeasible without
+    for i in list(core):
+        if i not in core:
+            continue
+        smaller = infeasible_with([j for j in core if j != i])
+        if smaller is not None:
+            core = smaller
+
+    return [entities[i] for i in sorted(core)]
+
+
+def previous_teachers(schedule):
+    """(batch_id, subject_id) -> teacherId from a stored schedule."""
+    preferred = {}
+    for entry in schedule:
+        if entry.get('subjectId') == "SELF-STUDY":
+            continue
+        for b_id in entry.get('batchIds', []):
+            preferred.setdefault((b_id, entry['subjectId']), entry['teacherId'])
+    return preferred
+
+
+def match_previous_schedule(requests, schedule, teachers, classrooms, batch_map, days, slots_per_day, freeze=False,
+                            scope='slot'):
+    """Map requests onto the entries of a stored schedule.
+
+    Each request takes one old entry of the same (batch, subject). An
+    entry is kept as a hint when its day, period and room still exist.
+    With freeze=True it is pinned instead, unless the change touches it.
+    A request is affected by the change when its teacher changed or is
+    absent, or it has no usable old entry (e.g. a newly added subject, or
+    an entry in a slot its teacher is now unavailable in or a room that no
+    longer suits it). What else is left free depends on `scope`:
+
+    'slot': only the entries in the way of an affected request, i.e. those
+    of its batch or its (new) teacher in the slot it is hinted at. The
+    rest of the week stays pinned, so one absent teacher re-plans their
+    own classes and the few they collide with.
+
+    'resource': every entry of a batch or teacher an affected request
+    touches; the fallback when the pins of 'slot' leave no timetable.
+
+    Returns {r_idx: Placement}.
+    """
+    day_index = {day: d_idx for d_idx, day in enumerate(days)}
+    room_ids = {room['id'] for room in classrooms}
+    absent = {t['id'] for t in teachers if t.get('isAbsent')}
+    open_slots = {t['id']: set(available_slots(t, days, slots_per_day)) for t in teachers}
+
+    old_entries = {}
+    for entry in schedule:
+        if entry.get('subjectId') == "SELF-STUDY":
+            continue
+        if entry.get('day') not in day_index or not 1 <= entry.get('period', 0) <= slots_per_day:
+            continue
+        if entry.get('classroomId') not in room_ids:
+            continue
+        for b_id in entry.get('batchIds', []):
+            old_entries.setdefault((b_id, entry['subjectId']), []).append(entry)
+
+    # Hand out old entries in slot order, matching the sibling ordering the engines impose
+    for entries in old_entries.values():
+        entries.sort(key=lambda entry: (day_index[entry['day']], entry['period']))
+
+    previous = {}
+    unchanged = set()
+    affected = []
+    # 'resource' scope: batches and teachers the change touches (their old teachers included)
+    touched_batches = set()
+    touched_teachers = set(absent)
+
+    for r_idx, req in enumerate(requests):
+        entries = old_entries.get((req['batch_id'], req['subject_id']))
+        if not entries:
+            affected.append(r_idx)
+            touched_batches.add(req['batch_id'])
+            touched_teachers.add(req['teacher_id'])
+            continue
+
+        entry = entries.pop(0)
+        placement = Placement(day_index[entry['day']], entry['period'] - 1, entry['classroomId'], False)
+        rooms = compatible_rooms(req, batch_map[req['batch_id']], classrooms)
+        if (placement.d_idx * slots_per_day + placement.p_idx not in open_slots.get(req['teacher_id'], ())
+                or all(room['id'] != placement.room_id for room in rooms)):
+            affected.append(r_idx)
+            touched_batches.add(req['batch_id'])
+            touched_teachers.add(req['teacher_id'])
+            continue
+        previous[r_idx] = placement
+        if entry['teacherId'] == req['teacher_id']:
+            unchanged.add(r_idx)
+        else:
+            affected.append(r_idx)
+            touched_batches.add(req['batch_id'])
+            touched_teachers.update((req['teacher_id'], entry['teacherId']))
+
+    if not freeze:
+        return previous
+
+    if scope == 'resource':
+        def keeps_pin(req, placement):
+            return req['batch_id'] not in touched_batches and req['teacher_id'] not in touched_teachers
+    else:
+        # (batch, slot) and (teacher, slot) an affected request wants to stay in
+        wanted = set()
+        for r_idx in affected:
+            if r_idx in previous:
+                req, slot = requests[r_idx], previous[r_idx][:2]
+                wanted.update((('batch', req['batch_id'], slot), ('teacher', req['teacher_id'], slot)))
+
+        def keeps_pin(req, placement):
+            slot = placement[:2]
+            return ('batch', req['batch_id'], slot) not in wanted and ('teacher', req['teacher_id'], slot) not in wanted
+
+    for r_idx in unchanged:
+        if keeps_pin(requests[r_idx], previous[r_idx]):
+            previous[r_idx] = previous[r_idx]._replace(fixed=True)
+    return previous
+
+
+def fill_vacant_slots(final_schedule, batches, classrooms, teachers, days, slots_per_day):
     # Goal: No lecture left vacant.
     # Strategy: For each batch, find empty slots. Assign "Self Study" or "Library".
-    # Try to assign a room (any available).
-    # Try to assign a teacher (any available, or None).
+    # Assign the first free room (in classroom order) and the first free
+    # teacher (in teacher order, else a placeholder supervisor). Absent
+    # teachers and unavailable slots count as busy.
+    #
+    # Works on boolean occupancy matrices (slot x room, slot x teacher,
+    # slot x batch). Within one slot the k-th vacant batch gets the k-th
+    # free room and the k-th free teacher; slots are independent, so all
+    # gaps are resolved in bulk. Batches beyond the free-room count stay
+    # vacant, exactly as the one-by-one scan would leave them.
+    total_slots = len(days) * slots_per_day
+    day_index = {day: d_idx for d_idx, day in enumerate(days)}
+    room_index = {r['id']: i for i, r in enumerate(classrooms)}
+    teacher_index = {t['id']: i for i, t in enumerate(teachers)}
+    batch_index = {b['id']: i for i, b in enumerate(batches)}
 
-    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
-        # Build quick lookup for occupied resources
-        occupied_rooms = set()
-        occupied_teachers = set()
-        batch_occupied_slots = set()
-
-        for entry in final_schedule:
-            d = entry['day']
-            p = entry['period']
-            occupied_rooms.add((d, p, entry['classroomId']))
-            occupied_teachers.add((d, p, entry['teacherId']))
-            for b_id in entry['batchIds']:
-                batch_occupied_slots.add((d, p, b_id))
-
-        # Iterate all batches, days, periods
-        for batch in batches:
-            b_id = batch['id']
-            for day in days:
-                for p_idx in range(slots_per_day):
-                    period = p_idx + 1
-                    
-                    if (day, period, b_id) in batch_occupied_slots:
-                        continue
-                    
-                    # Found empty slot for this batch
-                    # Find a room
-                    assigned_room = None
-                    for r in classrooms:
-                        if (day, period, r['id']) not in occupied_rooms:
-                            assigned_room = r
-                            break
-                    
-                    if not assigned_room:
-                        # No room available? Reuse a large room or just mark as 'Ground'?
-                        # For now, if no room, we can't schedule.
-                         continue
-
-                    # Find a teacher? Optional for Self Study.
-                    assigned_teacher_id = "SELF-STUDY-SUPERVISOR" 
-                    # Try to find a real teacher who is free
-                    for t in teachers:
-                         if (day, period, t['id']) not in occupied_teachers:
-                             assigned_teacher_id = t['id']
-                             occupied_teachers.add((day, period, t['id'])) # Mark busy
-                             break
-                    
-                    # Add to schedule
-                    final_schedule.append({
-                        'id': f"auto_fill_{b_id}_{day}_{period}",
-                        'subjectId': "SELF-STUDY", # Special ID
-                        'teacherId': assigned_teacher_id,
-                        'classroomId': assigned_room['id'],
-                        'batchIds': [b_id],
-                        'day': day,
-                        'period': period
-                    })
-                    
-                    occupied_rooms.add((day, period, assigned_room['id']))
-                    batch_occupied_slots.add((day, period, b_id))
+    room_busy = np.zeros((total_slots, len(classrooms)), dtype=bool)
+    teacher_busy = np.zeros((total_slots, len(teachers)), dtype=bool)
+    batch_busy = np.zeros((total_slots, len(batches)), dtype=bool)
+
+    for t_idx, t in enumerate(teachers):
+        if t.get('isAbsent') or t.get('unavailableSlots'):
+            teacher_busy[:, t_idx] = True
+            teacher_busy[available_slots(t, days, slots_per_day), t_idx] = False
+
+    for entry in final_schedule:
+        slot = day_index[entry['day']] * slots_per_day + entry['period'] - 1
+        if entry['classroomId'] in room_index:
+            room_busy[slot, room_index[entry['classroomId']]] = True
+        if entry['teacherId'] in teacher_index:
+            teacher_busy[slot, teacher_index[entry['teacherId']]] = True
+        for b_id in entry['batchIds']:
+            if b_id in batch_index:
+                batch_busy[slot, batch_index[b_id]] = True
+
+    # Per slot: free resources listed first, in their original order (stable sort)
+    free_batches = np.argsort(batch_busy, axis=1, kind='stable')
+    free_rooms = np.argsort(room_busy, axis=1, kind='stable')
+    free_teachers = np.argsort(teacher_busy, axis=1, kind='stable')
+    num_free_teachers = (~teacher_busy).sum(axis=1)
+
+    # Vacant batches that also get a room
+    num_filled = np.minimum((~batch_busy).sum(axis=1), (~room_busy).sum(axis=1))
+    slot_ids, ranks = np.nonzero(np.arange(len(batches)) < num_filled[:, None])
+
+    fill_batches = free_batches[slot_ids, ranks]
+    fill_rooms = free_rooms[slot_ids, ranks] if len(classrooms) else ranks
+    has_teacher = ranks < num_free_teachers[slot_ids]
+    fill_teachers = free_teachers[slot_ids, np.where(has_teacher, ranks, 0)] if len(teachers) else ranks
+
+    # Emit in batch, day, period order
+    for i in np.lexsort((slot_ids, fill_batches)):
+        b_id = batches[fill_batches[i]]['id']
+        day = days[slot_ids[i] // slots_per_day]
+        period = int(slot_ids[i] % slots_per_day) + 1
+        # Teacher is optional for Self Study
+        assigned_teacher_id = teachers[fill_teachers[i]]['id'] if has_teacher[i] else "SELF-STUDY-SUPERVISOR"
+
+        final_schedule.append({
+            'id': f"auto_fill_{b_id}_{day}_{period}",
+            'subjectId': "SELF-STUDY", # Special ID
+            'teacherId': assigned_teacher_id,
+            'classroomId': classrooms[fill_rooms[i]]['id'],
+            'batchIds': [b_id],
+            'day': day,
+            'period': period
+        })
 
     return final_schedule
 
+
+def penalty_weights(config):
+    """DEFAULT_PENALTY_WEIGHTS, then config['penaltyWeights']."""
+    weights = dict(DEFAULT_PENALTY_WEIGHTS)
+    weights.update(config.get('penaltyWeights') or {})
+    return weights
+
+
+def resolve_solver_profile(config, overrides=None):
+    """Defaults, then config['solver'], then explicit (CLI) overrides."""
+    profile = dict(DEFAULT_SOLVER_PROFILE)
+    profile.update(config.get('solver') or {})
+    profile.update({k: v for k, v in (overrides or {}).items() if v is not None})
+    return profile
+
+
+def apply_solver_profile(solver, profile):
+    params = solver.parameters
+    params.max_time_in_seconds = float(profile['timeLimit'])
+    params.num_workers = int(profile['workers'])
+    if profile.get('seed') is not None:
+        params.random_seed = int(profile['seed'])
+
+    presolve = int(profile['presolve'])
+    if presolve <= 0:
+        params.cp_model_presolve = False
+    elif presolve == 1:
+        params.cp_model_probing_level = 0
+
+    branching = getattr(type(params).SearchBranching, f"{profile['strategy'].upper()}_SEARCH", None)
+    if branching is None:
+        raise ValueError(f"Unknown search strategy '{profile['strategy']}'")
+    params.search_branching = branching
+
+
+class SolutionStreamer(cp_model.CpSolverSolutionCallback):
+    """Calls on_solution(callback) for every solution CP-SAT finds.
+
+    The callback object answers Value() like a solver, so the engines'
+    extract functions work on it unchanged.
+    """
+
+    def __init__(self, on_solution):
+        super().__init__()
+        self.on_solution = on_solution
+
+    def on_solution_callback(self):
+        self.on_solution(self)
+
+
+def run_solver(model, profile=None, callback=None, complete_hint=False):
+    solver = cp_model.CpSolver()
+    apply_solver_profile(solver, profile or DEFAULT_SOLVER_PROFILE)
+    if complete_hint:
+        # Presolve's symmetry reductions can cut off the hinted timetable,
+        # which then has to be repaired instead of being taken as is
+        solver.parameters.keep_symmetry_in_presolve = True
+    status = solver.Solve(model, callback)
+    return solver, status
+
+
+def sharing_components(requests):
+    """Requests that share a batch or a teacher, directly or transitively, as lists of r_idx, largest first.
+
+    Every candidate teacher links its batches, not only the assigned one, so
+    a component keeps the same teacher choices as the whole. Rooms are left
+    out: nearly every request could use nearly every room of its type, so
+    they are split between components by reserve_rooms instead.
+    """
+    parent = {}
+
+    def find(node):
+        parent.setdefault(node, node)
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    seen = set() # candidate tuples are shared per teacher group
+    for req in requests:
+        batch = find(('b', req['batch_id']))
+        if (batch, id(req['candidate_teachers'])) in seen:
+            continue
+        seen.add((batch, id(req['candidate_teachers'])))
+        for t in req['candidate_teachers']:
+            parent[find(('t', t['id']))] = find(batch)
+
+    components = {}
+    for r_idx, req in enumerate(requests):
+        components.setdefault(find(('b', req['batch_id'])), []).append(r_idx)
+    return sorted(components.values(), key=len, reverse=True)
+
+
+def reserve_rooms(requests, batch_map, classrooms, components, total_slots):
+    """Split the classrooms between components: one list of rooms per component, or None.
+
+    Rooms go out largest first, each to the component with the largest
+    batch it can seat whose sessions no reserved room covers yet (a room
+    covers total_slots sessions). Once every session is covered, the rest
+    go where requests per room are highest. None when some component's
+    sessions cannot be covered by whole rooms.
+    """
+    global_sets = {}
+    uncovered = [] # per component: Counter of (type, size) -> sessions; type None = any room
+    for members in components:
+        needs = Counter()
+        for r_idx in members:
+            req = requests[r_idx]
+            size = batch_map[req['batch_id']].get('size', 0)
+            key = (req['type'], size)
+            if key not in global_sets:
+                global_sets[key] = any(room.get('type', 'Theory') == req['type'] and room.get('capacity', 0) >= size
+                                       for room in classrooms)
+            # No room fits anywhere: compatible_rooms falls back to every room
+            needs[key if global_sets[key] else (None, 0)] += 1
+        uncovered.append(needs)
+
+    reserved = [[] for _ in components]
+    for room in sorted(classrooms, key=lambda room: room.get('capacity', 0), reverse=True):
+        room_type = room.get('type', 'Theory')
+        capacity = room.get('capacity', 0)
+
+        def fitting(c_idx):
+            return sorted((key for key, count in uncovered[c_idx].items()
+                           if count and (key[0] is None or (key[0] == room_type and key[1] <= capacity))),
+                          key=lambda key: key[1], reverse=True)
+
+        candidates = [(fitting(c_idx), c_idx) for c_idx in range(len(components))]
+        candidates = [(keys, c_idx) for keys, c_idx in candidates if keys]
+        if candidates:
+            keys, c_idx = max(candidates, key=lambda candidate: (candidate[0][0][1], -candidate[1]))
+            room_left = total_slots
+            for key in keys:
+                covered = min(room_left, uncovered[c_idx][key])
+                uncovered[c_idx][key] -= covered
+                room_left -= covered
+                if not room_left:
+                    break
+        else:
+            c_idx = max(range(len(components)), key=lambda c_idx: len(components[c_idx]) / (len(reserved[c_idx]) + 1))
+        reserved[c_idx].append(room)
+
+    if any(count for needs in uncovered for count in needs.values()):
+        return None
+    return reserved
+
+
+def solve_component(engine, requests, batch_map, classrooms, config, profile, previous=None, warm_start=True):
+    """Greedy warm start and CP-SAT solve of one component; runs in a worker process.
+
+    Returns (status name, placements over these requests or None, solver wall time).
+    """
+    ir = InternedInput(requests, batch_map, classrooms, config)
+    if warm_start:
+        PROFILER.phase('greedy')
+        placements, _ = greedy_schedule(requests, batch_map, classrooms, config, previous, ir)
+        pinned = {r_idx: placement for r_idx, placement in (previous or {}).items() if placement.fixed}
+        previous = {**placements, **pinned}
+    model, extract = ENGINES[engine](requests, batch_map, classrooms, config, previous, ir=ir)
+    PROFILER.phase('solve')
+    solver, status = run_solver(model, profile, complete_hint=warm_start)
+    PROFILER.solver(solver, status)
+    PROFILER.phase('extract')
+    placements = list(extract(solver)) if status in (cp_model.OPTIMAL, cp_model.FEASIBLE) else None
+    return solver.StatusName(status), placements, solver.WallTime()
+
+
+def solve_components(requests, batch_map, classrooms, config, engine, profile, previous=None, warm_start=True):
+    """Solve each sharing component on its own rooms in a process pool and merge the placements.
+
+    profile['processes'] caps the pool (0 = one per core). Each
+    component gets a share of timeLimit by size, so the whole run stays
+    within it, and the cores are split between the processes' CP-SAT
+    workers. Returns None, to solve as one model instead, when there is
+    only one component, the rooms cannot be split, or a component finds
+    no timetable on its share of the rooms.
+    """
+    components = sharing_components(requests)
+    if len(components) < 2:
+        return None
+    total_slots = len(config['daysPerWeek']) * config['slotsPerDay']
+    rooms = reserve_rooms(requests, batch_map, classrooms, components, total_slots)
+    if rooms is None:
+        sys.stderr.write(f"Decompose: rooms cannot be split between {len(components)} components, "
+                         "solving as one model.\n")
+        return None
+
+    cores = os.cpu_count() or 1
+    processes = min(profile.get('processes') or cores, len(components))
+    if not profile['workers']:
+        profile = dict(profile, workers=max(1, cores // processes))
+
+    jobs = []
+    for members, component_rooms in zip(components, rooms):
+        local = {r_idx: i for i, r_idx in enumerate(members)}
+        room_ids = {room['id'] for room in component_rooms}
+        component_previous = {local[r_idx]: placement for r_idx, placement in (previous or {}).items()
+                              if r_idx in local and placement.room_id in room_ids}
+        share = min(1.0, processes * len(members) / len(requests))
+        component_profile = dict(profile, timeLimit=profile['timeLimit'] * share)
+        jobs.append((engine, [requests[r_idx] for r_idx in members],
+                     {requests[r_idx]['batch_id']: batch_map[requests[r_idx]['batch_id']] for r_idx in members},
+                     component_rooms, config, component_profile, component_previous, warm_start))
+
+    start = time.perf_counter()
+    if processes == 1:
+        results = [solve_component(*job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(solve_component, *zip(*jobs)))
+
+    statuses = Counter(status for status, _, _ in results)
+    sys.stderr.write(f"Decompose: {len(components)} components (largest {len(components[0])} requests) "
+                     f"on {processes} processes in {time.perf_counter() - start:.2f}s: {dict(statuses)}.\n")
+    merged = []
+    for members, (status, placements, _) in zip(components, results):
+        if placements is None:
+            sys.stderr.write(f"Decompose: a component of {len(members)} requests ended {status}, "
+                             "solving as one model.\n")
+            return None
+        merged.extend((members[r_idx],) + tuple(placement) for r_idx, *placement in placements)
+    return merged
+
+
+def assemble_schedule(requests, placements, batches, classrooms, teachers, days, slots_per_day, fill=True):
+    """Turn (r_idx, d_idx, p_idx, room_id, teacher_id) placements into ScheduleEntry dicts.
+
+    fill=False leaves out the self-study entries of fill_vacant_slots.
+    """
+    final_schedule = []
+    for r_idx, d_idx, p_idx, room_id, teacher_id in placements:
+        req = requests[r_idx]
+        final_schedule.append({
+            'id': f"sched_{r_idx}",
+            'subjectId': req['subject_id'],
+            'teacherId': teacher_id,
+            'classroomId': room_id,
+            'batchIds': [req['batch_id']],
+            'day': days[d_idx],
+            'period': p_idx + 1 # 1-indexed
+        })
+
+    # 4. Fill Vacant Slots (Post-Processing)
+    if fill:
+        fill_vacant_slots(final_schedule, batches, classrooms, teachers, days, slots_per_day)
+    return final_schedule
+
+
+def solve_schedule(data, engine=None, incremental=None, freeze=None, cache=None, solver_profile=None,
+                   on_solution=None, explain=None, warm_start=None, local_search=None, soft_constraints=None,
+                   stats=None, decompose=None, lean_model=None):
+    """Build and solve the timetable for `data`; returns a list of ScheduleEntry dicts.
+
+    on_solution, if given, is called with {'schedule', 'objective', 'elapsed'}
+    for every intermediate solution CP-SAT finds, before the final return.
+
+    Raises InfeasibleInput when check_feasibility finds a violated bound
+    (before any model is built) or CP-SAT proves the model infeasible. With
+    explain (or config['explainInfeasible']) the latter report also carries
+    an infeasible_core. Running out of time without a timetable returns [].
+
+    engine='greedy' returns greedy_schedule's timetable without solving.
+    Otherwise it is handed to the engine as hints, unless warm_start (or
+    config['warmStart']) is false.
+
+    local_search (or config['localSearch']) gives improve_schedule that many
+    seconds to lower the soft penalties of the engine's timetable; its new
+    best timetables are passed to on_solution too. With soft_constraints
+    it defaults to SOFT_LOCAL_SEARCH seconds, since the CP-SAT objective
+    alone rarely gets far from the greedy hint; pass 0 to turn it off.
+
+    soft_constraints (or config['softConstraints']) gives CP-SAT an
+    objective: the weighted penalties of add_soft_objective, so it keeps
+    improving the timetable until the time limit instead of stopping at
+    the first one. If stats is a dict, it receives the returned timetable's
+    'penalties' (LocalSearch.breakdown counts; not on cache hits) and, after
+    a CP-SAT solve, its 'status', 'build' and 'solve' seconds and the model's
+    'variables' and 'constraints' counts.
+
+    decompose (or config['decompose']) solves the components of the
+    batch-teacher sharing graph separately, in parallel processes, each on
+    its own reserved rooms (see solve_components); intermediate solutions
+    are not streamed then.
+
+    lean_model (or config['leanModel']) builds unnamed variables in the
+    boolean and decomposed engines, for a faster build and a smaller
+    model; see VariableNames.
+    """
+    # Unpack data
+    teachers = data.get('teachers', [])
+    classrooms = data.get('classrooms', [])
+    subjects = data.get('subjects', [])
+    batches = data.get('batches', [])
+    config = data.get('config', DEFAULT_CONFIG)
+
+    days = config['daysPerWeek']
+    slots_per_day = config['slotsPerDay']
+
+    engine = engine or config.get('engine', DEFAULT_ENGINE)
+    if engine not in ENGINES and engine != GREEDY_ENGINE:
+        raise ValueError(f"Unknown engine '{engine}'. Expected one of: {', '.join([*ENGINES, GREEDY_ENGINE])}")
+
+    # Incremental mode: start from the stored schedule instead of from scratch
+    incremental = config.get('incremental', False) if incremental is None else incremental
+    freeze = config.get('freezeUnchanged', False) if freeze is None else freeze
+    explain = config.get('explainInfeasible', False) if explain is None else explain
+    warm_start = config.get('warmStart', True) if warm_start is None else warm_start
+    decompose = config.get('decompose', False) if decompose is None else decompose
+    if soft_constraints is not None:
+        config = dict(config, softConstraints=soft_constraints)
+    if local_search is None:
+        local_search = config.get('localSearch', SOFT_LOCAL_SEARCH if config.get('softConstraints') else 0)
+    if lean_model is not None:
+        config = dict(config, leanModel=lean_model)
+    previous_schedule = (data.get('schedule') or []) if incremental else []
+    profile = resolve_solver_profile(config, solver_profile)
+
+    # Identical input -> identical schedule; skip the solve on a cache hit
+    cache_key = None
+    if cache is not None and config.get('cache', True):
+        PROFILER.phase('cache')
+        cache_key = input_hash(data, {'engine': engine, 'incremental': incremental, 'freeze': freeze,
+                                      'warmStart': warm_start, 'localSearch': local_search, 'decompose': decompose,
+                                      'softConstraints': config.get('softConstraints', False), 'solver': profile})
+        cached = cache.get(cache_key)
+        if cached is not None:
+            cache.report('hit')
+            return cached
+        cache.report('miss')
+
+    # 1. Prepare Data
+    # Map IDs to objects for easy lookup
+    PROFILER.phase('requests')
+    batch_map = {b['id']: b for b in batches}
+
+    requests, teacher_assigned_load = generate_requests(
+        teachers, subjects, batches, preferred_teachers=previous_teachers(previous_schedule)
+    )
+
+    sys.stderr.write(f"Generated {len(requests)} requests.\n")
+    sys.stderr.write(f"Teacher Load: {json.dumps(teacher_assigned_load)}\n")
+
+    # Cheap bounds first: an impossible input fails here in milliseconds
+    PROFILER.phase('precheck')
+    report = check_feasibility(requests, batch_map, classrooms, config, joint_teachers=engine == 'joint')
+    if report['issues']:
+        sys.stderr.write(f"Pre-check: {json.dumps(report)}\n")
+    if not report['feasible']:
+        raise InfeasibleInput(report)
+
+    previous = None
+    if previous_schedule:
+        PROFILER.phase('incremental')
+        previous = match_previous_schedule(requests, previous_schedule, teachers, classrooms, batch_map,
+                                           days, slots_per_day, freeze)
+        fixed = sum(1 for placement in previous.values() if placement.fixed)
+        sys.stderr.write(f"Incremental: {len(previous)} hinted, {fixed} fixed.\n")
+
+    def finish(placements):
+        if local_search and placements:
+            PROFILER.phase('local_search')
+            def improved(better, penalty, elapsed):
+                on_solution({
+                    'schedule': assemble_schedule(requests, better, batches, classrooms, teachers,
+                                                  days, slots_per_day),
+                    'objective': penalty,
+                    'elapsed': round(elapsed, 3),
+                })
+            placements = improve_schedule(requests, placements, batch_map, classrooms, config, local_search,
+                                          improved if on_solution else None, profile.get('seed') or 0)
+        PROFILER.phase('penalties')
+        penalties = LocalSearch(requests, placements, batch_map, classrooms, config).breakdown()
+        sys.stderr.write(f"Penalties: {json.dumps(penalties)}\n")
+        if stats is not None:
+            stats['penalties'] = penalties
+        PROFILER.phase('assemble')
+        final_schedule = assemble_schedule(requests, placements, batches, classrooms, teachers,
+                                           days, slots_per_day, fill=False)
+        PROFILER.phase('fill')
+        fill_vacant_slots(final_schedule, batches, classrooms, teachers, days, slots_per_day)
+        if cache_key and final_schedule:
+            PROFILER.phase('cache')
+            cache.put(cache_key, final_schedule)
+        return final_schedule
+
+    if decompose and engine != GREEDY_ENGINE:
+        # Independent departments/cohorts: one smaller model each, in parallel
+        PROFILER.phase('decompose')
+        placements = solve_components(requests, batch_map, classrooms, config, engine, profile, previous, warm_start)
+        if placements is not None:
+            return finish(placements)
+
+    # Integer view of the requests, shared by the greedy pass and the model
+    PROFILER.phase('intern')
+    ir = InternedInput(requests, batch_map, classrooms, config)
+
+    if engine == GREEDY_ENGINE or warm_start:
+        PROFILER.phase('greedy')
+        start = time.perf_counter()
+        placements, unplaced = greedy_schedule(requests, batch_map, classrooms, config, previous, ir)
+        sys.stderr.write(f"Greedy: placed {len(placements)} of {len(requests)} requests "
+                         f"in {time.perf_counter() - start:.3f}s.\n")
+
+    if engine == GREEDY_ENGINE:
+        if unplaced:
+            sys.stderr.write(f"Warning: Greedy left {len(unplaced)} requests unplaced: {unplaced}\n")
+        return finish([(r_idx,) + placement[:3] + (requests[r_idx]['teacher_id'],)
+                       for r_idx, placement in sorted(placements.items())])
+
+    if warm_start:
+        # The greedy timetable as hints; pinned entries stay where they were
+        pinned = {r_idx: placement for r_idx, placement in (previous or {}).items() if placement.fixed}
+        previous = {**placements, **pinned}
+
+    # 2. Model
+    build_start = time.perf_counter()
+    model, extract = ENGINES[engine](requests, batch_map, classrooms, config, previous, ir=ir)
+    build_time = time.perf_counter() - build_start
+
+    streamer = None
+    if on_solution:
+        def emit(callback):
+            placements = list(extract(callback))
+            # The objective of an intermediate solution can overstate its penalties
+            # (see add_penalty_terms): report the recomputed one
+            objective = LocalSearch(requests, placements, batch_map, classrooms, config).total \
+                if model.HasObjective() else None
+            on_solution({
+                'schedule': assemble_schedule(requests, placements, batches, classrooms, teachers,
+                                              days, slots_per_day),
+                'objective': objective,
+                'elapsed': round(callback.WallTime(), 3),
+            })
+        streamer = SolutionStreamer(emit)
+
+    # 3. Solve
+    PROFILER.phase('solve')
+    solver, status = run_solver(model, profile, streamer, complete_hint=warm_start)
+    PROFILER.solver(solver, status)
+
+    # The pinned entries leave no room for the change: unpin whole batches and
+    # teachers the change touches, then fall back to hints only
+    fallbacks = ['resource', None] if previous_schedule and freeze else [None]
+    while previous and status not in (cp_model.OPTIMAL, cp_model.FEASIBLE) and any(p.fixed for p in previous.values()):
+        scope = fallbacks.pop(0)
+        pins = {}
+        if scope:
+            matched = match_previous_schedule(requests, previous_schedule, teachers, classrooms, batch_map,
+                                              days, slots_per_day, freeze, scope)
+            pins = {r_idx: placement for r_idx, placement in matched.items() if placement.fixed}
+        sys.stderr.write(f"Incremental: fixed entries infeasible, re-solving with "
+                         f"{f'{len(pins)} fixed ({scope} scope)' if pins else 'hints only'}.\n")
+        previous = {r_idx: pins.get(r_idx) or placement._replace(fixed=False) for r_idx, placement in previous.items()}
+        build_start = time.perf_counter()
+        model, extract = ENGINES[engine](requests, batch_map, classrooms, config, previous, ir=ir)
+        build_time += time.perf_counter() - build_start
+        PROFILER.phase('solve')
+        solver, status = run_solver(model, profile, streamer)
+        PROFILER.solver(solver, status)
+
+    sys.stderr.write(f"Solver status: {solver.StatusName(status)} after {solver.WallTime():.2f}s.\n")
+    if stats is not None:
+        proto = model.Proto()
+        stats.update(status=solver.StatusName(status), build=round(build_time, 3), solve=round(solver.WallTime(), 3),
+                     variables=len(proto.variables), constraints=len(proto.constraints))
+
+    if status == cp_model.INFEASIBLE:
+        report = dict(report, feasible=False, stage='solver', elapsed=round(solver.WallTime(), 3),
+                      summary="the pre-check passed, but CP-SAT proved the constraints cannot all hold together")
+        if explain:
+            PROFILER.phase('explain')
+            report['core'] = infeasible_core(requests, batch_map, classrooms, config)
+            if report['core']:
+                report['summary'] += f" (core: {len(report['core'])} entities)"
+        raise InfeasibleInput(report)
+
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        PROFILER.phase('extract')
+        return finish(list(extract(solver)))
+
+    return []
+
+
+def serve(options, stream_in=sys.stdin, stream_out=sys.stdout, input_format='json'):
+    """Long-running worker: one JSON request per input line, one JSON reply per output line.
+
+    Request:  {"id": <any>, "data": {...scheduler input...}, "stream": <bool, optional>}
+    Reply:    {"id": <same>, "schedule": [...], "penalties": {...}, ...solve stats} or {"id": <same>, "error": "..."}
+              (plus "report" when the input has no feasible timetable)
+
+    With "stream": true, each intermediate solution is sent first as
+    {"id": <same>, "solution": {"schedule", "objective", "elapsed"}}.
+    When profiling (see solve_profiler), every reply also carries the
+    request's trailer as "profile".
+
+    OR-Tools stays imported between requests, so each call only pays for the
+    solve itself. options are solve_schedule keyword arguments applied to
+    every request. Diagnostics keep going to stderr.
+
+    With input_format='msgpack', stream_in is binary and each request is
+    one msgpack-encoded object in a length-prefixed frame (see
+    serialization.read_frames); replies stay JSON lines.
+    """
+    stream_out.write(dumps({'ready': True}) + '\n')
+    stream_out.flush()
+
+    if input_format == 'msgpack':
+        payloads = read_frames(stream_in)
+    else:
+        payloads = (line for line in stream_in if line.strip())
+
+    for payload in payloads:
+        request_id = None
+        PROFILER.start()
+        try:
+            PROFILER.phase('parse')
+            message = decode(payload, input_format)
+            request_id = message.get('id')
+
+            on_solution = None
+            if message.get('stream'):
+                def on_solution(solution, request_id=request_id):
+                    stream_out.write(dumps({'id': request_id, 'solution': solution}) + '\n')
+                    stream_out.flush()
+
+            stats = {}
+            schedule = solve_schedule(message.get('data') or {}, on_solution=on_solution, stats=stats, **options)
+            response = {'id': request_id, 'schedule': schedule, **stats}
+        except InfeasibleInput as e:
+            sys.stderr.write(f"{e}\n")
+            response = {'id': request_id, 'error': str(e), 'report': e.report}
+        except Exception as e:
+            sys.stderr.write(f"{e}\n")
+            response = {'id': request_id, 'error': str(e)}
+
+        profile = PROFILER.finish()
+        if profile:
+            response['profile'] = profile
+        stream_out.write(dumps(response) + '\n')
+        stream_out.flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a timetable from JSON on stdin.")
+    parser.add_argument('--engine', choices=sorted([*ENGINES, GREEDY_ENGINE]), default=None,
+                        help="Model formulation, or 'greedy' for the heuristic alone (overrides config.engine).")
+    parser.add_argument('--no-warm-start', dest='warm_start', action='store_false', default=None,
+                        help="Don't hint the solver with the greedy timetable.")
+    parser.add_argument('--soft-constraints', action='store_true', default=None,
+                        help="Minimize weighted soft-constraint penalties in CP-SAT (overrides config.softConstraints).")
+    parser.add_argument('--decompose', action='store_true', default=None,
+                        help="Solve independent departments/cohorts as separate models in parallel processes.")
+    parser.add_argument('--lean-model', action='store_true', default=None,
+                        help="Build unnamed model variables: faster and smaller on large inputs (overrides config.leanModel).")
+    parser.add_argument('--local-search', type=float, default=None, metavar='SECONDS',
+                        help="Spend SECONDS lowering soft penalties of the timetable (overrides config.localSearch; "
+                             f"default {SOFT_LOCAL_SEARCH} with --soft-constraints, else 0).")
+    parser.add_argument('--incremental', action='store_true', default=None,
+                        help="Re-plan from the input's existing schedule, using it as solver hints.")
+    parser.add_argument('--freeze', action='store_true', default=None,
+                        help="With --incremental, pin every entry the change does not touch.")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Always solve, bypassing the on-disk schedule cache.")
+    parser.add_argument('--serve', action='store_true',
+                        help="Stay alive and answer line-delimited JSON requests on stdin.")
+    parser.add_argument('--stream', action='store_true',
+                        help="Print every intermediate solution as a JSON line, then the final schedule.")
+    parser.add_argument('--db', nargs='?', const=DEFAULT_DB_PATH, default=None, metavar='PATH',
+                        help="Read the input from the SQLite store (default: SCHEDULER_DB or data.db) instead of stdin.")
+    parser.add_argument('--input-format', choices=INPUT_FORMATS, default='json',
+                        help="stdin encoding: JSON, or msgpack (needs msgspec or msgpack; with --serve, length-prefixed frames).")
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='json',
+                        help="Schedule as one JSON array, or as one JSON entry per line (without --stream).")
+    parser.add_argument('--explain', action='store_true', default=None,
+                        help="When CP-SAT proves infeasibility, extract a minimal set of conflicting entities.")
+    parser.add_argument('--profile', action='store_true',
+                        help="Time each phase and write a JSON trailer to stderr (or set SCHEDULER_PROFILE=1).")
+    parser.add_argument('--profile-dump', metavar='PATH',
+                        help="Also write cProfile stats to PATH (or set SCHEDULER_PROFILE_DUMP).")
+
+    solver = parser.add_argument_group('solver profile (overrides config.solver)')
+    solver.add_argument('--workers', type=int, default=None, help="Parallel search workers, 0 = one per core.")
+    solver.add_argument('--time-limit', type=float, default=None, help="Solve time limit in seconds.")
+    solver.add_argument('--seed', type=int, default=None, help="Random seed.")
+    solver.add_argument('--presolve', type=int, choices=[0, 1, 2], default=None,
+                        help="0 = off, 1 = no probing, 2 = full.")
+    solver.add_argument('--strategy', default=None, help="Search branching: automatic, fixed, portfolio, lp, ...")
+    solver.add_argument('--processes', type=int, default=None, help="Solver processes with --decompose, 0 = one per core.")
+    return parser.parse_args(argv)
+
+
+def options_from_args(args):
+    return {
+        'engine': args.engine,
+        'incremental': args.incremental,
+        'freeze': args.freeze,
+        'explain': args.explain,
+        'warm_start': args.warm_start,
+        'local_search': args.local_search,
+        'soft_constraints': args.soft_constraints,
+        'decompose': args.decompose,
+        'lean_model': args.lean_model,
+        'cache': None if args.no_cache else ScheduleCache(),
+        'solver_profile': {
+            'workers': args.workers,
+            'timeLimit': args.time_limit,
+            'seed': args.seed,
+            'presolve': args.presolve,
+            'strategy': args.strategy,
+            'processes': args.processes,
+        },
+    }
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    options = options_from_args(args)
+    if args.profile or args.profile_dump:
+        PROFILER.enabled = True
+        PROFILER.dump = args.profile_dump or PROFILER.dump
+    # Input is read as bytes (JSON is UTF-8 whatever the locale) and output
+    # keeps non-ASCII text as is, so stdout has to be UTF-8 too
+    sys.stdout.reconfigure(encoding='utf-8')
+    if args.serve:
+        serve(options, sys.stdin.buffer, input_format=args.input_format)
+        sys.exit(0)
+
+    PROFILER.start()
     try:
-        input_data = sys.stdin.read()
-        if not input_data:
-            print(json.dumps([]))
-            sys.exit(0)
-            
-        data = json.loads(input_data)
-        schedule = solve_schedule(data)
-        print(json.dumps(schedule))
+        PROFILER.phase('parse')
+        if args.db:
+            with DataStore(args.db) as store:
+                data = store.load()
+        else:
+            input_data = sys.stdin.buffer.read()
+            if not input_data:
+                write_schedule(sys.stdout, [], args.output_format)
+                sys.exit(0)
+            data = decode(input_data, args.input_format)
+        if args.stream:
+            # Newline-delimited JSON: {"type": "solution", ...} lines, then {"type": "final", ...}
+            def print_solution(solution):
+                print(dumps(dict(solution, type='solution')), flush=True)
+
+            stats = {}
+            schedule = solve_schedule(data, on_solution=print_solution, stats=stats, **options)
+            PROFILER.phase('output')
+            print(dumps({'type': 'final', 'schedule': schedule, **stats}))
+        else:
+            schedule = solve_schedule(data, **options)
+            PROFILER.phase('output')
+            write_schedule(sys.stdout, schedule, args.output_format)
+    except InfeasibleInput as e:
+        # The structured report goes to stderr as one JSON line after the message
+        sys.stderr.write(f"{e}\n{json.dumps(e.report)}\n")
+        sys.exit(1)
     except Exception as e:
         # Log error to stderr
         sys.stderr.write(str(e))
         sys.exit(1)
+    finally:
+        # The trailer comes last on stderr, after any error
+        PROFILER.finish()
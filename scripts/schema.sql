@@ -0,0 +1,99 @@
+-- SQLite store behind the app (src/lib/db.ts) and scripts/data_store.py; both apply this file on open.
+-- Every entity row keeps the entity's full JSON in `doc`, which is what gets
+-- read back. The other columns and the link tables index it and are rewritten
+-- with the row. Rows come back in rowid order, the order of a data.json list.
+
+CREATE TABLE IF NOT EXISTS teachers (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    department TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS teachers_department ON teachers (department);
+
+CREATE TABLE IF NOT EXISTS classrooms (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    type TEXT,
+    capacity INTEGER,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS classrooms_type ON classrooms (type, capacity);
+
+CREATE TABLE IF NOT EXISTS subjects (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    code TEXT,
+    type TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS subjects_code ON subjects (code);
+
+CREATE TABLE IF NOT EXISTS batches (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    department TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS batches_department ON batches (department);
+
+-- Teacher.qualifiedSubjects
+CREATE TABLE IF NOT EXISTS qualifications (
+    teacher_id TEXT NOT NULL REFERENCES teachers (id) ON DELETE CASCADE,
+    subject_id TEXT NOT NULL,
+    PRIMARY KEY (teacher_id, subject_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS qualifications_subject ON qualifications (subject_id);
+
+-- Batch.requiredSubjects
+CREATE TABLE IF NOT EXISTS batch_subjects (
+    batch_id TEXT NOT NULL REFERENCES batches (id) ON DELETE CASCADE,
+    subject_id TEXT NOT NULL,
+    PRIMARY KEY (batch_id, subject_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS batch_subjects_subject ON batch_subjects (subject_id);
+
+-- The schedule is saved as a whole, so entries are keyed by position, not by id
+CREATE TABLE IF NOT EXISTS schedule_entries (
+    position INTEGER PRIMARY KEY,
+    id TEXT,
+    day TEXT NOT NULL,
+    period INTEGER NOT NULL,
+    subject_id TEXT,
+    teacher_id TEXT,
+    classroom_id TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS schedule_slot ON schedule_entries (day, period);
+CREATE INDEX IF NOT EXISTS schedule_teacher ON schedule_entries (teacher_id, day, period);
+CREATE INDEX IF NOT EXISTS schedule_classroom ON schedule_entries (classroom_id, day, period);
+
+-- ScheduleEntry.batchIds
+CREATE TABLE IF NOT EXISTS schedule_batches (
+    batch_id TEXT NOT NULL,
+    position INTEGER NOT NULL REFERENCES schedule_entries (position) ON DELETE CASCADE,
+    PRIMARY KEY (batch_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS schedule_batches_position ON schedule_batches (position);
+
+-- 'config': the SchedulerConfig JSON; 'scheduleRevision': the last schedule_journal revision
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+-- Append-only log of schedule saves, one revision per save (see DataStore.save_schedule).
+-- op is 'insert', 'remove' or 'move'; batch_key, day and period locate the
+-- entry (the old one for 'remove'). Compaction drops the oldest revisions.
+CREATE TABLE IF NOT EXISTS schedule_journal (
+    seq INTEGER PRIMARY KEY,
+    revision INTEGER NOT NULL,
+    saved_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    op TEXT NOT NULL,
+    batch_key TEXT NOT NULL,
+    day TEXT NOT NULL,
+    period INTEGER NOT NULL,
+    old_doc TEXT,
+    new_doc TEXT
+);
+CREATE INDEX IF NOT EXISTS schedule_journal_revision ON schedule_journal (revision);
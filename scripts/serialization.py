@@ -0,0 +1,117 @@
+import os
+import json
+import struct
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# SCHEDULER_FAST_JSON=0 forces the standard library json module, e.g. to compare outputs.
+FAST_JSON = os.environ.get('SCHEDULER_FAST_JSON', '') != '0'
+
+# Input formats of the CLI and the --serve worker (--input-format)
+INPUT_FORMATS = ['json', 'msgpack']
+# Schedule output formats of the CLI (--output-format): one array, or one entry per line
+OUTPUT_FORMATS = ['json', 'lines']
+
+# A msgpack request to the worker is a 4-byte big-endian length, then that many bytes
+FRAME_HEADER = struct.Struct('>I')
+
+
+def json_backend():
+    """Name of the module loads/dumps use: 'orjson', 'msgspec' or 'json'."""
+    if FAST_JSON and orjson is not None:
+        return 'orjson'
+    if FAST_JSON and msgspec is not None:
+        return 'msgspec'
+    return 'json'
+
+
+def loads(payload):
+    """Parse JSON from str or UTF-8 bytes."""
+    backend = json_backend()
+    if backend == 'orjson':
+        return orjson.loads(payload)
+    if backend == 'msgspec':
+        return msgspec.json.decode(payload)
+    return json.loads(payload)
+
+
+def dumps(obj):
+    """Compact JSON text; non-ASCII is kept as is, so the output stream must be UTF-8.
+
+    The backends only differ in how they spell some floats (1e+16 vs 1e16).
+    """
+    backend = json_backend()
+    if backend == 'orjson':
+        # json.dumps turns int keys into strings; orjson needs to be told
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    if backend == 'msgspec':
+        return msgspec.json.encode(obj).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def unpack(payload):
+    """Decode one msgpack object (bytes) with msgspec or msgpack."""
+    if msgspec is not None:
+        return msgspec.msgpack.decode(payload)
+    if msgpack is not None:
+        return msgpack.unpackb(payload, raw=False)
+    raise ValueError("msgpack input needs the msgspec or msgpack package (pip install msgpack)")
+
+
+def decode(payload, input_format='json'):
+    return unpack(payload) if input_format == 'msgpack' else loads(payload)
+
+
+def read_frames(stream):
+    """Yield the payloads of length-prefixed frames from a binary stream until EOF."""
+    while True:
+        header = stream.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return
+        (size,) = FRAME_HEADER.unpack(header)
+        payload = stream.read(size)
+        if len(payload) < size:
+            raise ValueError(f"Truncated frame: expected {size} bytes, got {len(payload)}")
+        yield payload
+
+
+def write_schedule(stream, schedule, output_format='json'):
+    """The schedule as one JSON array, or with output_format='lines' one entry per line."""
+    if output_format == 'lines':
+        for entry in schedule:
+            stream.write(dumps(entry))
+            stream.write('\n')
+    else:
+        stream.write(dumps(schedule))
+        stream.write('\n')
+
+
+def read_schedule(text):
+    """The schedule from scheduler output: a JSON array, one entry per line (write_schedule),
+    or --stream lines, where the last line carrying a "schedule" wins."""
+    text = text.strip()
+    if text.startswith('['):
+        return loads(text)
+    schedule = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        item = loads(line)
+        if 'schedule' in item:
+            schedule = item['schedule']
+        else:
+            schedule.append(item)
+    return schedule
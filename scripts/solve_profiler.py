@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import tracemalloc
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+# SCHEDULER_PROFILE=1 (or --profile) profiles every solve; SCHEDULER_PROFILE_DUMP=<path>
+# (or --profile-dump) also runs cProfile and writes its stats there, for pstats/snakeviz.
+PROFILE_ENABLED = os.environ.get('SCHEDULER_PROFILE', '') not in ('', '0')
+PROFILE_DUMP = os.environ.get('SCHEDULER_PROFILE_DUMP') or None
+
+
+class SolveProfiler:
+    """Wall time and peak traced memory per solve phase, reported as one JSON trailer on stderr.
+
+    Phases run back to back: phase(name) closes the running phase and opens
+    `name`, so marking one is a single call where its code starts. A phase
+    entered again (a re-solve, a second model) adds to its totals. Until
+    start() every method returns at once, so the calls cost nothing in
+    normal runs.
+
+    Memory is tracemalloc's peak of Python allocations within the phase.
+    CP-SAT allocates in C++, which only shows in the process-wide
+    max_rss_mb. Tracing slows allocation-heavy phases such as model
+    building, so compare profiled runs with each other, not with plain ones.
+    """
+
+    def __init__(self, enabled=False, dump=None):
+        self.enabled = enabled
+        self.dump = dump
+        self.active = False
+
+    def start(self):
+        if not self.enabled:
+            return
+        self.phases = {}
+        self.solves = []
+        self.current = None
+        self.started = time.perf_counter()
+        tracemalloc.start()
+        self.cprofile = None
+        if self.dump:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        self.active = True
+
+    def phase(self, name):
+        if not self.active:
+            return
+        self._close()
+        tracemalloc.reset_peak()
+        self.current = (name, time.perf_counter())
+
+    def _close(self):
+        if self.current is None:
+            return
+        name, since = self.current
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        totals = self.phases.setdefault(name, {'seconds': 0.0, 'peak_mb': 0.0, 'calls': 0})
+        totals['seconds'] += time.perf_counter() - since
+        totals['peak_mb'] = max(totals['peak_mb'], peak)
+        totals['calls'] += 1
+        self.current = None
+
+    def solver(self, solver, status):
+        """Record the search statistics of a finished CpSolver.Solve()."""
+        if not self.active:
+            return
+        self.solves.append({
+            'status': solver.StatusName(status),
+            'wall_s': round(solver.WallTime(), 3),
+            'user_s': round(solver.UserTime(), 3),
+            'conflicts': solver.NumConflicts(),
+            'branches': solver.NumBranches(),
+            'objective': solver.ObjectiveValue(),
+            'bound': solver.BestObjectiveBound(),
+            'response_stats': solver.ResponseStats(),
+        })
+
+    def finish(self):
+        """Close the last phase, write the trailer and return it (None when not profiling)."""
+        if not self.active:
+            return None
+        self._close()
+        tracemalloc.stop()
+        trailer = {
+            'total_s': round(time.perf_counter() - self.started, 4),
+            'peak_mb': round(max((totals['peak_mb'] for totals in self.phases.values()), default=0.0), 2),
+            'phases': {
+                name: {'seconds': round(totals['seconds'], 4), 'peak_mb': round(totals['peak_mb'], 2),
+                       'calls': totals['calls']}
+                for name, totals in self.phases.items()
+            },
+            'solver': self.solves,
+        }
+        if resource is not None:
+            # ru_maxrss is in KiB on Linux
+            trailer['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.dump)
+            trailer['cprofile'] = self.dump
+        self.active = False
+        sys.stderr.write(f"Profile: {json.dumps(trailer)}\n")
+        return trailer
+
+
+PROFILER = SolveProfiler(PROFILE_ENABLED or bool(PROFILE_DUMP), PROFILE_DUMP)
@@ -1,60 +1,82 @@
 import { NextRequest, NextResponse } from 'next/server';
-import { spawn } from 'child_process';
-import path from 'path';
+import { InfeasibleError, runScheduler } from '@/lib/schedulerPool';
+import { SolveProfile } from '@/lib/types';
+
+// One line per profiled solve: total, then the slowest phases and the CP-SAT search
+function logProfile(profile: SolveProfile) {
+    const phases = Object.entries(profile.phases)
+        .sort(([, a], [, b]) => b.seconds - a.seconds)
+        .slice(0, 5)
+        .map(([name, phase]) => `${name} ${phase.seconds.toFixed(3)}s/${phase.peak_mb}MB`);
+    const solves = profile.solver.map((s) => `${s.status} ${s.wall_s}s ${s.conflicts} conflicts ${s.branches} branches`);
+    console.log(`Scheduler profile: ${profile.total_s}s total, peak ${profile.peak_mb}MB traced` +
+        (profile.max_rss_mb ? `, ${profile.max_rss_mb}MB RSS` : '') +
+        `; ${phases.join(', ')}` + (solves.length ? `; solver ${solves.join(', ')}` : ''));
+}
 
 export async function POST(req: NextRequest) {
     try {
         const data = await req.json();
 
-        // Path to python script
-        // Depending on deployment, this might need adjustment. 
-        // For local dev, we assume process.cwd() is the project root.
-        const scriptPath = path.join(process.cwd(), 'scripts', 'scheduler.py');
-
-        // Spawn python process
-        // Explicitly using the WindowsApps python as D:\python.exe lacks dependencies
-        const pythonPath = process.env.PYTHON_PATH || 'python';
-        const pythonProcess = spawn(pythonPath, [scriptPath]);
-
-        let outputData = '';
-        let errorData = '';
-
-        const result = await new Promise<string>((resolve, reject) => {
-            // Send data to stdin
-            pythonProcess.stdin.write(JSON.stringify(data));
-            pythonProcess.stdin.end();
-
-            pythonProcess.stdout.on('data', (chunk) => {
-                outputData += chunk.toString();
-            });
-
-            pythonProcess.stderr.on('data', (chunk) => {
-                errorData += chunk.toString();
-            });
-
-            pythonProcess.on('close', (code) => {
-                if (code !== 0) {
-                    reject(new Error(`Scheduler process exited with code ${code}: ${errorData}`));
-                } else {
-                    resolve(outputData);
-                }
-            });
-
-            pythonProcess.on('error', (err) => {
-                reject(new Error(`Failed to start scheduler process: ${err.message}`));
-            });
-        });
-
-        try {
-            const schedule = JSON.parse(result);
-            return NextResponse.json(schedule);
-        } catch (parseError) {
-            console.error("Failed to parse scheduler output:", result);
-            return NextResponse.json({ error: "Invalid output from scheduler", details: result }, { status: 500 });
+        // Solved by a warm `scheduler.py --serve` worker from the pool
+        // (see src/lib/schedulerPool.ts). PYTHON_PATH picks the interpreter,
+        // SCHEDULER_POOL_SIZE caps concurrent solves. SCHEDULER_PROFILE=1 makes
+        // workers time each phase; the trailer is logged by logProfile.
+
+        if (req.nextUrl.searchParams.get('stream') === '1') {
+            return streamSchedule(req, data);
         }
 
+        const schedule = await runScheduler(data, { onProfile: logProfile });
+        return NextResponse.json(schedule);
+
     } catch (error: any) {
+        if (error instanceof InfeasibleError) {
+            // Not a server fault: the input itself admits no timetable
+            return NextResponse.json({ error: error.message, report: error.report }, { status: 422 });
+        }
         console.error('Scheduler API Error:', error);
         return NextResponse.json({ error: error.message || 'Internal Server Error' }, { status: 500 });
     }
 }
+
+// Newline-delimited JSON: one {"type": "solution", schedule, objective, elapsed}
+// line per improved solution, then {"type": "final", schedule} or {"type": "error", error}
+// (plus `report` when the input is infeasible).
+// Closing the connection stops the solve.
+function streamSchedule(req: NextRequest, data: unknown) {
+    const encoder = new TextEncoder();
+    const abort = new AbortController();
+    req.signal.addEventListener('abort', () => abort.abort());
+
+    const stream = new ReadableStream({
+        start(controller) {
+            const send = (message: object) => {
+                if (!abort.signal.aborted) controller.enqueue(encoder.encode(JSON.stringify(message) + '\n'));
+            };
+
+            runScheduler(data, {
+                signal: abort.signal,
+                onSolution: (solution) => send({ type: 'solution', ...solution }),
+                onProfile: logProfile,
+            })
+                .then((schedule) => send({ type: 'final', schedule }))
+                .catch((error: Error) => {
+                    if (error instanceof InfeasibleError) {
+                        send({ type: 'error', error: error.message, report: error.report });
+                        return;
+                    }
+                    if (!abort.signal.aborted) console.error('Scheduler API Error:', error);
+                    send({ type: 'error', error: error.message });
+                })
+                .finally(() => {
+                    if (!abort.signal.aborted) controller.close();
+                });
+        },
+        cancel() {
+            abort.abort();
+        },
+    });
+
+    return new Response(stream, { headers: { 'Content-Type': 'application/x-ndjson' } });
+}
@@ -1,6 +1,6 @@
 'use client';
 
-import { useState } from 'react';
+import { useRef, useState } from 'react';
 import Sidebar from '@/components/Sidebar';
 import { useScheduler } from '@/lib/store';
 import { generateSchedule } from '@/lib/scheduler';
@@ -14,41 +14,82 @@ export default function TimetablePage() {
     const [isGenerating, setIsGenerating] = useState(false);
     const [isEditing, setIsEditing] = useState(false);
     const [editingClass, setEditingClass] = useState<ScheduleEntry | null>(null);
+    // Intermediate timetables while a solve streams in; only the one kept is saved
+    const [preview, setPreview] = useState<ScheduleEntry[] | null>(null);
+    const abortRef = useRef<AbortController | null>(null);
 
     const handleGenerate = async () => {
         setIsGenerating(true);
+        const abort = new AbortController();
+        abortRef.current = abort;
         try {
-            let newSchedule;
+            let newSchedule: ScheduleEntry[] | null = null;
 
             // Check if running in Electron
             console.log("Using Web API for scheduling");
-            const response = await fetch('/api/schedule', {
+            const response = await fetch('/api/schedule?stream=1', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ teachers, classrooms, subjects, batches, config })
+                // An incremental re-plan starts from the stored schedule
+                body: JSON.stringify({
+                    teachers, classrooms, subjects, batches, config,
+                    ...(config.incremental ? { schedule } : {}),
+                }),
+                signal: abort.signal,
             });
 
-            if (!response.ok) {
+            if (!response.ok || !response.body) {
                 const errorData = await response.json();
                 throw new Error(errorData.error || 'Failed to generate schedule');
             }
-            newSchedule = await response.json();
 
-            setSchedule(newSchedule);
+            // Each line is an improved solution; show it as soon as it arrives
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            try {
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    let newline;
+                    while ((newline = buffer.indexOf('\n')) >= 0) {
+                        const message = JSON.parse(buffer.slice(0, newline));
+                        buffer = buffer.slice(newline + 1);
+                        if (message.type === 'error') throw new Error(message.error);
+                        newSchedule = message.schedule;
+                        setPreview(message.schedule);
+                    }
+                }
+            } catch (error: any) {
+                // Stopping early keeps the best timetable received so far
+                if (!abort.signal.aborted) throw error;
+            }
+
+            // Save once: the final timetable, or the last one shown when stopped
+            if (newSchedule) setSchedule(newSchedule);
 
-            if (Array.isArray(newSchedule) && newSchedule.length === 0) {
+            if (!abort.signal.aborted && (!newSchedule || newSchedule.length === 0)) {
                 alert('No classes could be scheduled. Check constraints.');
             }
         } catch (error: any) {
-            console.error(error);
-            alert('Error generating schedule: ' + (error.message || 'Unknown error'));
+            if (!abort.signal.aborted) {
+                console.error(error);
+                alert('Error generating schedule: ' + (error.message || 'Unknown error'));
+            }
         } finally {
+            abortRef.current = null;
+            setPreview(null);
             setIsGenerating(false);
         }
     };
 
+    const handleStop = () => {
+        abortRef.current?.abort();
+    };
+
     const handleClassClick = (entry: ScheduleEntry) => {
-        if (isEditing) {
+        if (isEditing && !preview) {
             setEditingClass(entry);
         }
     };
@@ -65,9 +106,10 @@ export default function TimetablePage() {
         setEditingClass(null);
     };
 
+    const shownSchedule = preview ?? schedule;
     const filteredSchedule = selectedBatch === 'all'
-        ? schedule
-        : schedule.filter(s => s.batchIds.includes(selectedBatch));
+        ? shownSchedule
+        : shownSchedule.filter(s => s.batchIds.includes(selectedBatch));
 
     const getCellContent = (day: string, period: number) => {
         // Find classes in this slot
@@ -98,6 +140,11 @@ export default function TimetablePage() {
                         >
                             {isGenerating ? 'Generating...' : 'Generate Optimized Schedule'}
                         </button>
+                        {isGenerating && (
+                            <button className="btn-secondary" onClick={handleStop}>
+                                Stop
+                            </button>
+                        )}
                     </div>
                 </header>
 
@@ -1,138 +1,345 @@
 import { Teacher, Classroom, Subject, Batch, ScheduleEntry, SchedulerConfig, DAYS_OF_WEEK } from './types';
-import fs from 'fs/promises';
+import { ScheduleDiff, batchKey, diffSchedules, hasChanges } from './scheduleDiff';
+import fs from 'fs';
 import path from 'path';
 
+// SQLite store shared with scripts/data_store.py; both apply scripts/schema.sql.
+// Every change rewrites only its own rows, in one transaction, instead of the
+// whole data.json. WAL mode lets the scheduler read while the app writes.
+// Without node:sqlite (Node.js < 22.13), or with SCHEDULER_STORE=json, the app keeps
+// reading and rewriting data.json. scripts/data_store.py open_store() makes the same choice.
+const DB_FILE = process.env.SCHEDULER_DB || path.join(process.cwd(), 'data.db');
+const SCHEMA_FILE = path.join(process.cwd(), 'scripts', 'schema.sql');
+// A new, empty store starts from data.json (see scripts/data_store.py import/export);
+// it is also the store itself when node:sqlite is missing
 const DATA_FILE = path.join(process.cwd(), 'data.json');
 
-// Helper to read data
-async function readData() {
+const DEFAULT_CONFIG = { daysPerWeek: DAYS_OF_WEEK.slice(0, 5), slotsPerDay: 6 };
+// Schedule journal: every JOURNAL_COMPACT_EVERY saves, drop all but the last JOURNAL_KEEP revisions
+const JOURNAL_KEEP = Number(process.env.SCHEDULER_JOURNAL_KEEP || 100);
+const JOURNAL_COMPACT_EVERY = 20;
+
+// node:sqlite ships unflagged with Node.js 22.13+ (and Electron 35+). It is loaded
+// at runtime because the @types/node in use predates it; these are the parts used here.
+type SqlValue = string | number | null;
+interface Statement {
+    run(...params: SqlValue[]): unknown;
+    all(...params: SqlValue[]): Record<string, SqlValue>[];
+    get(...params: SqlValue[]): Record<string, SqlValue> | undefined;
+}
+interface Database {
+    exec(sql: string): void;
+    prepare(sql: string): Statement;
+}
+
+type EntityKind = 'subjects' | 'teachers' | 'batches' | 'classrooms';
+
+// Entity table -> its indexed columns, each copied from the entity field of the same name
+const ENTITY_COLUMNS: Record<EntityKind, string[]> = {
+    subjects: ['name', 'code', 'type'],
+    teachers: ['name', 'department'],
+    batches: ['name', 'department'],
+    classrooms: ['name', 'type', 'capacity'],
+};
+// Membership lists mirrored into link tables: entity table -> [field, link table, owner column]
+const LINKS: Partial<Record<EntityKind, [string, string, string]>> = {
+    teachers: ['qualifiedSubjects', 'qualifications', 'teacher_id'],
+    batches: ['requiredSubjects', 'batch_subjects', 'batch_id'],
+};
+
+// Keep the connection on globalThis so Next.js dev reloads don't reopen it;
+// null means node:sqlite is unavailable and data.json is used instead.
+const globalForDb = globalThis as unknown as { schedulerDb?: Database | null };
+
+function getDb(): Database | null {
+    if (globalForDb.schedulerDb !== undefined) return globalForDb.schedulerDb;
+
+    if (process.env.SCHEDULER_STORE === 'json') {
+        globalForDb.schedulerDb = null;
+        return null;
+    }
+    let sqlite: { DatabaseSync: new (file: string) => Database } | undefined;
+    try {
+        sqlite = (process as unknown as { getBuiltinModule?: (id: string) => any }).getBuiltinModule?.('node:sqlite');
+    } catch {
+        sqlite = undefined;
+    }
+    if (!sqlite) {
+        console.warn(`node:sqlite is unavailable on Node.js ${process.versions.node}; storing data in data.json`);
+        globalForDb.schedulerDb = null;
+        return null;
+    }
+
+    const db = new sqlite.DatabaseSync(DB_FILE);
+    db.exec('PRAGMA journal_mode = WAL; PRAGMA synchronous = NORMAL; PRAGMA foreign_keys = ON; PRAGMA busy_timeout = 5000;');
+    db.exec(fs.readFileSync(SCHEMA_FILE, 'utf-8'));
+    globalForDb.schedulerDb = db;
+
+    const tables = [...Object.keys(ENTITY_COLUMNS), 'schedule_entries', 'settings'];
+    const empty = tables.every((table) => !db.prepare(`SELECT 1 FROM ${table} LIMIT 1`).get());
+    if (empty && fs.existsSync(DATA_FILE)) {
+        importData(JSON.parse(fs.readFileSync(DATA_FILE, 'utf-8')));
+    }
+    return db;
+}
+
+function transaction<T>(work: (db: Database) => T): T {
+    const db = getDb()!;
+    // IMMEDIATE takes the write lock up front, so concurrent writers queue on busy_timeout
+    db.exec('BEGIN IMMEDIATE');
     try {
-        const data = await fs.readFile(DATA_FILE, 'utf-8');
-        return JSON.parse(data);
+        const result = work(db);
+        db.exec('COMMIT');
+        return result;
     } catch (error) {
-        // If file doesn't exist, return default structure
-        return {
-            teachers: [],
-            classrooms: [],
-            subjects: [],
-            batches: [],
-            schedule: [],
-            config: { daysPerWeek: DAYS_OF_WEEK.slice(0, 5), slotsPerDay: 6 },
-        };
+        db.exec('ROLLBACK');
+        throw error;
+    }
+}
+
+function upsertRows(db: Database, kind: EntityKind, entities: any[]) {
+    const columns = ENTITY_COLUMNS[kind];
+    const updates = [...columns, 'doc'].map((column) => `${column} = excluded.${column}`).join(', ');
+    // ON CONFLICT keeps the row (and its rowid, so its place in the list)
+    const insert = db.prepare(
+        `INSERT INTO ${kind} (id, ${columns.join(', ')}, doc) VALUES (${['id', ...columns, 'doc'].map(() => '?').join(', ')}) ` +
+        `ON CONFLICT (id) DO UPDATE SET ${updates}`
+    );
+    for (const entity of entities) {
+        insert.run(entity.id, ...columns.map((column) => entity[column] ?? null), JSON.stringify(entity));
+    }
+
+    const link = LINKS[kind];
+    if (link) {
+        const [field, table, owner] = link;
+        const clear = db.prepare(`DELETE FROM ${table} WHERE ${owner} = ?`);
+        const add = db.prepare(`INSERT OR IGNORE INTO ${table} (${owner}, subject_id) VALUES (?, ?)`);
+        for (const entity of entities) {
+            clear.run(entity.id);
+            for (const subjectId of entity[field] || []) add.run(entity.id, subjectId);
+        }
+    }
+}
+
+function insertEntries(db: Database, entries: ScheduleEntry[], start: number) {
+    const insert = db.prepare(
+        'INSERT INTO schedule_entries (position, id, day, period, subject_id, teacher_id, classroom_id, doc) ' +
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+    );
+    const addBatch = db.prepare('INSERT OR IGNORE INTO schedule_batches (batch_id, position) VALUES (?, ?)');
+    entries.forEach((entry, index) => {
+        const position = start + index;
+        insert.run(position, entry.id ?? null, entry.day, entry.period, entry.subjectId ?? null,
+            entry.teacherId ?? null, entry.classroomId ?? null, JSON.stringify(entry));
+        for (const batchId of entry.batchIds || []) addBatch.run(batchId, position);
+    });
+}
+
+function scheduleRevision(db: Database): number {
+    const row = db.prepare("SELECT value FROM settings WHERE key = 'scheduleRevision'").get();
+    return row ? Number(row.value) : 0;
+}
+
+// Bring the stored schedule to `schedule`, writing only what changed and
+// appending it to schedule_journal as one revision (see DataStore.save_schedule).
+// Rewritten entries take the new ids without a revision, so the stored
+// schedule always equals `schedule`, ids included.
+function saveScheduleRows(db: Database, schedule: ScheduleEntry[]): ScheduleDiff {
+    const positions = new Map<ScheduleEntry, number>();
+    for (const row of db.prepare('SELECT position, doc FROM schedule_entries ORDER BY position').all()) {
+        positions.set(JSON.parse(row.doc as string), row.position as number);
+    }
+    const diff = diffSchedules([...positions.keys()], schedule);
+    if (!hasChanges(diff) && !diff.rewritten.length) return diff;
+
+    const remove = db.prepare('DELETE FROM schedule_entries WHERE position = ?');
+    for (const entry of diff.removed) remove.run(positions.get(entry)!);
+    // A move keeps the entry's batches, so its schedule_batches rows stay
+    const update = db.prepare(
+        'UPDATE schedule_entries SET id = ?, day = ?, period = ?, subject_id = ?, teacher_id = ?, ' +
+        'classroom_id = ?, doc = ? WHERE position = ?'
+    );
+    for (const [previous, entry] of diff.moved) {
+        update.run(entry.id ?? null, entry.day, entry.period, entry.subjectId ?? null, entry.teacherId ?? null,
+            entry.classroomId ?? null, JSON.stringify(entry), positions.get(previous)!);
+    }
+    const rewrite = db.prepare('UPDATE schedule_entries SET id = ?, doc = ? WHERE position = ?');
+    for (const [previous, entry] of diff.rewritten) {
+        rewrite.run(entry.id ?? null, JSON.stringify(entry), positions.get(previous)!);
+    }
+    const next = db.prepare('SELECT COALESCE(MAX(position), -1) + 1 AS start FROM schedule_entries').get();
+    insertEntries(db, diff.inserted, next!.start as number);
+    if (!hasChanges(diff)) return diff;
+
+    const revision = scheduleRevision(db) + 1;
+    db.prepare("INSERT OR REPLACE INTO settings (key, value) VALUES ('scheduleRevision', ?)").run(String(revision));
+    const journal = db.prepare(
+        'INSERT INTO schedule_journal (revision, op, batch_key, day, period, old_doc, new_doc) VALUES (?, ?, ?, ?, ?, ?, ?)'
+    );
+    const log = (op: string, located: ScheduleEntry, previous?: ScheduleEntry, entry?: ScheduleEntry) =>
+        journal.run(revision, op, batchKey(located), located.day, located.period,
+            previous ? JSON.stringify(previous) : null, entry ? JSON.stringify(entry) : null);
+    for (const entry of diff.inserted) log('insert', entry, undefined, entry);
+    for (const previous of diff.removed) log('remove', previous, previous, undefined);
+    for (const [previous, entry] of diff.moved) log('move', entry, previous, entry);
+    if (revision % JOURNAL_COMPACT_EVERY === 0) {
+        db.prepare('DELETE FROM schedule_journal WHERE revision <= ?').run(revision - JOURNAL_KEEP);
+    }
+    return diff;
+}
+
+function readDocs(kind: EntityKind | 'schedule_entries') {
+    const order = kind === 'schedule_entries' ? 'position' : 'rowid';
+    return getDb()!.prepare(`SELECT doc FROM ${kind} ORDER BY ${order}`).all().map((row) => JSON.parse(row.doc as string));
+}
+
+// data.json fallback: read it whole, change it, write it back
+function emptyData() {
+    return { teachers: [], classrooms: [], subjects: [], batches: [], schedule: [], config: DEFAULT_CONFIG };
+}
+
+function readJson(): any {
+    try {
+        return { ...emptyData(), ...JSON.parse(fs.readFileSync(DATA_FILE, 'utf-8')) };
+    } catch {
+        return emptyData();
+    }
+}
+
+function updateJson<T>(change: (data: any) => T): T {
+    const data = readJson();
+    const result = change(data);
+    fs.writeFileSync(DATA_FILE, JSON.stringify(data, null, 2), 'utf-8');
+    return result;
+}
+
+// Replace everything with a data.json-shaped object, in one transaction
+export function importData(data: any) {
+    if (!getDb()) {
+        updateJson((stored) => Object.assign(stored, emptyData(), data));
+        return;
+    }
+    transaction((db) => {
+        for (const kind of Object.keys(ENTITY_COLUMNS) as EntityKind[]) {
+            db.exec(`DELETE FROM ${kind}`);
+            upsertRows(db, kind, data[kind] || []);
+        }
+        db.exec('DELETE FROM settings');
+        if (data.config) db.prepare("INSERT INTO settings (key, value) VALUES ('config', ?)").run(JSON.stringify(data.config));
+        // A new schedule history starts here: the journal was about the old data
+        db.exec('DELETE FROM schedule_entries');
+        db.exec('DELETE FROM schedule_journal');
+        insertEntries(db, data.schedule || [], 0);
+    });
+}
+
+// Insert or replace entities of one kind by id, all in one transaction
+export async function upsertEntities(kind: EntityKind, entities: any[]) {
+    if (!getDb()) {
+        updateJson((data) => {
+            for (const entity of entities) {
+                const index = data[kind].findIndex((old: any) => old.id === entity.id);
+                if (index >= 0) data[kind][index] = entity;
+                else data[kind].push(entity);
+            }
+        });
+        return;
     }
+    transaction((db) => upsertRows(db, kind, entities));
 }
 
-// Helper to write data
-async function writeData(data: any) {
-    await fs.writeFile(DATA_FILE, JSON.stringify(data, null, 2), 'utf-8');
+async function removeEntity(kind: EntityKind, id: string) {
+    if (!getDb()) {
+        updateJson((data) => { data[kind] = data[kind].filter((old: any) => old.id !== id); });
+        return;
+    }
+    transaction((db) => db.prepare(`DELETE FROM ${kind} WHERE id = ?`).run(id));
 }
 
 export async function getInitialData() {
-    const data = await readData();
-    return {
-        teachers: data.teachers || [],
-        classrooms: data.classrooms || [],
-        subjects: data.subjects || [],
-        batches: data.batches || [],
-        schedule: data.schedule || [],
-        config: data.config || { daysPerWeek: DAYS_OF_WEEK.slice(0, 5), slotsPerDay: 6 },
-    };
+    const db = getDb();
+    if (!db) {
+        const { teachers, classrooms, subjects, batches, schedule, config } = readJson();
+        return { teachers, classrooms, subjects, batches, schedule, config };
+    }
+    // One read transaction, so the parts come from the same snapshot
+    db.exec('BEGIN');
+    try {
+        const config = db.prepare("SELECT value FROM settings WHERE key = 'config'").get();
+        return {
+            teachers: readDocs('teachers'),
+            classrooms: readDocs('classrooms'),
+            subjects: readDocs('subjects'),
+            batches: readDocs('batches'),
+            schedule: readDocs('schedule_entries'),
+            config: config ? JSON.parse(config.value as string) : DEFAULT_CONFIG,
+        };
+    } finally {
+        db.exec('COMMIT');
+    }
 }
 
 // --- Teachers ---
 export async function addTeacher(teacher: Teacher) {
-    const data = await readData();
-    data.teachers = data.teachers || [];
-    const index = data.teachers.findIndex((t: Teacher) => t.id === teacher.id);
-    if (index >= 0) {
-        data.teachers[index] = teacher;
-    } else {
-        data.teachers.push(teacher);
-    }
-    await writeData(data);
+    await upsertEntities('teachers', [teacher]);
 }
 export async function updateTeacher(teacher: Teacher) {
-    await addTeacher(teacher); // Same logic for JSON
+    await addTeacher(teacher);
 }
 export async function removeTeacher(id: string) {
-    const data = await readData();
-    data.teachers = (data.teachers || []).filter((t: Teacher) => t.id !== id);
-    await writeData(data);
+    await removeEntity('teachers', id);
 }
 
 // --- Classrooms ---
 export async function addClassroom(classroom: Classroom) {
-    const data = await readData();
-    data.classrooms = data.classrooms || [];
-    const index = data.classrooms.findIndex((c: Classroom) => c.id === classroom.id);
-    if (index >= 0) {
-        data.classrooms[index] = classroom;
-    } else {
-        data.classrooms.push(classroom);
-    }
-    await writeData(data);
+    await upsertEntities('classrooms', [classroom]);
 }
 export async function updateClassroom(classroom: Classroom) {
     await addClassroom(classroom);
 }
 export async function removeClassroom(id: string) {
-    const data = await readData();
-    data.classrooms = (data.classrooms || []).filter((c: Classroom) => c.id !== id);
-    await writeData(data);
+    await removeEntity('classrooms', id);
 }
 
 // --- Subjects ---
 export async function addSubject(subject: Subject) {
-    const data = await readData();
-    data.subjects = data.subjects || [];
-    const index = data.subjects.findIndex((s: Subject) => s.id === subject.id);
-    if (index >= 0) {
-        data.subjects[index] = subject;
-    } else {
-        data.subjects.push(subject);
-    }
-    await writeData(data);
+    await upsertEntities('subjects', [subject]);
 }
 export async function updateSubject(subject: Subject) {
     await addSubject(subject);
 }
 export async function removeSubject(id: string) {
-    const data = await readData();
-    data.subjects = (data.subjects || []).filter((s: Subject) => s.id !== id);
-    await writeData(data);
+    await removeEntity('subjects', id);
 }
 
 // --- Batches ---
 export async function addBatch(batch: Batch) {
-    const data = await readData();
-    data.batches = data.batches || [];
-    const index = data.batches.findIndex((b: Batch) => b.id === batch.id);
-    if (index >= 0) {
-        data.batches[index] = batch;
-    } else {
-        data.batches.push(batch);
-    }
-    await writeData(data);
+    await upsertEntities('batches', [batch]);
 }
 export async function updateBatch(batch: Batch) {
     await addBatch(batch);
 }
 export async function removeBatch(id: string) {
-    const data = await readData();
-    data.batches = (data.batches || []).filter((b: Batch) => b.id !== id);
-    await writeData(data);
+    await removeEntity('batches', id);
 }
 
 // --- Schedule ---
 export async function saveSchedule(schedule: ScheduleEntry[]) {
-    const data = await readData();
-    data.schedule = schedule;
-    await writeData(data);
+    if (!getDb()) {
+        return updateJson((data) => {
+            const diff = diffSchedules(data.schedule, schedule);
+            data.schedule = schedule;
+            return diff;
+        });
+    }
+    return transaction((db) => saveScheduleRows(db, schedule));
 }
 
 // --- Config ---
 export async function updateConfig(config: SchedulerConfig) {
-    const data = await readData();
-    data.config = config;
-    await writeData(data);
+    if (!getDb()) {
+        updateJson((data) => { data.config = config; });
+        return;
+    }
+    transaction((db) => db.prepare("INSERT OR REPLACE INTO settings (key, value) VALUES ('config', ?)").run(JSON.stringify(config)));
 }
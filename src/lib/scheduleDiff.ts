@@ -0,0 +1,77 @@
+import { ScheduleEntry } from './types';
+
+// Schedule diffs keyed by (batch, day, period); the same rules as scripts/schedule_diff.py.
+
+export interface ScheduleDiff<T extends ScheduleEntry = ScheduleEntry> {
+    inserted: T[];
+    removed: T[];
+    moved: [T, T][]; // [old entry, new entry]
+    // Unchanged entries that differ as stored (in practice the id, which a
+    // re-solve numbers afresh); saving must still give them the new ids
+    rewritten: [T, T][];
+}
+
+// Whether the timetable itself changed, not just how its entries are stored
+export function hasChanges(diff: ScheduleDiff): boolean {
+    return diff.inserted.length > 0 || diff.removed.length > 0 || diff.moved.length > 0;
+}
+
+// The entry's batches as one string, the same whatever order batchIds lists them in
+export function batchKey(entry: ScheduleEntry): string {
+    return [...(entry.batchIds || [])].sort().join(',');
+}
+
+// Where the entry sits in its batches' timetables
+export function entryKey(entry: ScheduleEntry): string {
+    return JSON.stringify([batchKey(entry), entry.day, entry.period]);
+}
+
+// Same class in the same place; ids are left out because every solve numbers its entries afresh
+function sameEntry(a: ScheduleEntry, b: ScheduleEntry): boolean {
+    return a.subjectId === b.subjectId && a.teacherId === b.teacherId && a.classroomId === b.classroomId &&
+        a.day === b.day && a.period === b.period && batchKey(a) === batchKey(b);
+}
+
+// What turns `previous` into `next`. An entry with an identical entry at its key
+// is unchanged, and rewritten if it differs from it as stored; of the rest, an
+// old and a new entry of the same batches and subject are paired as moved
+// (another slot, room or teacher), in schedule order.
+export function diffSchedules<T extends ScheduleEntry>(previous: T[], next: T[]): ScheduleDiff<T> {
+    const oldByKey = new Map<string, T[]>();
+    for (const entry of previous) {
+        const key = entryKey(entry);
+        oldByKey.set(key, [...(oldByKey.get(key) || []), entry]);
+    }
+
+    const added: T[] = [];
+    const rewritten: [T, T][] = [];
+    for (const entry of next) {
+        const candidates = oldByKey.get(entryKey(entry)) || [];
+        const stored = JSON.stringify(entry);
+        // An exact copy first, so rewrites are only made where needed
+        let match = candidates.findIndex((candidate) => JSON.stringify(candidate) === stored);
+        if (match < 0) match = candidates.findIndex((candidate) => sameEntry(candidate, entry));
+        if (match < 0) {
+            added.push(entry);
+            continue;
+        }
+        const [source] = candidates.splice(match, 1);
+        if (JSON.stringify(source) !== stored) rewritten.push([source, entry]);
+    }
+    const dropped = [...oldByKey.values()].flat();
+
+    const byClass = new Map<string, T[]>();
+    for (const entry of dropped) {
+        const key = JSON.stringify([batchKey(entry), entry.subjectId]);
+        byClass.set(key, [...(byClass.get(key) || []), entry]);
+    }
+    const inserted: T[] = [];
+    const moved: [T, T][] = [];
+    for (const entry of added) {
+        const source = byClass.get(JSON.stringify([batchKey(entry), entry.subjectId]))?.shift();
+        if (source) moved.push([source, entry]);
+        else inserted.push(entry);
+    }
+    const movedFrom = new Set(moved.map(([source]) => source));
+    return { inserted, removed: dropped.filter((entry) => !movedFrom.has(entry)), moved, rewritten };
+}
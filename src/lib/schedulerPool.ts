@@ -0,0 +1,202 @@
+import { spawn, ChildProcessWithoutNullStreams } from 'child_process';
+import path from 'path';
+import { FeasibilityReport, ScheduleEntry, SolveProfile } from './types';
+
+// Pool of long-running `scheduler.py --serve` workers.
+// Each worker keeps Python and OR-Tools loaded and answers one
+// line-delimited JSON request at a time, so a hot request only pays
+// for the solve. The pool size also bounds concurrent solves.
+
+const POOL_SIZE = Math.max(1, parseInt(process.env.SCHEDULER_POOL_SIZE || '2', 10) || 2);
+
+export interface SchedulerSolution {
+    schedule: ScheduleEntry[];
+    objective: number | null;
+    elapsed: number; // seconds since the solve started
+}
+
+// Rejection for inputs that admit no timetable
+export class InfeasibleError extends Error {
+    constructor(message: string, public report: FeasibilityReport) {
+        super(message);
+        this.name = 'InfeasibleError';
+    }
+}
+
+export interface RunOptions {
+    // Called for every intermediate solution (enables streaming)
+    onSolution?: (solution: SchedulerSolution) => void;
+    // Aborting drops a queued job or kills the worker running it
+    signal?: AbortSignal;
+    // Called with the solve's phase timings when workers profile (SCHEDULER_PROFILE=1)
+    onProfile?: (profile: SolveProfile) => void;
+}
+
+interface Job {
+    id: number;
+    payload: string;
+    onSolution?: (solution: SchedulerSolution) => void;
+    onProfile?: (profile: SolveProfile) => void;
+    resolve: (schedule: ScheduleEntry[]) => void;
+    reject: (error: Error) => void;
+}
+
+interface Worker {
+    process: ChildProcessWithoutNullStreams;
+    ready: boolean;
+    job: Job | null;
+    buffer: string;
+    stderr: string;
+}
+
+interface Pool {
+    workers: Worker[];
+    queue: Job[];
+    nextId: number;
+}
+
+// Keep the pool on globalThis so Next.js dev reloads don't leak workers.
+const globalForPool = globalThis as unknown as { schedulerPool?: Pool };
+const pool: Pool = globalForPool.schedulerPool ?? { workers: [], queue: [], nextId: 1 };
+globalForPool.schedulerPool = pool;
+
+function spawnWorker(): Worker {
+    // For local dev, we assume process.cwd() is the project root.
+    const scriptPath = path.join(process.cwd(), 'scripts', 'scheduler.py');
+    const pythonPath = process.env.PYTHON_PATH || 'python';
+    const child = spawn(pythonPath, [scriptPath, '--serve']);
+
+    const worker: Worker = { process: child, ready: false, job: null, buffer: '', stderr: '' };
+    // Replies are UTF-8 with non-ASCII kept as is; decode across chunk boundaries
+    child.stdout.setEncoding('utf8');
+
+    child.stdout.on('data', (chunk) => {
+        worker.buffer += chunk.toString();
+        let newline;
+        while ((newline = worker.buffer.indexOf('\n')) >= 0) {
+            const line = worker.buffer.slice(0, newline).trim();
+            worker.buffer = worker.buffer.slice(newline + 1);
+            if (line) handleLine(worker, line);
+        }
+    });
+
+    child.stderr.on('data', (chunk) => {
+        // Diagnostics for the current job; logged when it finishes
+        worker.stderr += chunk.toString();
+    });
+
+    const fail = (message: string) => {
+        // Several of exit, error and a stdin error can report the same death
+        if (!pool.workers.includes(worker)) return;
+        pool.workers = pool.workers.filter((w) => w !== worker);
+        if (worker.job) {
+            worker.job.reject(new Error(`${message}: ${worker.stderr}`));
+            worker.job = null;
+        }
+        if (!worker.ready) {
+            // Never came up: fail waiting requests instead of respawning forever
+            const error = new Error(`${message}: ${worker.stderr}`);
+            pool.queue.splice(0).forEach((job) => job.reject(error));
+            return;
+        }
+        dispatch();
+    };
+
+    child.on('exit', (code) => fail(`Scheduler worker exited with code ${code}`));
+    child.on('error', (err) => fail(`Failed to start scheduler worker: ${err.message}`));
+    // Writing to a worker that died (e.g. killed on abort) raises EPIPE here;
+    // unhandled, it would take the server down. Fail the job and retire the worker.
+    child.stdin.on('error', (err) => {
+        fail(`Failed to write to scheduler worker: ${err.message}`);
+        child.kill();
+    });
+
+    pool.workers.push(worker);
+    return worker;
+}
+
+function handleLine(worker: Worker, line: string) {
+    let message: any;
+    try {
+        message = JSON.parse(line);
+    } catch {
+        console.error('Invalid output from scheduler worker:', line);
+        return;
+    }
+
+    if (message.ready) {
+        worker.ready = true;
+        dispatch();
+        return;
+    }
+
+    const job = worker.job;
+    if (!job || message.id !== job.id) return;
+
+    if (message.solution) {
+        job.onSolution?.(message.solution);
+        return;
+    }
+
+    if (worker.stderr) {
+        console.log(worker.stderr.trimEnd());
+        worker.stderr = '';
+    }
+
+    worker.job = null;
+    if (message.profile) job.onProfile?.(message.profile);
+    if (message.report) {
+        job.reject(new InfeasibleError(message.error, message.report));
+    } else if (message.error) {
+        job.reject(new Error(message.error));
+    } else {
+        job.resolve(message.schedule);
+    }
+    dispatch();
+}
+
+function dispatch() {
+    while (pool.queue.length > 0) {
+        const worker = pool.workers.find((w) => w.ready && !w.job);
+        if (!worker) {
+            // Grow the pool lazily; the new worker calls dispatch() once ready
+            const starting = pool.workers.filter((w) => !w.ready).length;
+            if (pool.workers.length < POOL_SIZE && starting < pool.queue.length) spawnWorker();
+            return;
+        }
+
+        const job = pool.queue.shift()!;
+        worker.job = job;
+        worker.process.stdin.write(job.payload + '\n');
+    }
+}
+
+export function runScheduler(data: unknown, options: RunOptions = {}): Promise<ScheduleEntry[]> {
+    const { onSolution, onProfile, signal } = options;
+    return new Promise((resolve, reject) => {
+        const id = pool.nextId++;
+        const job: Job = {
+            id,
+            payload: JSON.stringify({ id, data, stream: Boolean(onSolution) }),
+            onSolution,
+            onProfile,
+            resolve,
+            reject,
+        };
+
+        signal?.addEventListener('abort', () => {
+            const queued = pool.queue.indexOf(job);
+            if (queued >= 0) {
+                pool.queue.splice(queued, 1);
+                reject(new Error('Scheduling cancelled'));
+                return;
+            }
+            // A running CP-SAT solve can't be interrupted over stdin; replace the worker
+            const worker = pool.workers.find((w) => w.job === job);
+            worker?.process.kill();
+        });
+
+        pool.queue.push(job);
+        dispatch();
+    });
+}
@@ -54,7 +54,81 @@ export interface ScheduleEntry {
   period: number;
 }
 
+export interface SolverProfile {
+  workers?: number; // parallel search workers, 0 = one per core
+  timeLimit?: number; // seconds
+  seed?: number;
+  presolve?: 0 | 1 | 2; // 0 = off, 1 = no probing, 2 = full
+  strategy?: string; // CP-SAT search branching, e.g. 'automatic', 'portfolio', 'fixed'
+  processes?: number; // solver processes when decomposing, 0 = one per core
+}
+
+// Soft-constraint weights; penalties are counted per offending class or period
+export interface PenaltyWeights {
+  consecutive?: number; // classes beyond two in a row without a break
+  teacherGaps?: number; // idle periods inside a teacher's day
+  dailyLoad?: number; // classes above an even spread of the week
+  preferredSlots?: number; // classes outside the teacher's preferredSlots
+  subjectSpread?: number; // sessions of a subject above an even spread over the days
+}
+
 export interface SchedulerConfig {
   slotsPerDay: number;
   daysPerWeek: string[];
+  breakAfter?: number;
+  engine?: 'boolean' | 'compact' | 'decomposed' | 'joint' | 'greedy';
+  warmStart?: boolean; // default true: hint the solver with the greedy timetable
+  localSearch?: number; // seconds of local search on soft penalties after the engine (0 = off; default 2 with softConstraints, else 0)
+  decompose?: boolean; // solve independent departments/cohorts separately, in parallel
+  softConstraints?: boolean; // minimize the weighted penalties in CP-SAT instead of stopping at the first timetable
+  penaltyWeights?: PenaltyWeights;
+  incremental?: boolean; // re-plan from the stored schedule
+  freezeUnchanged?: boolean; // with incremental, pin entries the change does not touch
+  symmetryBreaking?: boolean; // default true: model the sessions of a (batch, subject) as one group
+  leanModel?: boolean; // unnamed solver variables: smaller, faster-to-build models on large inputs
+  cache?: boolean; // false bypasses the scheduler's result cache
+  explainInfeasible?: boolean; // on a solver-proven infeasibility, also compute a minimal core
+  solver?: SolverProfile;
+}
+
+export interface FeasibilityIssue {
+  check: 'batch_slots' | 'teacher_load' | 'room_slots' | 'teacher_supply';
+  severity: 'error' | 'warning';
+  batch?: string;
+  teacher?: string;
+  teachers?: string[];
+  subjects?: string[];
+  rooms?: string[];
+  demand: number;
+  capacity: number;
+  message: string;
+}
+
+// Why no timetable exists (returned with HTTP 422)
+export interface FeasibilityReport {
+  feasible: boolean;
+  stage: 'precheck' | 'solver';
+  summary: string;
+  issues: FeasibilityIssue[];
+  elapsed: number; // seconds
+  core?: { kind: 'sessions' | 'batch' | 'teacher' | 'rooms'; [id: string]: unknown }[];
+}
+
+// Per-phase timing trailer of a profiled solve (SCHEDULER_PROFILE=1)
+export interface SolveProfile {
+  total_s: number;
+  peak_mb: number; // tracemalloc peak, Python allocations only
+  max_rss_mb?: number;
+  phases: Record<string, { seconds: number; peak_mb: number; calls: number }>;
+  solver: {
+    status: string;
+    wall_s: number;
+    user_s: number;
+    conflicts: number;
+    branches: number;
+    objective: number;
+    bound: number;
+    response_stats: string;
+  }[];
+  cprofile?: string; // path of the cProfile dump
 }